@@ -18,6 +18,8 @@
 
     # always loaded
     'data': [
+        'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
         'views/views.xml',
         'views/templates.xml',
     ],
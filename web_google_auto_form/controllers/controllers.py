@@ -1,24 +1,170 @@
 # -*- coding: utf-8 -*-
 # License AGPL-3
+import logging
+
 from odoo import http
 from odoo.http import request
+from odoo.tools import config
 from odoo.tools.safe_eval import safe_eval
 
+from odoo.addons.web_google_auto_form.models import google_places
+
+_logger = logging.getLogger(__name__)
+
+# Name of the value read from each type of Google address component
+COMPONENT_FORM = {
+    'street_number': 'long_name',
+    'route': 'long_name',
+    'intersection': 'short_name',
+    'political': 'short_name',
+    'country': 'short_name',
+    'administrative_area_level_1': 'long_name',
+    'administrative_area_level_2': 'short_name',
+    'administrative_area_level_3': 'short_name',
+    'administrative_area_level_4': 'short_name',
+    'administrative_area_level_5': 'short_name',
+    'colloquial_area': 'short_name',
+    'locality': 'short_name',
+    'ward': 'short_name',
+    'sublocality_level_1': 'short_name',
+    'sublocality_level_2': 'short_name',
+    'sublocality_level_3': 'short_name',
+    'sublocality_level_5': 'short_name',
+    'neighborhood': 'short_name',
+    'premise': 'short_name',
+    'postal_code': 'short_name',
+    'natural_feature': 'short_name',
+    'airport': 'short_name',
+    'park': 'short_name',
+    'point_of_interest': 'long_name',
+}
+
+# Length limits of the inputs forwarded to Google Places Autocomplete
+MIN_INPUT_LENGTH = 3
+MAX_INPUT_LENGTH = 200
+
+# Separator of the components of a field, when it is not a space
+FIELD_DELIMITER = {
+    'street2': ', ',
+}
+
 
 class WebsiteGoogleAddressForm(http.Controller):
 
     @http.route('/my/account/get_country', type='json', auth='public')
     def get_country(self, country):
-        country_id = request.env['res.country'].sudo().search([
-            '|', ('code', '=', country), ('name', '=', country)])
-        return country_id and country_id.id or False
+        return request.env['res.country'].sudo()._find_address_country(country)
 
     @http.route('/my/account/get_country_state', type='json', auth='public')
     def get_country_state(self, country, state):
-        country_id = request.env['res.country'].sudo().search([
-            '|', ('code', '=', country), ('name', '=', country)])
-        state_id = request.env['res.country.state'].sudo().search([
-            '&', '|', ('code', '=', state), ('name', '=', state),
-            ('country_id', '=', country_id.id)])
-        return state_id and state_id.id or False
+        return request.env['res.country'].sudo()._find_address_state(country, state)
+
+    @http.route('/my/account/resolve_address', type='json', auth='public')
+    def resolve_address(self, address_components, fields):
+        """ Turn the address components of a Google place into the values of
+            the address form, in one call.
+
+            :param address_components: the address_components of the place
+            :param fields: {field name: [component types]}, the components
+                           giving the value of each field of the form
+            :return: {field name: value}, country_id and state_id being ids
+        """
+        values = self._parse_address_components(address_components, fields)
+        Country = request.env['res.country'].sudo()
+        if 'state_id' in values:
+            state_id = Country._find_address_state(values.get('country_id', ''), values['state_id'])
+            values['state_id'] = state_id and str(state_id) or ''
+        if 'country_id' in values:
+            country_id = Country._find_address_country(values['country_id'])
+            values['country_id'] = country_id and str(country_id) or ''
+        return values
+
+    def _get_places_cache(self):
+        """ Return the cache of the Places proxy, or None when it is disabled """
+        ICP = request.env['ir.config_parameter'].sudo()
+        if not ICP.get_param('web_google_auto_form.places_proxy') or \
+                not ICP.get_param('web_google_auto_form.api_key_geocode'):
+            return None
+        return request.env['google.place.cache'].sudo()
+
+    def _check_places_rate(self):
+        """ Return whether the client may still call the Places proxy, the
+            routes being public. The limit is per client address and per
+            minute, 0 disables it. Each worker process counts the calls it
+            serves, so a client spreading its calls over N workers may send N
+            times the limit.
+        """
+        limit = int(request.env['ir.config_parameter'].sudo().get_param(
+            'web_google_auto_form.places_rate_limit', google_places.DEFAULT_RATE_LIMIT))
+        if limit <= 0:
+            return True
+        client = self._get_places_client()
+        if google_places.rate_limiter.allow((request.db, client), limit):
+            return True
+        _logger.info("Google Places proxy rate limit reached by %s", client)
+        return False
+
+    def _get_places_client(self):
+        """ Return the address of the client. Behind a reverse proxy, Odoo must
+            run with proxy_mode: the address is then the one the proxy forwards,
+            see werkzeug's ProxyFix. Otherwise it is the address of the proxy,
+            shared by every client.
+        """
+        httprequest = request.httprequest
+        if not config['proxy_mode'] and httprequest.headers.get('X-Forwarded-For'):
+            google_places.warn_once('proxy_mode', "Google Places proxy called through a reverse proxy without "
+                                    "proxy_mode: its rate limit is shared by all the clients")
+        return httprequest.remote_addr
+
+    def _get_places_language(self):
+        return (request.env.context.get('lang') or 'en_US').split('_')[0]
+
+    @http.route('/my/account/google/autocomplete', type='json', auth='public')
+    def google_autocomplete(self, input, countries=(), sessiontoken=None):
+        """ Forward a Places Autocomplete query to Google, see google.place.cache.
+
+            :return: a list of {'description', 'place_id'}
+        """
+        cache = self._get_places_cache()
+        input = (input or '').strip()[:MAX_INPUT_LENGTH]
+        if cache is None or len(input) < MIN_INPUT_LENGTH or not self._check_places_rate():
+            return []
+        try:
+            return cache._autocomplete(input, countries=list(countries or [])[:5], sessiontoken=sessiontoken,
+                                       language=self._get_places_language())
+        except Exception as e:
+            _logger.warning("Google Places autocomplete failed: %s", e)
+            return []
+
+    @http.route('/my/account/google/place', type='json', auth='public')
+    def google_place(self, place_id, sessiontoken=None):
+        """ Forward a Place Details query to Google, see google.place.cache.
+
+            :return: {'name', 'address_components'}, or False
+        """
+        cache = self._get_places_cache()
+        if cache is None or not place_id or not self._check_places_rate():
+            return False
+        try:
+            return cache._place_details(place_id, sessiontoken=sessiontoken, language=self._get_places_language())
+        except Exception as e:
+            _logger.warning("Google Place details failed: %s", e)
+            return False
+
+    def _parse_address_components(self, address_components, fields):
+        found = {}
+        for component in address_components:
+            for component_type in component.get('types', []):
+                if component_type in COMPONENT_FORM:
+                    found[component_type] = component.get(COMPONENT_FORM[component_type]) or False
 
+        values = {}
+        for field, component_types in fields.items():
+            if isinstance(component_types, str):
+                component_types = [component_types]
+            parts = [found[component_type] for component_type in component_types if found.get(component_type)]
+            if field == 'city':
+                values[field] = parts and parts[0] or ''
+            else:
+                values[field] = FIELD_DELIMITER.get(field, ' ').join(parts)
+        return values
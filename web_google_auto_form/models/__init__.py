@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from . import models
\ No newline at end of file
+from . import models
+from . import res_country
+from . import google_place_cache
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import time
+
+from psycopg2.extensions import TransactionRollbackError
+
+from odoo import api, fields, models
+from odoo.tools.lru import LRU
+
+from . import google_places
+
+# In-process tier of the cache, as {key: (expiry, value)}
+_place_cache = LRU(4096)
+
+# Default number of seconds a Google answer is reused
+DEFAULT_TTL = 30 * 24 * 3600
+
+
+class GooglePlaceCache(models.Model):
+    """ Answers of the Google Places web services, normalized and shared by
+        all the workers. Each worker also keeps the most used ones in memory.
+    """
+    _name = 'google.place.cache'
+    _description = 'Google Places Cache'
+    _log_access = False
+
+    key = fields.Char(required=True, index=True, readonly=True)
+    value = fields.Text(readonly=True)
+    date = fields.Datetime(required=True, readonly=True, default=fields.Datetime.now)
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(key)', 'A Google query can only be cached once.'),
+    ]
+
+    @api.model
+    def _get_ttl(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'web_google_auto_form.places_cache_ttl', DEFAULT_TTL))
+
+    @api.model
+    def _get_endpoint(self):
+        return self.env['ir.config_parameter'].sudo().get_param(
+            'web_google_auto_form.places_endpoint', google_places.DEFAULT_ENDPOINT)
+
+    @api.model
+    def _cached_query(self, query, func):
+        """ Return the cached value of the query, calling func to get it from
+            Google when it is neither in memory nor in the database. Identical
+            queries running at the same time in this process only call Google
+            once.
+        """
+        key = hashlib.sha1(json.dumps([self.env.cr.dbname] + query).encode()).hexdigest()
+        ttl = self._get_ttl()
+        cached = _place_cache.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+        self.env.cr.execute("""
+            SELECT value
+              FROM google_place_cache
+             WHERE key = %s
+               AND date > (now() at time zone 'UTC') - %s * interval '1 second'
+        """, (key, ttl))
+        row = self.env.cr.fetchone()
+        if row:
+            value = json.loads(row[0])
+        else:
+            value, leader = google_places.coalesce(key, func)
+            if leader:
+                # written in its own transaction: the visitors typing the same address would otherwise
+                # conflict with each other, and the other workers see it at once
+                with self.pool.cursor() as cr:
+                    try:
+                        self.with_env(self.env(cr=cr))._set_value(key, value)
+                    except TransactionRollbackError:
+                        # another worker cached the same query since this transaction started
+                        cr.rollback()
+        _place_cache[key] = (time.time() + ttl, value)
+        return value
+
+    @api.model
+    def _set_value(self, key, value):
+        # upsert, other workers may cache the same query concurrently
+        self.env.cr.execute("""
+            INSERT INTO google_place_cache (key, value, date)
+                 VALUES (%s, %s, now() at time zone 'UTC')
+            ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value,
+                        date = EXCLUDED.date
+        """, (key, json.dumps(value)), log_exceptions=False)
+
+    @api.model
+    def _autocomplete(self, input, countries=(), sessiontoken=None, language=None):
+        """ Return the predictions of Google Places Autocomplete for the input,
+            as a list of {'description', 'place_id'}.
+        """
+        api_key = self.env['ir.config_parameter'].sudo().get_param('web_google_auto_form.api_key_geocode')
+        params = {'input': input, 'types': 'geocode', 'key': api_key}
+        if countries:
+            params['components'] = '|'.join('country:%s' % country.lower() for country in countries)
+        if sessiontoken:
+            params['sessiontoken'] = sessiontoken
+        if language:
+            params['language'] = language
+        query = ['autocomplete', google_places.normalize_input(input), sorted(countries), language]
+        endpoint = self._get_endpoint()
+        return self._cached_query(query, lambda: google_places.normalize_predictions(
+            google_places.fetch(endpoint, 'autocomplete', params)))
+
+    @api.model
+    def _place_details(self, place_id, sessiontoken=None, language=None):
+        """ Return the name and the address components of a place """
+        api_key = self.env['ir.config_parameter'].sudo().get_param('web_google_auto_form.api_key_geocode')
+        params = {'place_id': place_id, 'fields': 'address_component,name', 'key': api_key}
+        if sessiontoken:
+            params['sessiontoken'] = sessiontoken
+        if language:
+            params['language'] = language
+        query = ['details', place_id, language]
+        endpoint = self._get_endpoint()
+        return self._cached_query(query, lambda: google_places.normalize_place(
+            google_places.fetch(endpoint, 'details', params)))
+
+    @api.model
+    def _gc_expired_entries(self):
+        """ Called by cron, drops the answers older than the cache duration. """
+        self.env.cr.execute("""
+            DELETE FROM google_place_cache
+                  WHERE date < (now() at time zone 'UTC') - %s * interval '1 second'
+        """, (self._get_ttl(),))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT = 'https://maps.googleapis.com/maps/api/place/'
+# (connect, read) timeouts of the calls to Google, in seconds
+TIMEOUT = (3, 10)
+# Default number of proxy calls allowed to a client per minute
+DEFAULT_RATE_LIMIT = 30
+
+_sessions = {}
+_warned = set()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class GooglePlacesError(Exception):
+    pass
+
+
+def warn_once(key, message):
+    """ Log a warning the first time it is given in this process """
+    if key not in _warned:
+        _warned.add(key)
+        _logger.warning(message)
+
+
+def normalize_input(value):
+    """ Key under which an autocomplete input is cached: case and extra spaces are ignored. """
+    return re.sub(r'\s+', ' ', value or '').strip().casefold()
+
+
+def _get_session():
+    # one keep-alive connection pool per process, forked workers get their own
+    session = _sessions.get(os.getpid())
+    if session is None:
+        session = _sessions[os.getpid()] = requests.Session()
+    return session
+
+
+def fetch(endpoint, path, params):
+    """ Call a Places web service and return its decoded answer. Only answers
+        that can be cached are returned, any other status is raised.
+    """
+    response = _get_session().get('%s%s/json' % (endpoint, path), params=params, timeout=TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('status') not in ('OK', 'ZERO_RESULTS'):
+        raise GooglePlacesError('%s: %s' % (data.get('status'), data.get('error_message', '')))
+    return data
+
+
+def normalize_predictions(data):
+    """ Keep only what the address form uses from an autocomplete answer """
+    return [{'description': prediction.get('description', ''), 'place_id': prediction['place_id']}
+            for prediction in data.get('predictions', []) if prediction.get('place_id')]
+
+
+def normalize_place(data):
+    """ Keep only what the address form uses from a place details answer """
+    result = data.get('result', {})
+    return {
+        'name': result.get('name', ''),
+        'address_components': [{
+            'long_name': component.get('long_name', ''),
+            'short_name': component.get('short_name', ''),
+            'types': component.get('types', []),
+        } for component in result.get('address_components', [])],
+    }
+
+
+def coalesce(key, func):
+    """ Call func, unless a call with the same key is already running in this
+        process, in which case its result is awaited instead.
+
+        :return: a tuple (result, leader), leader being False when the result
+                 comes from the call of another thread
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result(timeout=sum(TIMEOUT)), False
+    try:
+        result = func()
+        future.set_result(result)
+        return result, True
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+class RateLimiter():
+    """ Allow at most a number of calls per key and per window of ``period``
+        seconds. The counts only cover the current window, so the memory used
+        is bounded by the number of clients of a single window.
+    """
+
+    def __init__(self, period=60, clock=time.monotonic):
+        self.period = period
+        self.clock = clock
+        self._window = None
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key, limit):
+        """ Count a call of key and return whether it is within the limit """
+        window = int(self.clock() // self.period)
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._counts = {}
+            count = self._counts[key] = self._counts.get(key, 0) + 1
+        return count <= limit
+
+
+# Calls of the Places proxy routes served by this process, per database and client address
+rate_limiter = RateLimiter()
@@ -8,3 +8,17 @@ class ResConfigSettings(models.TransientModel):
     google_maps_view_api_key = fields.Char(
         string='Google Maps View Api Key',
         config_parameter='web_google_auto_form.api_key_geocode')
+    google_places_proxy = fields.Boolean(
+        string='Proxy Google Places Requests',
+        config_parameter='web_google_auto_form.places_proxy',
+        help="Send the address autocomplete requests through the server, which caches Google's answers "
+             "and keeps the api key private.")
+    google_places_cache_ttl = fields.Integer(
+        string='Google Places Cache Duration',
+        config_parameter='web_google_auto_form.places_cache_ttl', default=30 * 24 * 3600,
+        help="Number of seconds an answer of Google is reused.")
+    google_places_rate_limit = fields.Integer(
+        string='Google Places Requests per Minute',
+        config_parameter='web_google_auto_form.places_rate_limit', default=30,
+        help="Number of proxied requests a visitor can send per minute to each worker process, 0 for no "
+             "limit. Behind a reverse proxy, the server must run with proxy_mode to tell the visitors apart.")
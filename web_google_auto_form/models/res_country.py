@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import re
+import unicodedata
+
+from odoo import api, models, tools
+
+
+def normalize(value):
+    """ Key under which a country or state code or name is indexed: case,
+        accents and extra spaces are ignored.
+    """
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', value).strip().casefold()
+
+
+class ResCountry(models.Model):
+    _inherit = 'res.country'
+
+    @api.model
+    @tools.ormcache()
+    def _get_address_index(self):
+        """ Return the indexes used to resolve the addresses given by Google:
+            ({country key: country id}, {(country id, state key): state id}),
+            keys being the normalized codes, names and name translations.
+
+            The indexes are kept in the registry cache, which is cleared when a
+            country, a state or a translation changes.
+        """
+        cr = self.env.cr
+        countries = {}
+        cr.execute("SELECT id, code, name FROM res_country ORDER BY id")
+        rows = cr.fetchall()
+        # codes first, a code always wins over a name
+        for country_id, code, name in rows:
+            countries.setdefault(normalize(code), country_id)
+        for country_id, code, name in rows:
+            countries.setdefault(normalize(name), country_id)
+
+        states = {}
+        cr.execute("SELECT id, country_id, code, name FROM res_country_state ORDER BY id")
+        state_rows = cr.fetchall()
+        for state_id, country_id, code, name in state_rows:
+            states.setdefault((country_id, normalize(code)), state_id)
+        for state_id, country_id, code, name in state_rows:
+            states.setdefault((country_id, normalize(name)), state_id)
+
+        state_countries = {state_id: country_id for state_id, country_id, code, name in state_rows}
+        cr.execute("""
+            SELECT name, res_id, value
+              FROM ir_translation
+             WHERE type = 'model'
+               AND name IN ('res.country,name', 'res.country.state,name')
+               AND value != ''
+          ORDER BY res_id
+        """)
+        for name, res_id, value in cr.fetchall():
+            if name == 'res.country,name':
+                countries.setdefault(normalize(value), res_id)
+            elif res_id in state_countries:
+                states.setdefault((state_countries[res_id], normalize(value)), res_id)
+
+        countries.pop('', None)
+        return countries, states
+
+    @api.model
+    def _find_address_country(self, country):
+        """ Return the id of the country with the given code or name, or False """
+        return self._get_address_index()[0].get(normalize(country), False)
+
+    @api.model
+    def _find_address_state(self, country, state):
+        """ Return the id of the state with the given code or name in the
+            country with the given code or name, or False
+        """
+        country_id = self._find_address_country(country)
+        key = normalize(state)
+        return bool(country_id and key) and self._get_address_index()[1].get((country_id, key), False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super(ResCountry, self).create(vals_list)
+
+    def write(self, vals):
+        if 'code' in vals or 'name' in vals:
+            self.clear_caches()
+        return super(ResCountry, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(ResCountry, self).unlink()
+
+
+class ResCountryState(models.Model):
+    _inherit = 'res.country.state'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super(ResCountryState, self).create(vals_list)
+
+    def write(self, vals):
+        if {'code', 'name', 'country_id'} & set(vals):
+            self.clear_caches()
+        return super(ResCountryState, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(ResCountryState, self).unlink()
@@ -3,42 +3,102 @@ odoo.define('web_google_auto_form.address_form_autocomplete', function (require)
 
     var ajax = require('web.ajax');
     var Class = require('web.Class');
-    var rpc = require("web.rpc");
 
-    var componentForm = {
-        street_number: 'long_name',
-        route: 'long_name',
-        intersection: 'short_name',
-        political: 'short_name',
-        country: 'short_name',
-        administrative_area_level_1: 'long_name',
-        administrative_area_level_2: 'short_name',
-        administrative_area_level_3: 'short_name',
-        administrative_area_level_4: 'short_name',
-        administrative_area_level_5: 'short_name',
-        colloquial_area: 'short_name',
-        locality: 'short_name',
-        ward: 'short_name',
-        sublocality_level_1: 'short_name',
-        sublocality_level_2: 'short_name',
-        sublocality_level_3: 'short_name',
-        sublocality_level_5: 'short_name',
-        neighborhood: 'short_name',
-        premise: 'short_name',
-        postal_code: 'short_name',
-        natural_feature: 'short_name',
-        airport: 'short_name',
-        park: 'short_name',
-        point_of_interest: 'long_name'
-    };
+    /**
+     * Stand-in for google.maps.places.Autocomplete querying Google through
+     * the server, which caches its answers (see google.place.cache).
+     */
+    var ProxyAutocomplete = Class.extend({
+        init: function (input, options) {
+            var self = this;
+            this.$input = $(input);
+            this.restrictions = {};
+            this.listeners = [];
+            this.place = null;
+            this.newSession();
+            this.$menu = $('<div class="dropdown-menu o_google_places_proxy"/>').insertAfter(this.$input);
+            this.$input.on('input.google_places_proxy', _.debounce(this._onInput.bind(this), 250));
+            this.$input.on('blur.google_places_proxy', function () {
+                self.$menu.removeClass('show');
+            });
+            // mousedown comes before the blur of the input
+            this.$menu.on('mousedown', '.dropdown-item', this._onSelect.bind(this));
+        },
+        destroy: function () {
+            this.$input.off('.google_places_proxy');
+            this.$menu.remove();
+        },
+        newSession: function () {
+            // the queries of a session, up to the place details, are billed once
+            this.sessiontoken = Date.now().toString(36) + Math.random().toString(36).slice(2);
+        },
+        setBounds: function () {},
+        setComponentRestrictions: function (restrictions) {
+            this.restrictions = restrictions || {};
+        },
+        addListener: function (event, callback) {
+            if (event === 'place_changed') {
+                this.listeners.push(callback);
+            }
+        },
+        getPlace: function () {
+            return this.place;
+        },
+        _onInput: function () {
+            var self = this;
+            var input = this.$input.val();
+            ajax.jsonRpc('/my/account/google/autocomplete', 'call', {
+                'input': input,
+                'countries': _.flatten([this.restrictions.country || []]),
+                'sessiontoken': this.sessiontoken
+            }).then(function (predictions) {
+                // ignore the answers to outdated inputs
+                if (self.$input.val() !== input) {
+                    return;
+                }
+                self.$menu.empty();
+                _.each(predictions, function (prediction) {
+                    $('<a href="#" class="dropdown-item"/>')
+                        .text(prediction.description)
+                        .data('place_id', prediction.place_id)
+                        .appendTo(self.$menu);
+                });
+                var position = self.$input.position();
+                self.$menu.css({
+                    top: position.top + self.$input.outerHeight(),
+                    left: position.left
+                });
+                self.$menu.toggleClass('show', predictions.length > 0);
+            });
+        },
+        _onSelect: function (ev) {
+            var self = this;
+            ev.preventDefault();
+            var $item = $(ev.currentTarget);
+            this.$menu.removeClass('show');
+            this.$input.val($item.text());
+            ajax.jsonRpc('/my/account/google/place', 'call', {
+                'place_id': $item.data('place_id'),
+                'sessiontoken': this.sessiontoken
+            }).then(function (place) {
+                self.newSession();
+                if (place) {
+                    self.place = place;
+                    _.each(self.listeners, function (callback) {
+                        callback();
+                    });
+                }
+            });
+        }
+    });
 
     var AddressForm = Class.extend({
         init: function ($target, fill_fields) {
             this.$target = $target;
             this.place_autocomplete = false;
             this.fillFields = fill_fields || {};
-            this.componentForm = componentForm;
             this.country_restrictions = [];
+            this.useProxy = $('meta[name="google-places-proxy"]').length > 0;
             this.onLoad();
         },
         onLoad: function () {
@@ -48,23 +108,16 @@ odoo.define('web_google_auto_form.address_form_autocomplete', function (require)
             self.geolocate();
             var country = $('#country_id')[0];
             country.onchange = function () {
-                var country_id = $('#country_id').find(':selected').val();
-                if (country_id) {
-                    rpc.query({
-                        model: "res.country",
-                        method: 'read',
-                        args: [parseInt(country_id), ['code']],
-                        context: {}
-                    }).then(function (result) {
-                        self.initAutocomplete([result[0]['code']]);
-                    });
-
+                var country_code = $('#country_id').find(':selected').data('code');
+                if (country_code) {
+                    self.initAutocomplete([country_code]);
                 }
             };
         },
         geolocate: function () {
             var self = this;
-            if (navigator.geolocation) {
+            // the server proxy does not bias the results on the location
+            if (navigator.geolocation && !this.useProxy) {
                 navigator.geolocation.getCurrentPosition(function (position) {
                     var geolocation = {
                         lat: position.coords.latitude,
@@ -81,7 +134,11 @@ odoo.define('web_google_auto_form.address_form_autocomplete', function (require)
         initAutocomplete: function (country_restrictions) {
             // Create the autocomplete object, restricting the search to geographical
             // location types.
-            this.place_autocomplete = new google.maps.places.Autocomplete(this.$target[0], {
+            if (this.place_autocomplete && this.place_autocomplete.destroy) {
+                this.place_autocomplete.destroy();
+            }
+            var Autocomplete = this.useProxy ? ProxyAutocomplete : google.maps.places.Autocomplete;
+            this.place_autocomplete = new Autocomplete(this.$target[0], {
                 types: ['geocode'],
                 fields: ['address_components', 'name', 'geometry'],
             });
@@ -102,28 +159,28 @@ odoo.define('web_google_auto_form.address_form_autocomplete', function (require)
             var place = this.place_autocomplete.getPlace();
 
             if (place && place.hasOwnProperty('address_components')) {
-                var address = self.populateAddress(place);
-                var requests = [];
-
-                _.each(self.fillFields, function (value, key) {
-                    requests.push(self.prepareValue(key, address));
+                var fields = {};
+                _.each(self.fillFields, function (options, field) {
+                    fields[field] = _.flatten([options.components]);
                 });
-
-                $.when.apply($, requests).done(function () {
-                    $.each(arguments, function (_, values) {
-                        $.each(values, function (key, value) {
-                            if (key === 'country_id') {
-                                $(self.fillFields[key].selector).val(value).change();
-                            } else if (key === 'state_id') {
-                                // delay 1000ms
-                                // waiting the states loaded completely before set a value to state_id
-                                setTimeout(function () {
-                                    $(self.fillFields[key].selector).val(value);
-                                }, 1000);
-                            } else {
-                                $(self.fillFields[key].selector).val(value);
+                // the values of all the fields, country and state included, in one call
+                ajax.jsonRpc('/my/account/resolve_address', 'call', {
+                    'address_components': _.map(place.address_components, function (component) {
+                        return _.pick(component, 'long_name', 'short_name', 'types');
+                    }),
+                    'fields': fields
+                }).then(function (values) {
+                    _.each(values, function (value, key) {
+                        var $field = $(self.fillFields[key].selector);
+                        if (key === 'country_id') {
+                            if ($field.val() !== value) {
+                                $field.val(value).change();
                             }
-                        });
+                        } else if (key === 'state_id') {
+                            self.setState($field, value);
+                        } else {
+                            $field.val(value);
+                        }
                     });
                 });
                 setTimeout(function () {
@@ -131,76 +188,33 @@ odoo.define('web_google_auto_form.address_form_autocomplete', function (require)
                 }, 300);
             }
         },
-        prepareValue: function (input, value) {
-            var def = $.Deferred();
-            var res = {};
-            if (['country_id', 'state_id'].indexOf(input) !== -1) {
-                if (input === 'country_id') {
-                    ajax.jsonRpc('/my/account/get_country', 'call', {
-                        'country': value[input]
-                    }).then(function (country_id) {
-                        res[input] = country_id ? country_id.toString() : '';
-                        def.resolve(res);
-                    });
-                }
-                if (input === 'state_id') {
-                    ajax.jsonRpc('/my/account/get_country_state', 'call', {
-                        'state': value[input],
-                        'country': value['country_id']
-                    }).then(function (state_id) {
-                        res[input] = state_id ? state_id.toString() : '';
-                        def.resolve(res);
-                    });
-                }
-            } else {
-                res[input] = value[input];
-                def.resolve(res);
+        setState: function ($select, value) {
+            // the states of a new country are loaded asynchronously,
+            // set the value as soon as its option is there
+            var hasOption = function () {
+                return !value || $select.find('option[value="' + value + '"]').length;
+            };
+            if (hasOption()) {
+                $select.val(value);
+                return;
             }
-            return def;
-        },
-        populateAddress: function (place) {
-            var self = this,
-                input2fill = {},
-                result = {},
-                fields_delimiter = {
-                    street: ' ',
-                    street2: ', '
-                }, temp, options, dlmter;
-
-            _.each(this.fillFields, function (value, key) {
-                input2fill[key] = [];
-            });
-
-            _.each(this.fillFields, function (options, field) {
-                // turn all fields options into an Array
-                options = _.flatten([options.components]);
-                temp = {};
-                _.each(place.address_components, function (component) {
-                    _.each(_.intersection(options, component.types), function (match) {
-                        temp[match] = component[self.componentForm[match]] || false;
-                    });
-                });
-                input2fill[field] = _.map(options, function (item) {
-                    return temp[item];
-                });
-            });
-
-            _.each(input2fill, function (value, key) {
-                dlmter = fields_delimiter[key] || ' ';
-                if (key == 'city') {
-                    result[key] = _.first(_.filter(value)) || '';
-                } else {
-                    result[key] = _.filter(value).join(dlmter);
+            var observer = new MutationObserver(function () {
+                if (hasOption()) {
+                    observer.disconnect();
+                    $select.val(value);
                 }
             });
-
-            return result;
+            observer.observe($select[0], {childList: true});
+            // give up if the state never shows up, e.g. countries without states
+            setTimeout(function () {
+                observer.disconnect();
+            }, 10000);
         }
     });
 
     return {
         'AddressForm': AddressForm,
-        'componentForm': componentForm
+        'ProxyAutocomplete': ProxyAutocomplete
     };
 });
 
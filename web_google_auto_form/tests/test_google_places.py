@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.web_google_auto_form.models import google_place_cache, google_places
+
+
+class PlacesHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((url.path, params))
+        time.sleep(self.server.latency)
+        if params.get('key') != 'key':
+            data = {'status': 'REQUEST_DENIED', 'error_message': 'The provided API key is invalid.'}
+        elif url.path == '/autocomplete/json':
+            data = {'status': 'OK', 'predictions': [
+                {'description': '%s Street, Brussels' % params['input'], 'place_id': 'place-1', 'types': []},
+            ]}
+        else:
+            data = {'status': 'OK', 'result': {'name': 'Place', 'address_components': [
+                {'long_name': 'Belgium', 'short_name': 'BE', 'types': ['country', 'political']},
+            ]}}
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGooglePlaces(TransactionCase):
+    """ Calls of the Places proxy, against a local stand-in of Google """
+
+    def setUp(self):
+        super(TestGooglePlaces, self).setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PlacesHandler)
+        self.server.requests = []
+        self.server.latency = 0
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.endpoint = 'http://127.0.0.1:%s/' % self.server.server_address[1]
+
+    def test_fetch(self):
+        data = google_places.fetch(self.endpoint, 'autocomplete', {'input': 'rue', 'key': 'key'})
+        self.assertEqual(google_places.normalize_predictions(data),
+                         [{'description': 'rue Street, Brussels', 'place_id': 'place-1'}])
+        with self.assertRaises(google_places.GooglePlacesError):
+            google_places.fetch(self.endpoint, 'autocomplete', {'input': 'rue', 'key': 'wrong'})
+
+    def test_coalesce(self):
+        self.server.latency = 0.2
+        params = {'place_id': 'place-1', 'key': 'key'}
+
+        def details():
+            return google_places.coalesce('details-place-1', lambda: google_places.normalize_place(
+                google_places.fetch(self.endpoint, 'details', params)))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda __: details(), range(4)))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(sum(leader for __, leader in results), 1)
+        self.assertTrue(all(result == results[0][0] for result, __ in results))
+
+    def test_rate_limiter(self):
+        now = [0.0]
+        limiter = google_places.RateLimiter(period=60, clock=lambda: now[0])
+        self.assertEqual([limiter.allow('a', 2) for __ in range(3)], [True, True, False])
+        self.assertTrue(limiter.allow('b', 2))
+        now[0] = 61.0
+        self.assertTrue(limiter.allow('a', 2))
+
+    def test_cached_autocomplete(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('web_google_auto_form.api_key_geocode', 'key')
+        ICP.set_param('web_google_auto_form.places_endpoint', self.endpoint)
+        cache = self.env['google.place.cache']
+        google_place_cache._place_cache.clear()
+        for input in ('Rue  Neuve', 'rue neuve'):
+            predictions = cache._autocomplete(input, countries=['BE'], language='fr')
+            self.assertEqual(predictions[0]['place_id'], 'place-1')
+        # the second input only differs by its case and spaces
+        self.assertEqual(len(self.server.requests), 1)
+        path, params = self.server.requests[0]
+        self.assertEqual(path, '/autocomplete/json')
+        self.assertEqual(params['components'], 'country:be')
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+""" Benchmark of the UPS requests against a local mock UPS server.
+
+    Not loaded with the module. From the command line, with the module in the
+    odoo.addons namespace::
+
+        python3 -m odoo.addons.website_delivery_ups.benchmark --operation rate --operation ship \\
+            --count 500 --concurrency 8 --latency 0.1 --fault-rate 0.02 --json report.json
+
+    and, to catch regressions, ``--baseline report.json``. From ``odoo-bin shell``,
+    ``run_carrier(env, carrier, orders)`` rates real orders with ups_rate_shipment.
+"""
+from .mock_server import MockUPSServer
+from .runner import check_serialization, compare, main, run, run_carrier
+from .scenarios import generate_scenarios
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import itertools
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+COMMON_NS = 'http://www.ups.com/XMLSchema/XOLTWS/Common/v1.0'
+ERROR_NS = 'http://www.ups.com/XMLSchema/XOLTWS/Error/v1.1'
+NAMESPACES = {
+    'RateRequest': ('rate', 'http://www.ups.com/XMLSchema/XOLTWS/Rate/v1.1', 'RateResponse'),
+    'ShipmentRequest': ('ship', 'http://www.ups.com/XMLSchema/XOLTWS/Ship/v1.0', 'ShipmentResponse'),
+    'VoidShipmentRequest': ('void', 'http://www.ups.com/XMLSchema/XOLTWS/Void/v1.1', 'VoidShipmentResponse'),
+    'TimeInTransitRequest': ('tnt', 'http://www.ups.com/XMLSchema/XOLTWS/tnt/v1.0', 'TimeInTransitResponse'),
+}
+# Operation name of each request, as used by the options of MockUPSServer
+OPERATIONS = {
+    'RateRequest': 'Rate',
+    'ShipmentRequest': 'Ship',
+    'VoidShipmentRequest': 'Void',
+    'TimeInTransitRequest': 'TimeInTransit',
+}
+# Services answered to the 'Shop' rate requests, with their price per kg
+SHOP_SERVICES = {'03': 1.1, '12': 1.6, '02': 2.2, '13': 3.5, '01': 4.0, '14': 5.2, '11': 1.4, '07': 6.5}
+TNT_SERVICES = (('GND', 5), ('3DS', 3), ('2DA', 2), ('1DA', 1), ('1DM', 1))
+# 1x1 GIF, returned as the label of every package
+LABEL_IMAGE = 'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+
+
+def _local(element):
+    return etree.QName(element).localname
+
+
+def _find_all(element, name):
+    return [child for child in element.iter() if isinstance(child.tag, str) and _local(child) == name]
+
+
+def _find_text(element, *path):
+    for name in path:
+        found = _find_all(element, name)
+        if not found:
+            return None
+        element = found[0]
+    return element.text
+
+
+class MockUPSServer():
+    """ Local stand-in of the UPS SOAP web services, answering the Rate, Ship,
+        Void and TimeInTransit requests of UPSRequest with valid responses.
+
+        :param latency: seconds waited before answering, either a number or
+                        a dict {operation: seconds}
+        :param jitter: random seconds added to the latency, up to this value
+        :param fault_rate: share (0-1) of the requests answered by a SOAP fault
+        :param fault_code: UPS error code of the injected faults; 250052 and
+                           190001 are the codes UPS asks to retry later
+        :param drop_rate: share (0-1) of the requests whose connection is
+                          closed without answer
+        :param seed: seed of the random generator, for reproducible runs
+        :param record: keep the body of every request in ``requests``
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, fault_rate=0.0, fault_code='250052', drop_rate=0.0, seed=None,
+                 record=False, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fault_rate = fault_rate
+        self.fault_code = fault_code
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.counts = {}
+        self.faults = 0
+        self.drops = 0
+        self.record = record
+        self.requests = []
+        self._lock = threading.Lock()
+        self._tracking = itertools.count(1)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%s/webservices/' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ups_mock_server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, body = server.answer(data)
+                if body is None:
+                    self.close_connection = True
+                    return
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _get_latency(self, operation):
+        latency = self.latency.get(operation, 0.0) if isinstance(self.latency, dict) else self.latency
+        with self._lock:
+            return latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def answer(self, data):
+        """ Return the (HTTP status, body) answering a SOAP request, the body
+            being None when the connection must be dropped.
+        """
+        envelope = etree.fromstring(data)
+        body = envelope.find('{%s}Body' % SOAP_ENV)
+        request = next(child for child in body if isinstance(child.tag, str))
+        root = _local(request)
+        operation = OPERATIONS.get(root, root)
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+            if self.record:
+                self.requests.append(data)
+            draw = self.random.random()
+        time.sleep(self._get_latency(operation))
+
+        if draw < self.drop_rate:
+            with self._lock:
+                self.drops += 1
+            return 200, None
+        if draw < self.drop_rate + self.fault_rate:
+            with self._lock:
+                self.faults += 1
+            return 500, self._fault(self.fault_code, 'Injected fault')
+        if root not in NAMESPACES:
+            return 500, self._fault('10001', 'Unknown request %s' % root)
+        return 200, getattr(self, '_answer_%s' % operation.lower())(request)
+
+    def _envelope(self, root, content):
+        prefix, namespace, response = NAMESPACES[root]
+        return ('<?xml version="1.0" encoding="utf-8"?>'
+                '<soapenv:Envelope xmlns:soapenv="%s"><soapenv:Body>'
+                '<%s:%s xmlns:%s="%s" xmlns:common="%s">'
+                '<common:Response><common:ResponseStatus><common:Code>1</common:Code>'
+                '<common:Description>Success</common:Description></common:ResponseStatus></common:Response>'
+                '%s</%s:%s></soapenv:Body></soapenv:Envelope>' % (
+                    SOAP_ENV, prefix, response, prefix, namespace, COMMON_NS, content, prefix, response)
+                ).encode()
+
+    def _fault(self, code, description):
+        return ('<?xml version="1.0" encoding="utf-8"?>'
+                '<soapenv:Envelope xmlns:soapenv="%s"><soapenv:Body><soapenv:Fault>'
+                '<faultcode>Client</faultcode>'
+                '<faultstring>An exception has been raised as a result of client data.</faultstring>'
+                '<detail><err:Errors xmlns:err="%s"><err:ErrorDetail><err:Severity>Hard</err:Severity>'
+                '<err:PrimaryErrorCode><err:Code>%s</err:Code><err:Description>%s</err:Description>'
+                '</err:PrimaryErrorCode></err:ErrorDetail></err:Errors></detail>'
+                '</soapenv:Fault></soapenv:Body></soapenv:Envelope>' % (SOAP_ENV, ERROR_NS, code, description)
+                ).encode()
+
+    def _weight(self, request):
+        weights = [float(_find_text(package, 'PackageWeight', 'Weight') or 0)
+                   for package in _find_all(request, 'Package')]
+        return sum(weights), len(weights)
+
+    def _charges(self, tag, price):
+        return ('<%(tag)s:TransportationCharges><%(tag)s:CurrencyCode>USD</%(tag)s:CurrencyCode>'
+                '<%(tag)s:MonetaryValue>%(price).2f</%(tag)s:MonetaryValue></%(tag)s:TransportationCharges>'
+                '<%(tag)s:ServiceOptionsCharges><%(tag)s:CurrencyCode>USD</%(tag)s:CurrencyCode>'
+                '<%(tag)s:MonetaryValue>0.00</%(tag)s:MonetaryValue></%(tag)s:ServiceOptionsCharges>'
+                '<%(tag)s:TotalCharges><%(tag)s:CurrencyCode>USD</%(tag)s:CurrencyCode>'
+                '<%(tag)s:MonetaryValue>%(price).2f</%(tag)s:MonetaryValue></%(tag)s:TotalCharges>'
+                % {'tag': tag, 'price': price})
+
+    def _answer_rate(self, request):
+        weight, count = self._weight(request)
+        if _find_text(request, 'Request', 'RequestOption') == 'Shop':
+            services = SHOP_SERVICES
+        else:
+            code = _find_text(request, 'Shipment', 'Service', 'Code') or '03'
+            services = {code: SHOP_SERVICES.get(code, 2.0)}
+        rated = ''.join(
+            '<rate:RatedShipment><rate:Service><rate:Code>%s</rate:Code></rate:Service>'
+            '<rate:BillingWeight><rate:UnitOfMeasurement><rate:Code>KGS</rate:Code></rate:UnitOfMeasurement>'
+            '<rate:Weight>%.1f</rate:Weight></rate:BillingWeight>%s</rate:RatedShipment>'
+            % (code, weight, self._charges('rate', 5.0 * count + factor * weight))
+            for code, factor in services.items())
+        return self._envelope('RateRequest', rated)
+
+    def _answer_ship(self, request):
+        weight, count = self._weight(request)
+        with self._lock:
+            numbers = ['1ZBENCH%011d' % next(self._tracking) for __ in range(max(count, 1))]
+        packages = ''.join(
+            '<ship:PackageResults><ship:TrackingNumber>%s</ship:TrackingNumber><ship:ShippingLabel>'
+            '<ship:ImageFormat><ship:Code>GIF</ship:Code></ship:ImageFormat>'
+            '<ship:GraphicImage>%s</ship:GraphicImage></ship:ShippingLabel></ship:PackageResults>'
+            % (number, LABEL_IMAGE) for number in numbers)
+        return self._envelope('ShipmentRequest', (
+            '<ship:ShipmentResults><ship:ShipmentCharges>%s</ship:ShipmentCharges>'
+            '<ship:BillingWeight><ship:UnitOfMeasurement><ship:Code>KGS</ship:Code></ship:UnitOfMeasurement>'
+            '<ship:Weight>%.1f</ship:Weight></ship:BillingWeight>'
+            '<ship:ShipmentIdentificationNumber>%s</ship:ShipmentIdentificationNumber>%s'
+            '</ship:ShipmentResults>' % (self._charges('ship', 5.0 * count + 2.0 * weight), weight, numbers[0],
+                                         packages)))
+
+    def _answer_void(self, request):
+        return self._envelope('VoidShipmentRequest', (
+            '<void:SummaryResult><void:Status><void:Code>1</void:Code>'
+            '<void:Description>Voided</void:Description></void:Status></void:SummaryResult>'))
+
+    def _answer_timeintransit(self, request):
+        pickup = _find_text(request, 'Pickup', 'Date') or time.strftime('%Y%m%d')
+        start = time.mktime(time.strptime(pickup, '%Y%m%d'))
+        summaries = ''.join(
+            '<tnt:ServiceSummary><tnt:Service><tnt:Code>%s</tnt:Code></tnt:Service><tnt:EstimatedArrival>'
+            '<tnt:Arrival><tnt:Date>%s</tnt:Date></tnt:Arrival>'
+            '<tnt:BusinessDaysInTransit>%s</tnt:BusinessDaysInTransit>'
+            '<tnt:Pickup><tnt:Date>%s</tnt:Date></tnt:Pickup></tnt:EstimatedArrival></tnt:ServiceSummary>'
+            % (code, time.strftime('%Y%m%d', time.localtime(start + days * 86400)), days, pickup)
+            for code, days in TNT_SERVICES)
+        return self._envelope('TimeInTransitRequest', (
+            '<tnt:TransitResponse><tnt:ShipFrom>%s</tnt:ShipFrom><tnt:ShipTo>%s</tnt:ShipTo>'
+            '<tnt:PickupDate>%s</tnt:PickupDate>%s</tnt:TransitResponse>' % (
+                self._tnt_address(request, 'ShipFrom'), self._tnt_address(request, 'ShipTo'), pickup, summaries)))
+
+    def _tnt_address(self, request, name):
+        country = _find_text(request, name, 'CountryCode') or 'US'
+        return ('<tnt:Address><tnt:City>%s</tnt:City><tnt:CountryCode>%s</tnt:CountryCode>'
+                '<tnt:Country>%s</tnt:Country></tnt:Address>' % (
+                    _find_text(request, name, 'City') or '', country, country))
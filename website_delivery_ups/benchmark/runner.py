@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from ..models import ups_request, ups_wsdl
+from ..models.ups_request import UPSRequest
+from .mock_server import MockUPSServer
+from .scenarios import generate_scenarios
+
+# (wsdl attribute of UPSRequest, api, root element) of each UPS web service
+WSDLS = {
+    'Rate': ('rate_wsdl', 'Rate', 'RateRequest'),
+    'Ship': ('ship_wsdl', 'Ship', 'ShipmentRequest'),
+    'TimeInTransit': ('tnt_wsdl', 'TimeInTransit', 'TimeInTransitRequest'),
+    'Void': ('void_wsdl', 'Void', 'VoidShipmentRequest'),
+}
+# Keys of the report compared to a baseline, and whether a higher value is better
+COMPARED_KEYS = {'quotes_per_second': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False,
+                 'allocated_kb_per_call': False}
+
+
+def _arguments(scenario):
+    return {key: value for key, value in scenario.items() if key not in ('lines', 'international')}
+
+
+def _call_rate(srm, scenario):
+    return srm.get_shipping_price(**_arguments(scenario))
+
+
+def _call_shop(srm, scenario):
+    arguments = _arguments(scenario)
+    del arguments['service_type']
+    return srm.get_shipping_prices(**arguments)
+
+
+def _call_ship(srm, scenario):
+    return srm.send_shipping(duty_payment='SENDER', **_arguments(scenario))
+
+
+def _call_void(srm, scenario):
+    return srm.cancel_shipment('1ZBENCH%011d' % scenario['lines'])
+
+
+def _call_tnt(srm, scenario):
+    weight = sum(package.weight * package.count for package in scenario['packages'])
+    count = sum(package.count for package in scenario['packages'])
+    return srm.prepare_time_in_transit(scenario['ship_from'], scenario['ship_to'], datetime.date.today(), weight,
+                                       'KGS', package_count=count, invoice_total=scenario['lines'] * 10,
+                                       currency_code='USD')()
+
+
+OPERATIONS = {
+    'rate': _call_rate,
+    'shop': _call_shop,
+    'ship': _call_ship,
+    'void': _call_void,
+    'tnt': _call_tnt,
+}
+
+
+def percentile(values, q):
+    """ Nearest-rank q-th percentile (0-100) of the sorted values """
+    if not values:
+        return 0.0
+    return values[max(0, int(math.ceil(q / 100.0 * len(values))) - 1)]
+
+
+def summarize(durations, errors, wall_time):
+    durations = sorted(durations)
+    return {
+        'calls': len(durations),
+        'errors': errors,
+        'quotes_per_second': len(durations) / wall_time if wall_time else 0.0,
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p95_ms': percentile(durations, 95) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+        'max_ms': (durations[-1] if durations else 0.0) * 1000,
+    }
+
+
+def measure_wsdl(repeat=3, warm_calls=100):
+    """ Return the cost of the bundled WSDL documents, per web service: the
+        time to parse them, the one to load them from the on-disk cache (see
+        ups_wsdl.load_document), and the one to set up a client once they are
+        loaded, as done by UPSRequest._set_client for each call.
+    """
+    srm = UPSRequest(None, 'user', 'password', 'shipper', 'access', False)
+    result = {}
+    for name, (attribute, api, root) in WSDLS.items():
+        path = os.path.join(os.path.dirname(os.path.realpath(ups_request.__file__)), getattr(srm, attribute))
+        start = time.perf_counter()
+        for __ in range(repeat):
+            ups_wsdl._parse_document(path)
+        parse = (time.perf_counter() - start) / repeat
+        ups_wsdl.load_document(path)
+        start = time.perf_counter()
+        for __ in range(repeat):
+            ups_wsdl.load_document(path)
+        load = (time.perf_counter() - start) / repeat
+        srm._set_client(getattr(srm, attribute), api, root)
+        start = time.perf_counter()
+        for __ in range(warm_calls):
+            srm._set_client(getattr(srm, attribute), api, root)
+        client = (time.perf_counter() - start) / warm_calls
+        result[name] = {'parse_ms': parse * 1000, 'load_ms': load * 1000, 'client_ms': client * 1000}
+    return result
+
+
+def run_operation(call, scenarios, make_request, concurrency=8, warmup=10):
+    """ Send one request per scenario with ``concurrency`` threads, each with
+        its own UPSRequest like ProviderUPS does, and return their statistics.
+    """
+    for scenario in scenarios[:warmup]:
+        call(make_request(), scenario)
+
+    def timed(scenario):
+        start = time.perf_counter()
+        result = call(make_request(), scenario)
+        return time.perf_counter() - start, isinstance(result, dict) and bool(result.get('error_message'))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, scenarios))
+    wall_time = time.perf_counter() - start
+    return summarize([duration for duration, __ in results], sum(error for __, error in results), wall_time)
+
+
+def measure_allocations(call, scenarios, make_request):
+    """ Return the memory allocated and still held after sending the requests
+        one by one, and the peak of traced memory, in kB.
+    """
+    call(make_request(), scenarios[0])
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for scenario in scenarios:
+            call(make_request(), scenario)
+        __, peak = tracemalloc.get_traced_memory()
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    return {
+        'allocated_kb_per_call': allocated / 1024.0 / len(scenarios),
+        'peak_kb': peak / 1024.0,
+    }
+
+
+def check_serialization(scenarios):
+    """ Send the Rate and Ship requests of the scenarios with and without
+        fast_serialization, and return the ones whose bodies differ, as a
+        list of (operation, scenario index).
+    """
+    differences = []
+    with MockUPSServer(record=True) as server:
+        for index, scenario in enumerate(scenarios):
+            for operation in ('rate', 'ship'):
+                bodies = []
+                for fast in (False, True):
+                    srm = UPSRequest(None, 'user', 'password', 'shipper', 'access', False, endpoint=server.url,
+                                     fast_serialization=fast)
+                    del server.requests[:]
+                    OPERATIONS[operation](srm, scenario)
+                    bodies.append(server.requests[-1])
+                if bodies[0] != bodies[1]:
+                    differences.append((operation, index))
+    return differences
+
+
+def run(operations=('rate',), count=200, concurrency=8, latency=0.05, jitter=0.0, fault_rate=0.0,
+        fault_code='250052', drop_rate=0.0, seed=1, international_ratio=0.3, max_lines=20, max_packages=10,
+        max_retries=2, alloc_samples=50, wsdl_repeat=3, fast_serialization=False):
+    """ Run the benchmark against a local mock UPS server and return its report """
+    scenarios = generate_scenarios(count, seed=seed, international_ratio=international_ratio,
+                                   max_lines=max_lines, max_packages=max_packages)
+    report = {
+        'parameters': {
+            'operations': list(operations), 'count': count, 'concurrency': concurrency, 'latency': latency,
+            'jitter': jitter, 'fault_rate': fault_rate, 'fault_code': fault_code, 'drop_rate': drop_rate,
+            'seed': seed, 'international_ratio': international_ratio, 'max_lines': max_lines,
+            'max_packages': max_packages, 'max_retries': max_retries, 'fast_serialization': fast_serialization,
+        },
+        'wsdl': measure_wsdl(repeat=wsdl_repeat),
+        'operations': {},
+    }
+    with MockUPSServer(latency=latency, jitter=jitter, fault_rate=fault_rate, fault_code=fault_code,
+                       drop_rate=drop_rate, seed=seed) as server:
+        def make_request():
+            return UPSRequest(None, 'user', 'password', 'shipper', 'access', False, max_retries=max_retries,
+                              pool_size=concurrency, endpoint=server.url, fast_serialization=fast_serialization)
+
+        for operation in operations:
+            call = OPERATIONS[operation]
+            stats = run_operation(call, scenarios, make_request, concurrency=concurrency)
+            if alloc_samples:
+                # without latency nor faults, only the work done by the module is measured
+                latency, fault_rate, drop_rate = server.latency, server.fault_rate, server.drop_rate
+                server.latency = server.fault_rate = server.drop_rate = 0.0
+                try:
+                    stats.update(measure_allocations(call, scenarios[:alloc_samples], make_request))
+                finally:
+                    server.latency, server.fault_rate, server.drop_rate = latency, fault_rate, drop_rate
+            report['operations'][operation] = stats
+        report['server'] = {'requests': dict(server.counts), 'faults': server.faults, 'drops': server.drops}
+    return report
+
+
+def run_carrier(env, carrier, orders, latency=0.05, jitter=0.0, fault_rate=0.0, fault_code='250052',
+                drop_rate=0.0, seed=1, use_cache=False, multi=False):
+    """ Benchmark ProviderUPS.ups_rate_shipment on real orders, from an odoo
+        shell, with the carriers sending their requests to a mock server.
+        Nothing is kept: the changes are rolled back at the end.
+
+        :param carrier: UPS carriers, rated together with rate_shipment_multi
+                        when ``multi`` is set
+        :param use_cache: keep the rate quote cache, disabled by default so
+                          that every quote reaches the server
+    """
+    durations = []
+    errors = 0
+    with MockUPSServer(latency=latency, jitter=jitter, fault_rate=fault_rate, fault_code=fault_code,
+                       drop_rate=drop_rate, seed=seed) as server:
+        env.cr.execute('SAVEPOINT ups_benchmark')
+        try:
+            env['ir.config_parameter'].sudo().set_param('website_delivery_ups.endpoint', server.url)
+            if not use_cache:
+                carrier.write({'ups_rate_cache_ttl': 0})
+            start = time.perf_counter()
+            for order in orders:
+                call_start = time.perf_counter()
+                if multi:
+                    results = list(carrier.rate_shipment_multi(order).values())
+                else:
+                    results = [record.rate_shipment(order) for record in carrier]
+                durations.append(time.perf_counter() - call_start)
+                errors += sum(not result['success'] for result in results)
+            wall_time = time.perf_counter() - start
+        finally:
+            env.cr.execute('ROLLBACK TO SAVEPOINT ups_benchmark')
+            env.clear()
+            # the endpoint set above may still be in the cache of the parameters
+            env['ir.config_parameter'].clear_caches()
+        report = summarize(durations, errors, wall_time)
+        report['server'] = {'requests': dict(server.counts), 'faults': server.faults, 'drops': server.drops}
+    return report
+
+
+def compare(report, baseline, tolerance=20.0):
+    """ Return the regressions of the report against a baseline report, as
+        strings, a value being worse than the baseline by more than
+        ``tolerance`` percent.
+    """
+    regressions = []
+    for operation, stats in report['operations'].items():
+        reference = baseline.get('operations', {}).get(operation)
+        if not reference:
+            continue
+        for key, higher_is_better in COMPARED_KEYS.items():
+            if key not in stats or not reference.get(key):
+                continue
+            change = (stats[key] - reference[key]) / reference[key] * 100.0
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append('%s %s: %.2f instead of %.2f (%+.0f%%)' % (
+                    operation, key, stats[key], reference[key], change))
+    return regressions
+
+
+def format_report(report):
+    lines = ['WSDL            parse (ms)   load (ms)   client (ms)']
+    for name, stats in report['wsdl'].items():
+        lines.append('%-15s %10.1f %11.1f %13.3f' % (name, stats['parse_ms'], stats.get('load_ms', 0.0),
+                                                     stats['client_ms']))
+    lines.append('')
+    lines.append('operation  calls errors  quotes/s   p50 (ms)   p95 (ms)   p99 (ms)   kB/call   peak kB')
+    for operation, stats in report['operations'].items():
+        lines.append('%-9s %6d %6d %9.1f %10.1f %10.1f %10.1f %9.1f %9.1f' % (
+            operation, stats['calls'], stats['errors'], stats['quotes_per_second'], stats['p50_ms'],
+            stats['p95_ms'], stats['p99_ms'], stats.get('allocated_kb_per_call', 0.0), stats.get('peak_kb', 0.0)))
+    lines.append('')
+    lines.append('server: %(requests)s, %(faults)s faults, %(drops)s dropped' % report['server'])
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the UPS requests of website_delivery_ups against a local mock server.")
+    parser.add_argument('--operation', action='append', choices=sorted(OPERATIONS),
+                        help="operation to benchmark, can be repeated (default: rate)")
+    parser.add_argument('--count', type=int, default=200, help="number of calls per operation")
+    parser.add_argument('--concurrency', type=int, default=8, help="number of calls sent at the same time")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the server waits before answering")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random seconds added to the latency")
+    parser.add_argument('--fault-rate', type=float, default=0.0, help="share of the calls answered by a fault")
+    parser.add_argument('--fault-code', default='250052', help="UPS error code of the faults")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of the connections dropped")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--international-ratio', type=float, default=0.3)
+    parser.add_argument('--max-lines', type=int, default=20, help="maximum number of lines of a cart")
+    parser.add_argument('--max-packages', type=int, default=10, help="maximum number of packages of a shipment")
+    parser.add_argument('--max-retries', type=int, default=2)
+    parser.add_argument('--alloc-samples', type=int, default=50,
+                        help="number of calls traced to measure the allocations, 0 to skip")
+    parser.add_argument('--wsdl-repeat', type=int, default=3, help="number of times each WSDL is parsed")
+    parser.add_argument('--fast-serialization', action='store_true',
+                        help="render the packages with lxml templates instead of zeep")
+    parser.add_argument('--check-serialization', action='store_true',
+                        help="only check that both package serializations send the same bytes")
+    parser.add_argument('--json', help="write the report to this file")
+    parser.add_argument('--baseline', help="report to compare with, the exit status is 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=20.0, help="allowed regression, in percent")
+    options = parser.parse_args(args)
+
+    if options.check_serialization:
+        scenarios = generate_scenarios(options.count, seed=options.seed, max_lines=options.max_lines,
+                                       international_ratio=options.international_ratio,
+                                       max_packages=options.max_packages, cod_ratio=0.3)
+        differences = check_serialization(scenarios)
+        for operation, index in differences:
+            print('DIFFERENT %s request of scenario %s' % (operation, index))
+        print('%s scenarios checked, %s differences' % (len(scenarios), len(differences)))
+        return 1 if differences else 0
+
+    report = run(operations=options.operation or ['rate'], count=options.count, concurrency=options.concurrency,
+                 latency=options.latency, jitter=options.jitter, fault_rate=options.fault_rate,
+                 fault_code=options.fault_code, drop_rate=options.drop_rate, seed=options.seed,
+                 international_ratio=options.international_ratio, max_lines=options.max_lines,
+                 max_packages=options.max_packages, max_retries=options.max_retries,
+                 alloc_samples=options.alloc_samples, wsdl_repeat=options.wsdl_repeat,
+                 fast_serialization=options.fast_serialization)
+    print(format_report(report))
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(report, json.load(f), options.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
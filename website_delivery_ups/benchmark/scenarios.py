@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import random
+from collections import namedtuple
+
+from ..models.ups_request import Package
+
+Country = namedtuple('Country', 'code')
+State = namedtuple('State', 'code')
+Commercial = namedtuple('Commercial', 'is_company')
+Parent = namedtuple('Parent', 'name')
+Partner = namedtuple('Partner', 'name street street2 city zip phone mobile country_id state_id commercial_partner_id '
+                                'parent_id')
+Packaging = namedtuple('Packaging', 'length width height shipper_package_code')
+Carrier = namedtuple('Carrier', 'ups_package_weight_unit ups_package_dimension_unit ups_default_packaging_id')
+
+# (country, state, city, zip) of the generated addresses
+DOMESTIC_ADDRESSES = [
+    ('US', 'NY', 'New York', '10001'),
+    ('US', 'CA', 'San Francisco', '94105'),
+    ('US', 'TX', 'Austin', '78701'),
+    ('US', 'IL', 'Chicago', '60601'),
+    ('US', 'WA', 'Seattle', '98101'),
+    ('US', 'FL', 'Miami', '33101'),
+    ('US', 'GA', 'Atlanta', '30301'),
+    ('US', 'CO', 'Denver', '80201'),
+]
+INTERNATIONAL_ADDRESSES = [
+    ('CA', 'ON', 'Toronto', 'M5H 2N2'),
+    ('BE', False, 'Brussels', '1000'),
+    ('DE', False, 'Berlin', '10115'),
+    ('FR', False, 'Paris', '75001'),
+    ('GB', False, 'London', 'EC1A 1BB'),
+    ('IE', 'D', 'Dublin', 'D02 X285'),
+    ('JP', False, 'Tokyo', '100-0001'),
+    ('MX', False, 'Mexico City', '06000'),
+]
+WAREHOUSE_ADDRESS = ('US', 'NJ', 'Newark', '07102')
+SERVICE_TYPES = ['03', '02', '01', '12', '13', '14']
+
+
+def make_partner(address, name='Benchmark', company=True):
+    country, state, city, zip_code = address
+    return Partner(name, '1 Main Street', '', city, zip_code, '+1 555 0100', False, Country(country),
+                   State(state or False), Commercial(company), Parent(False))
+
+
+def make_carrier(weight_unit='KGS', dimension_unit='CM'):
+    """ Stand-in of the UPS delivery.carrier fields read by Package """
+    return Carrier(weight_unit, dimension_unit, Packaging(30, 20, 15, '02'))
+
+
+def generate_scenarios(count, seed=None, international_ratio=0.3, max_lines=20, max_packages=10, cod_ratio=0.0,
+                       carrier=None):
+    """ Generate ``count`` shipments to rate or ship, as dicts of the keyword
+        arguments of UPSRequest.get_shipping_price, plus 'lines' (number of
+        lines of the cart) and 'international'.
+
+        Carts have between 1 and ``max_lines`` lines of random weights, put in
+        up to ``max_packages`` packages; ``international_ratio`` of them go
+        abroad. The same seed always gives the same scenarios.
+    """
+    rng = random.Random(seed)
+    carrier = carrier or make_carrier()
+    shipper = make_partner(WAREHOUSE_ADDRESS, 'Benchmark Company')
+    scenarios = []
+    for __ in range(count):
+        international = rng.random() < international_ratio
+        address = rng.choice(INTERNATIONAL_ADDRESSES if international else DOMESTIC_ADDRESSES)
+        lines = rng.randint(1, max_lines)
+        weight = sum(rng.uniform(0.1, 5.0) * rng.randint(1, 3) for __ in range(lines))
+        package_count = min(max_packages, max(1, int(weight // 20) + 1), lines)
+        # a few distinct packages, the rest as identical ones, like _ups_plan_packages
+        packages = [Package(carrier, weight / package_count, weight_factor=1.0)
+                    for __ in range(min(package_count, 3))]
+        packages[-1].count = package_count - len(packages) + 1
+        cod = rng.random() < cod_ratio
+        scenarios.append({
+            # the keys of _ups_prepare_shipping, the rate requests only read total_qty
+            'shipment_info': {
+                'description': 'BENCH/%05d' % len(scenarios),
+                'total_qty': lines,
+                'ilt_monetary_value': '%d' % (weight * 10),
+                'itl_currency_code': 'USD',
+                'phone': '+1 555 0199',
+            },
+            'packages': packages,
+            'shipper': shipper,
+            'ship_from': shipper,
+            'ship_to': make_partner(address, company=rng.random() < 0.5),
+            'packaging_type': '02',
+            'service_type': rng.choice(SERVICE_TYPES),
+            'saturday_delivery': False,
+            'cod_info': cod and {'currency': 'USD', 'monetary_value': round(weight * 10, 2), 'funds_code': '0'},
+            'lines': lines,
+            'international': international,
+        })
+    return scenarios
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import hmac
+import json
+
+from odoo import http
+from odoo.http import request
+
+
+class UPSMetricsController(http.Controller):
+
+    @http.route('/website_delivery_ups/metrics', type='http', auth='public', methods=['GET'], csrf=False)
+    def metrics(self, minutes=60, token=None, **kwargs):
+        """ Summary of the UPS call metrics of the last minutes, as JSON. Open
+            to the administrators, or to monitoring tools sending the token
+            set in the website_delivery_ups.metrics_token parameter.
+        """
+        expected = request.env['ir.config_parameter'].sudo().get_param('website_delivery_ups.metrics_token')
+        token = token or request.httprequest.headers.get('X-Metrics-Token')
+        allowed = request.env.user.has_group('base.group_system') or \
+            bool(expected and token and hmac.compare_digest(expected, token))
+        if not allowed:
+            return request.make_response(json.dumps({'error': 'forbidden'}), status=403,
+                                         headers=[('Content-Type', 'application/json')])
+        try:
+            minutes = max(1, min(int(minutes), 60 * 24 * 30))
+        except ValueError:
+            minutes = 60
+        summary = request.env['ups.metric'].sudo()._get_summary(minutes)
+        return request.make_response(json.dumps({'minutes': minutes, 'metrics': summary}),
+                                     headers=[('Content-Type', 'application/json')])
@@ -4,3 +4,9 @@
 from . import delivery_ups
 from . import product_packaging
 from . import sale
+from . import stock_picking
+from . import ups_metric
+from . import ups_rate_cache
+from . import ups_rate_drift
+from . import ups_rate_table
+from . import ups_transit_cache
@@ -1,10 +1,58 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
-from odoo import api, models, fields, _
+import functools
+import hashlib
+import io
+import itertools
+import json
+import logging
+import threading
+import time
+from array import array
+from concurrent.futures import TimeoutError
+
+import psycopg2
+from psycopg2.extensions import TransactionRollbackError
+
+import odoo
+from odoo import api, models, fields, SUPERUSER_ID, _
 from odoo.exceptions import UserError
-from odoo.tools import pdf
+from odoo.tools import ormcache
+
+from .ups_cache import LRUCache, SingleFlight
+from .ups_executor import get_executor, get_rate_limiter, get_scheduler
+from .ups_label import convert_labels, write_labels
+from .ups_metrics_recorder import measure
+from .ups_package_planner import plan_packages
+from .ups_request import UPSRequest, Package, RETRY_BACKOFF, TNT_SERVICE_TYPE
+
+_logger = logging.getLogger(__name__)
+
+# In-process tier of the rate quote cache, backed by the ups.rate.cache model
+_rate_quote_cache = LRUCache(max_size=2048)
+# In-process tier of the transit time cache, backed by the ups.transit.cache model
+_transit_time_cache = LRUCache(max_size=2048, ttl=3600)
+# Rate requests being sent by this process, shared with the identical ones, see _ups_fetch_rate
+_rate_flights = SingleFlight()
+# Fingerprints of the stale quotes being fetched again in the background
+_refreshing_rates = set()
+_refreshing_rates_lock = threading.Lock()
 
-from .ups_request import UPSRequest, Package
+# Maximum number of rate requests sent concurrently by a worker
+RATE_WORKERS = 8
+# Maximum number of rate requests sent concurrently by a worker re-rating orders
+RERATE_WORKERS = 4
+# Default number of seconds to wait for a carrier quote in rate_shipment_multi
+RATE_TIMEOUT = 10
+# Class of the advisory locks taken on rate fingerprints, 'UPSR'
+RATE_LOCK_CLASS = 0x55505352
+# Maximum number of void requests sent concurrently by a worker, and per second
+VOID_WORKERS = 4
+VOID_RATE = 5
+# Length of the package dimension units, in meters
+DIMENSION_TO_METER = {'IN': 0.0254, 'CM': 0.01}
+# Fields of the carriers deciding whether the quotations are rated in the background
+UPS_PREFETCH_FIELDS = {'delivery_type', 'ups_prefetch_rates', 'active'}
 
 
 class ProviderUPS(models.Model):
@@ -34,6 +82,11 @@ class ProviderUPS(models.Model):
     ups_shipper_number = fields.Char(string='UPS Shipper Number', groups="base.group_system")
     ups_access_number = fields.Char(string='UPS AccessLicenseNumber', groups="base.group_system")
     ups_default_packaging_id = fields.Many2one('product.packaging', string='UPS Default Packaging Type')
+    ups_packaging_ids = fields.Many2many('product.packaging', 'delivery_carrier_ups_packaging_rel',
+                                         'carrier_id', 'packaging_id', string='UPS Packagings',
+                                         domain=[('package_carrier_type', '=', 'ups')],
+                                         help="Other packagings in which the products can be shipped. The ones "
+                                              "giving the fewest packages are used to rate and ship the orders.")
     ups_default_service_type = fields.Selection(_get_ups_service_types, string="UPS Service Type", default='03')
     ups_duty_payment = fields.Selection([('SENDER', 'Sender'), ('RECIPIENT', 'Recipient')], required=True,
                                         default="RECIPIENT")
@@ -56,6 +109,50 @@ class ProviderUPS(models.Model):
         ('0', "Check, Cashier's Check or MoneyOrder"),
         ('8', "Cashier's Check or MoneyOrder"),
     ], string='COD Funding Option', default='0')
+    ups_rate_cache_ttl = fields.Integer(string='Rate Cache Duration', default=600,
+                                        help="Number of seconds a UPS quote is reused for an identical shipment.\n"
+                                             "Set to 0 to always ask UPS for a new quote.")
+    ups_rate_stale_ttl = fields.Integer(string='Stale Quote Duration', default=86400,
+                                        help="Number of seconds the last UPS quote of a shipment is still shown, "
+                                             "with a warning, while UPS is unavailable.\n"
+                                             "Set to 0 to show an error instead.")
+    ups_prefetch_rates = fields.Boolean(string='Prefetch UPS Rates',
+                                        help="Ask UPS the rate of draft orders in the background as soon as their "
+                                             "lines or delivery address change, so that the price is ready when "
+                                             "the customer reaches the delivery step. Requires the rate cache.")
+    ups_rate_table_mode = fields.Selection([
+        ('live', 'Ask UPS'),
+        ('estimate', 'Estimate from the Rate Tables'),
+        ('fallback', 'Rate Tables When UPS is Unreachable'),
+    ], string='UPS Rates', default='live', required=True,
+        help="Estimate: quote the domestic shipments covered by the rate tables without calling UPS, and check the "
+             "price with UPS when the order is confirmed.\n"
+             "Rate Tables When UPS is Unreachable: quote them from the rate tables only while UPS cannot be "
+             "reached and no previous quote of the shipment is known.")
+    ups_rate_table_ids = fields.One2many('ups.rate.table', 'carrier_id', string='UPS Rate Tables')
+    ups_transit_time = fields.Boolean(string='Show UPS Delivery Dates',
+                                      help="Ask UPS the expected delivery date of the shipments along with their "
+                                           "price, and show it to ecommerce users.")
+    ups_log_async = fields.Boolean(string='Log UPS Requests in Background',
+                                   help="With debug logging, write the UPS requests and responses to the logs "
+                                        "from a background thread instead of during the request.")
+    ups_log_sample_rate = fields.Float(string='Logged UPS Quotes (%)', default=100.0,
+                                       help="With debug logging, percentage of the UPS rate and transit time "
+                                            "requests that are logged. Faults, shipments and voids are always "
+                                            "logged.")
+    ups_fast_serialization = fields.Boolean(string='Fast UPS Package Serialization', default=False,
+                                            help="Render the packages of the UPS requests from templates instead "
+                                                 "of building each of them with zeep. The requests are identical, "
+                                                 "but much faster to build for shipments of many packages.")
+    ups_connect_timeout = fields.Float(string='UPS Connection Timeout', default=5,
+                                       help="Number of seconds to wait for the connection to UPS.")
+    ups_read_timeout = fields.Float(string='UPS Read Timeout', default=30,
+                                    help="Number of seconds to wait for the answer of UPS.")
+    ups_pool_size = fields.Integer(string='UPS Connection Pool Size', default=10,
+                                   help="Number of connections to UPS kept open by each Odoo worker.")
+    ups_max_retries = fields.Integer(string='UPS Retries', default=2,
+                                     help="Number of times a rate request is sent again when the connection fails "
+                                          "or times out. Shipments are never sent twice.")
 
     def _compute_can_generate_return(self):
         super(ProviderUPS, self)._compute_can_generate_return()
@@ -68,29 +165,52 @@ class ProviderUPS(models.Model):
         self.ups_cod = False
         self.ups_saturday_delivery = False
 
-    def ups_rate_shipment(self, order):
-        superself = self.sudo()
-        srm = UPSRequest(self.log_xml, superself.ups_username, superself.ups_passwd, superself.ups_shipper_number,
-                         superself.ups_access_number, self.prod_environment)
-        ResCurrency = self.env['res.currency']
-        max_weight = self.ups_default_packaging_id.max_weight
-        packages = []
-        total_qty = 0
-        total_weight = 0
-        for line in order.order_line.filtered(lambda line: not line.is_delivery and not line.display_type):
-            total_qty += line.product_uom_qty
-            total_weight += line.product_id.weight * line.product_qty
+    @api.model_create_multi
+    def create(self, vals_list):
+        carriers = super(ProviderUPS, self).create(vals_list)
+        if any(vals.get('ups_prefetch_rates') for vals in vals_list):
+            self.clear_caches()
+        return carriers
 
-        if max_weight and total_weight > max_weight:
-            total_package = int(total_weight / max_weight)
-            last_package_weight = total_weight % max_weight
+    def write(self, vals):
+        res = super(ProviderUPS, self).write(vals)
+        if UPS_PREFETCH_FIELDS.intersection(vals):
+            self.clear_caches()
+        return res
 
-            for seq in range(total_package):
-                packages.append(Package(self, max_weight))
-            if last_package_weight:
-                packages.append(Package(self, last_package_weight))
-        else:
-            packages.append(Package(self, total_weight))
+    def unlink(self):
+        prefetch = any(self.mapped('ups_prefetch_rates'))
+        res = super(ProviderUPS, self).unlink()
+        if prefetch:
+            self.clear_caches()
+        return res
+
+    @api.model
+    @ormcache()
+    def _ups_has_prefetch_carriers(self):
+        """ Return whether some UPS carrier prefetches its rates. Cached, as it
+            is checked on each change of the quotations.
+        """
+        return bool(self.sudo().search_count([('delivery_type', '=', 'ups'), ('ups_prefetch_rates', '=', True)]))
+
+    def _ups_get_request(self):
+        superself = self.sudo()
+        return UPSRequest(self.debug_logging and self.log_xml or None, superself.ups_username, superself.ups_passwd,
+                          superself.ups_shipper_number, superself.ups_access_number, self.prod_environment,
+                          connect_timeout=self.ups_connect_timeout, read_timeout=self.ups_read_timeout,
+                          pool_size=self.ups_pool_size, max_retries=self.ups_max_retries,
+                          log_sample_rate=self.ups_log_sample_rate,
+                          log_async=self.ups_log_async, carrier_id=self.id, dbname=self.env.cr.dbname,
+                          endpoint=self.env['ir.config_parameter'].sudo().get_param('website_delivery_ups.endpoint'),
+                          fast_serialization=self.ups_fast_serialization)
+
+    def _ups_prepare_rate_shipment(self, order):
+        """ Return the packages, shipment info and COD details sent to UPS to
+            rate the given order, whatever the service type.
+        """
+        lines = order.order_line.filtered(lambda line: not line.is_delivery and not line.display_type)
+        packages = self._ups_plan_packages([line.product_id for line in lines], lines.mapped('product_qty'))
+        total_qty = sum(lines.mapped('product_uom_qty'))
 
         shipment_info = {
         }
@@ -104,25 +224,21 @@ class ProviderUPS(models.Model):
         else:
             cod_info = None
 
-        check_value = srm.check_required_value(order.company_id.partner_id, order.warehouse_id.partner_id,
-                                               order.partner_shipping_id, order=order)
-        if check_value:
-            return {'success': False,
-                    'price': 0.0,
-                    'error_message': check_value,
-                    'warning_message': False}
-
-        ups_service_type = order.ups_service_type or self.ups_default_service_type
-        result = srm.get_shipping_price(
-            shipment_info=shipment_info,
-            packages=packages,
-            shipper=order.company_id.partner_id,
-            ship_from=order.warehouse_id.partner_id,
-            ship_to=order.partner_shipping_id,
-            packaging_type=self.ups_default_packaging_id.shipper_package_code,
-            service_type=ups_service_type,
-            saturday_delivery=self.ups_saturday_delivery, cod_info=cod_info)
+        return {
+            'shipment_info': shipment_info,
+            'packages': packages,
+            'shipper': order.company_id.partner_id,
+            'ship_from': order.warehouse_id.partner_id,
+            'ship_to': order.partner_shipping_id,
+            'packaging_type': self.ups_default_packaging_id.shipper_package_code,
+            'saturday_delivery': self.ups_saturday_delivery,
+            'cod_info': cod_info,
+        }
 
+    def _ups_get_rate_result(self, order, result):
+        """ Turn the raw UPS answer into the result expected by rate_shipment,
+            converting the price in the currency of the order.
+        """
         if result.get('error_message'):
             return {'success': False,
                     'price': 0.0,
@@ -132,9 +248,10 @@ class ProviderUPS(models.Model):
         if order.currency_id.name == result['currency_code']:
             price = float(result['price'])
         else:
-            quote_currency = ResCurrency.search([('name', '=', result['currency_code'])], limit=1)
-            price = quote_currency._convert(
-                float(result['price']), order.currency_id, order.company_id, order.date_order or fields.Date.today())
+            with measure(self.env.cr.dbname, 'convert', operation='Rate', carrier_id=self.id):
+                quote_currency = self.env['res.currency'].browse(self._ups_get_currency_id(result['currency_code']))
+                price = quote_currency._convert(float(result['price']), order.currency_id, order.company_id,
+                                                order.date_order or fields.Date.today())
 
         if self.ups_bill_my_account and order.ups_carrier_account:
             # Don't show delivery amount, if ups bill my account option is true
@@ -145,9 +262,800 @@ class ProviderUPS(models.Model):
                 'error_message': False,
                 'warning_message': False}
 
+    def ups_rate_shipment(self, order):
+        ups_service_type = order.ups_service_type or self.ups_default_service_type
+        with measure(self.env.cr.dbname, 'quote', operation='Rate', carrier_id=self.id,
+                     service_type=ups_service_type):
+            return self._ups_rate_shipment(order, ups_service_type)
+
+    def _ups_rate_shipment(self, order, ups_service_type):
+        srm = self._ups_get_request()
+        # the values prepared by _ups_rate_orders, which already checked them
+        rate_values = self.env.context.get('ups_rate_values', {}).get(order.id)
+        check_value = False
+        if not rate_values:
+            rate_values = self._ups_prepare_rate_shipment(order)
+            check_value = srm.check_required_value(order.company_id.partner_id, order.warehouse_id.partner_id,
+                                                   order.partner_shipping_id, order=order)
+        if check_value:
+            return {'success': False,
+                    'price': 0.0,
+                    'error_message': check_value,
+                    'warning_message': False}
+
+        prefetched = self.env.context.get('rate_shipment_prefetched', {})
+        transit_key, transit_send = self._ups_prepare_transit_time(srm, order, rate_values)
+        transit_future = None
+        if transit_send and transit_key not in prefetched:
+            # sent now, so UPS computes the transit times and the rate at the same time
+            transit_future = get_executor('rate', RATE_WORKERS).submit(transit_send)
+
+        fingerprint = self._ups_rate_fingerprint(order, rate_values['packages'], ups_service_type,
+                                                 rate_values['shipment_info'], rate_values['cod_info'])
+        result = self._ups_get_estimated_rate(rate_values, ups_service_type)
+        if not result:
+            # prefetched quotes were asked to UPS on purpose, they win over the cached ones
+            cached = fingerprint not in prefetched and self._ups_get_cached_rate(fingerprint)
+            if cached:
+                result = cached
+            elif fingerprint in prefetched:
+                result = prefetched[fingerprint]
+                if not result.get('error_message'):
+                    self._ups_set_cached_rate(fingerprint, result)
+            else:
+                result = self._ups_fetch_rate(fingerprint, functools.partial(
+                    srm.get_shipping_price, service_type=ups_service_type, **rate_values))
+            if not cached and not result.get('error_message'):
+                self._ups_record_drift(order, rate_values, ups_service_type, result)
+
+        stale = result.get('unavailable') and self._ups_get_stale_rate(fingerprint)
+        fallback = result.get('unavailable') and not stale and self.ups_rate_table_mode == 'fallback' and \
+            self._ups_estimate_rate(rate_values, ups_service_type)
+        if stale:
+            result = stale
+            self._ups_refresh_rate(fingerprint, srm, ups_service_type, rate_values)
+        elif fallback:
+            result = fallback
+
+        res = self._ups_get_rate_result(order, result)
+        if stale:
+            res['warning_message'] = _("UPS is currently unavailable, this is the last price it quoted for this "
+                                       "shipment. It may have changed.")
+        elif fallback:
+            res['warning_message'] = _("UPS is currently unavailable, this price is estimated from its rate "
+                                       "tables. It may change.")
+        if transit_key and res['success']:
+            transit_result = prefetched.get(transit_key)
+            if transit_future:
+                transit_result = self._ups_wait_transit_time(transit_future)
+            res.update(self._ups_get_transit_time(transit_key, ups_service_type, transit_result))
+        return res
+
+    def _ups_rate_shipment_job(self, order):
+        """ Prepare the UPS requests of ups_rate_shipment, see _rate_shipment_job.
+            Nothing is returned when ups_rate_shipment will not call UPS anyway.
+        """
+        srm = self._ups_get_request()
+        rate_values = self._ups_prepare_rate_shipment(order)
+        if srm.check_required_value(order.company_id.partner_id, order.warehouse_id.partner_id,
+                                    order.partner_shipping_id, order=order):
+            return []
+        jobs = []
+        ups_service_type = order.ups_service_type or self.ups_default_service_type
+        fingerprint = self._ups_rate_fingerprint(order, rate_values['packages'], ups_service_type,
+                                                 rate_values['shipment_info'], rate_values['cod_info'])
+        if not self._ups_get_estimated_rate(rate_values, ups_service_type) and \
+                not self._ups_get_cached_rate(fingerprint):
+            send = srm.prepare_shipping_price(service_type=ups_service_type, **rate_values)
+            # only shared within this process: the jobs run without a cursor, the advisory lock of
+            # _ups_fetch_rate_shared would take a database connection per thread
+            jobs.append((fingerprint, functools.partial(_rate_flights.do, (self.env.cr.dbname, fingerprint), send,
+                                                        self._get_rate_timeout())))
+        transit_key, transit_send = self._ups_prepare_transit_time(srm, order, rate_values)
+        if transit_send:
+            jobs.append((transit_key, transit_send))
+        return jobs
+
+    def _ups_rate_orders(self, orders, prefetched=None):
+        """ Rate many orders at once with this carrier, e.g. to update the
+            quotations after a price change, skipping the rate cache.
+
+            Orders are grouped by shipment fingerprint, so every distinct
+            shipment and transit lane is asked to UPS only once, concurrently on
+            a bounded thread pool. Their quotes are then given to rate_shipment
+            like rate_shipment_multi does, which caches them. Rate tables are
+            not used, the quotes always come from UPS.
+
+            :param prefetched: {key: result} dict of the UPS answers already
+                               received, completed with the new ones, to share
+                               them between successive batches of orders
+            :return: a dict mapping each order id to its rate_shipment result
+        """
+        self.ensure_one()
+        prefetched = {} if prefetched is None else prefetched
+        errors = self._ups_check_required_values(orders)
+        products = orders.mapped('order_line.product_id')
+        products.mapped('weight')
+        products.mapped('volume')
+
+        srm = self._ups_get_request()
+        executor = get_executor('rerate', RERATE_WORKERS)
+        futures = {}
+        all_rate_values = {}
+        for order in orders.filtered(lambda order: not errors[order.id]):
+            rate_values = all_rate_values[order.id] = self._ups_prepare_rate_shipment(order)
+            ups_service_type = order.ups_service_type or self.ups_default_service_type
+            fingerprint = self._ups_rate_fingerprint(order, rate_values['packages'], ups_service_type,
+                                                     rate_values['shipment_info'], rate_values['cod_info'])
+            if fingerprint not in prefetched and fingerprint not in futures:
+                futures[fingerprint] = executor.submit(
+                    srm.prepare_shipping_price(service_type=ups_service_type, **rate_values))
+            transit_key, transit_send = self._ups_prepare_transit_time(srm, order, rate_values)
+            if transit_send and transit_key not in prefetched and transit_key not in futures:
+                futures[transit_key] = executor.submit(transit_send)
+
+        for key, future in futures.items():
+            try:
+                prefetched[key] = future.result()
+            except Exception as e:
+                _logger.exception("UPS rate request %s failed", key)
+                prefetched[key] = {'error_message': str(e)}
+
+        carrier = self.with_context(rate_shipment_prefetched=prefetched, ups_rate_values=all_rate_values,
+                                    ups_rate_live=True)
+        return {order.id: carrier.rate_shipment(order) if not errors[order.id] else {
+            'success': False,
+            'price': 0.0,
+            'error_message': errors[order.id],
+            'warning_message': False,
+        } for order in orders}
+
+    def ups_rate_shipment_services(self, order):
+        """ Rate the order for every UPS service available between the warehouse
+            and the customer, in a single ProcessRate call (UPS 'Shop' option).
+
+            :return: a dict mapping each UPS service code to a rate_shipment
+                     result; on error, a dict with the 'error_message' key only
+        """
+        self.ensure_one()
+        srm = self._ups_get_request()
+        rate_values = self._ups_prepare_rate_shipment(order)
+
+        check_value = srm.check_required_value(order.company_id.partner_id, order.warehouse_id.partner_id,
+                                               order.partner_shipping_id, order=order)
+        if check_value:
+            return {'error_message': check_value}
+
+        transit_key, transit_send = self._ups_prepare_transit_time(srm, order, rate_values)
+        transit_future = transit_send and get_executor('rate', RATE_WORKERS).submit(transit_send)
+        result = srm.get_shipping_prices(**rate_values)
+        if result.get('error_message'):
+            return {'error_message': _('Error:\n%s') % result['error_message']}
+        transit_result = transit_future and self._ups_wait_transit_time(transit_future)
+
+        rates = {}
+        for service_type, service_result in result['prices'].items():
+            # Freight rates depend on the number of pieces, which is not sent when shopping
+            if service_type != '96':
+                fingerprint = self._ups_rate_fingerprint(order, rate_values['packages'], service_type,
+                                                         rate_values['shipment_info'], rate_values['cod_info'])
+                self._ups_set_cached_rate(fingerprint, service_result)
+            rates[service_type] = self._ups_get_rate_result(order, service_result)
+            if transit_key:
+                rates[service_type].update(self._ups_get_transit_time(transit_key, service_type, transit_result))
+        return rates
+
+    def _ups_prepare_shipping(self, picking):
+        """ Build the UPS shipment of the picking and return a callable creating
+            it, see UPSRequest.prepare_shipping.
+        """
+        srm = self._ups_get_request()
+        weight_factor = self._ups_get_weight_factor(self.ups_package_weight_unit)
+        packages = []
+        for package in picking.package_ids:
+            packages.append(Package(self, package.shipping_weight, quant_pack=package.packaging_id, name=package.name,
+                                    weight_factor=weight_factor))
+        # an immediate transfer ships everything that is reserved, its done
+        # quantities are only set when it is validated
+        qty_field = 'qty_done' if any(picking.move_line_ids.mapped('qty_done')) else 'product_uom_qty'
+        # Create packages with the rest (the content that is not in a package)
+        bulk_lines = picking.move_line_ids.filtered(
+            lambda ml: ml.product_id and not ml.result_package_id and ml[qty_field])
+        if bulk_lines:
+            packages += self._ups_plan_packages(
+                [ml.product_id for ml in bulk_lines],
+                [ml.product_uom_id._compute_quantity(ml[qty_field], ml.product_id.uom_id) for ml in bulk_lines])
+
+        invoice_line_total = 0
+        for move in picking.move_lines:
+            invoice_line_total += picking.company_id.currency_id.round(move.product_id.lst_price * move.product_qty)
+
+        order = picking.sale_id
+        shipment_info = {
+            'description': picking.origin,
+            'total_qty': sum(sml[qty_field] for sml in picking.move_line_ids),
+            'ilt_monetary_value': '%d' % invoice_line_total,
+            'itl_currency_code': picking.company_id.currency_id.name,
+            'phone': picking.partner_id.mobile or picking.partner_id.phone or
+            order.partner_id.mobile or order.partner_id.phone,
+        }
+        if order and order.carrier_id == self:
+            ups_service_type = order.ups_service_type or self.ups_default_service_type
+        else:
+            ups_service_type = self.ups_default_service_type
+
+        if self.ups_cod:
+            cod_info = {
+                'currency': picking.partner_id.country_id.currency_id.name,
+                'monetary_value': order.amount_total,
+                'funds_code': self.ups_cod_funds_code,
+            }
+        else:
+            cod_info = None
+
+        check_value = srm.check_required_value(picking.company_id.partner_id,
+                                               picking.picking_type_id.warehouse_id.partner_id,
+                                               picking.partner_id, picking=picking)
+        if check_value:
+            raise UserError(check_value)
+
+        packaging_type = picking.package_ids and picking.package_ids[0].packaging_id.shipper_package_code or \
+            self.ups_default_packaging_id.shipper_package_code
+        return srm.prepare_shipping(
+            shipment_info=shipment_info, packages=packages, shipper=picking.company_id.partner_id,
+            ship_from=picking.picking_type_id.warehouse_id.partner_id, ship_to=picking.partner_id,
+            packaging_type=packaging_type, service_type=ups_service_type, duty_payment=self.ups_duty_payment,
+            label_file_type=self.ups_label_file_type, ups_carrier_account=order.ups_carrier_account,
+            saturday_delivery=self.ups_saturday_delivery, cod_info=cod_info)
+
+    @api.model
+    def _ups_convert_labels(self, results):
+        """ Convert the labels of many UPS shipments in one stream, see
+            ups_label.convert_labels, and store them in the 'label_binary_data'
+            key of each result, as a {tracking number: label} dict.
+
+            :return: an iterator over the results, each one yielded once its
+                     labels are converted
+        """
+        results = list(results)
+        labels = convert_labels((image, result['label_file_type'])
+                                for result in results for __, image in result['label_images'])
+        for result in results:
+            result['label_binary_data'] = {tracking_number: next(labels)
+                                           for tracking_number, __ in result['label_images']}
+            yield result
+
+    def _ups_get_labels(self, result):
+        """ Return the labels of a UPS shipment as a list of (file name, content) """
+        if 'label_binary_data' not in result:
+            next(self._ups_convert_labels([result]))
+        if result['label_file_type'] == 'GIF':
+            document = io.BytesIO()
+            write_labels(result['label_binary_data'].values(), 'GIF', document)
+            return [('LabelUPS.pdf', document.getvalue())]
+        return [('LabelUPS-%s.%s' % (tracking_number, result['label_file_type']), label)
+                for tracking_number, label in result['label_binary_data'].items()]
+
+    def _ups_get_shipping_result(self, picking, result):
+        """ Post the labels of a created UPS shipment on the picking and return
+            the result expected by send_shipping.
+        """
+        if result.get('error_message'):
+            raise UserError(result['error_message'])
+
+        order = picking.sale_id
+        company = order.company_id or picking.company_id or self.env.company
+        currency_order = order.currency_id or picking.company_id.currency_id
+        if currency_order.name == result['currency_code']:
+            price = float(result['price'])
+        else:
+            quote_currency = self.env['res.currency'].browse(self._ups_get_currency_id(result['currency_code']))
+            price = quote_currency._convert(
+                float(result['price']), currency_order, company, order.date_order or fields.Date.today())
+
+        carrier_tracking_ref = "+".join(tracking_number for tracking_number, __ in result['label_images'])
+        logmessage = _("Shipment created into UPS<br/>"
+                       "<b>Tracking Numbers:</b> %s<br/>"
+                       "<b>Packages:</b> %s") % (carrier_tracking_ref, ','.join(picking.package_ids.mapped('name')))
+        picking.message_post(body=logmessage, attachments=self._ups_get_labels(result))
+        return {'exact_price': price,
+                'tracking_number': carrier_tracking_ref}
+
+    def ups_send_shipping(self, pickings):
+        """ Create the UPS shipments of the pickings. Shipments already created
+            by stock.picking._ups_send_shipping_bulk are given in the
+            'ups_prefetched_shipping' context key, as a {picking id: result} dict.
+        """
+        res = []
+        prefetched = self.env.context.get('ups_prefetched_shipping', {})
+        for picking in pickings:
+            result = prefetched.get(picking.id) or self._ups_prepare_shipping(picking)()
+            res.append(self._ups_get_shipping_result(picking, result))
+        return res
+
+    def _ups_void_shipments(self, pickings):
+        """ Void the UPS shipments of the pickings, concurrently on a bounded
+            thread pool and at most VOID_RATE requests per second for the whole
+            worker. A failing shipment does not stop the others: the pickings
+            that were voided are updated, the others get a message.
+
+            :return: a dict mapping each picking id to its error message, or
+                     False if its shipment was voided
+        """
+        srm = self._ups_get_request()
+        throttle = get_rate_limiter('void', VOID_RATE).wait
+        executor = get_executor('void', VOID_WORKERS)
+        futures = {}
+        for picking in pickings:
+            futures[picking] = executor.submit(srm.prepare_cancel_shipment(
+                self._ups_get_void_number(picking.carrier_tracking_ref), throttle=throttle))
+
+        report = {}
+        for picking, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                _logger.exception("UPS void of picking %s failed", picking.name)
+                result = {'error_message': str(e)}
+            if result.get('error_message'):
+                report[picking.id] = result['error_message']
+                picking.message_post(body=_('UPS shipment %s could not be cancelled: %s') % (
+                    picking.carrier_tracking_ref, result['error_message']))
+            else:
+                report[picking.id] = False
+                picking.message_post(body=_(u'Shipment N° %s has been cancelled') % picking.carrier_tracking_ref)
+                picking.write({'carrier_tracking_ref': '',
+                               'carrier_price': 0.0})
+        return report
+
+    def _ups_get_void_number(self, carrier_tracking_ref):
+        """ Return the number identifying a shipment in a ProcessVoid request """
+        if not self.prod_environment:
+            return "1ZISDE016691676846"  # the only number voided by the testing server
+        # the shipment identification number is the one of its first package
+        return (carrier_tracking_ref or '').split('+')[0]
+
+    def ups_cancel_shipment(self, pickings):
+        """ Void the UPS shipments of the pickings, see _ups_void_shipments.
+            An error is raised only when no shipment could be voided, so the
+            pickings already voided at UPS are never rolled back.
+        """
+        report = self._ups_void_shipments(pickings)
+        if report and all(report.values()):
+            raise UserError("\n".join(str(error) for error in report.values()))
+        return report
+
+    def _rate_shipment_job(self, order):
+        """ Return a list of (key, callable) tuples doing the network part of
+            rate_shipment, empty if the carrier does not need to call any
+            external service, e.g. when its quote is cached. The callables
+            must not touch the ORM: rate_shipment_multi runs them in worker
+            threads, then gives their results back to rate_shipment in the
+            'rate_shipment_prefetched' context key, as a {key: result} dict. Jobs sharing a key are only run once, and a job
+            not done in time gets a {'error_message': ...} result.
+        """
+        self.ensure_one()
+        if hasattr(self, '_%s_rate_shipment_job' % self.delivery_type):
+            return getattr(self, '_%s_rate_shipment_job' % self.delivery_type)(order)
+        return []
+
+    def _get_rate_timeout(self):
+        if self.delivery_type == 'ups':
+            # every attempt may wait for the connection and the answer, with a backoff in between, see
+            # UPSRequest._call_idempotent
+            retries = max(self.ups_max_retries, 0)
+            return (self.ups_connect_timeout + self.ups_read_timeout) * (retries + 1) + \
+                RETRY_BACKOFF * (2 ** retries - 1)
+        return RATE_TIMEOUT
+
+    def rate_shipment_multi(self, order):
+        """ Compute the price of the order for the carriers of self that can
+            prepare their rate requests, see _rate_shipment_job, at once.
+
+            External rate requests are sent concurrently on a bounded thread
+            pool, so the total wait is about the one of the slowest carrier
+            instead of their sum. A carrier not answering within its timeout
+            gets an error result. The other carriers are left out: rating them
+            here would call their services one after the other, the checkout
+            rates them lazily instead.
+
+            :return: a dict mapping carrier ids to their rate_shipment result
+        """
+        carriers = self.filtered(lambda carrier: hasattr(carrier, '_%s_rate_shipment_job' % carrier.delivery_type))
+        jobs = {}
+        executor = get_executor('rate', RATE_WORKERS)
+        start = time.monotonic()
+        for carrier in carriers:
+            for key, send in carrier._rate_shipment_job(order):
+                if key not in jobs:
+                    jobs[key] = (carrier, executor.submit(send))
+
+        prefetched = {}
+        for key, (carrier, future) in jobs.items():
+            try:
+                remaining = start + carrier._get_rate_timeout() - time.monotonic()
+                prefetched[key] = future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                future.cancel()
+                prefetched[key] = {'error_message': _('%s did not answer in time.') % carrier.name}
+            except Exception as e:
+                # the page must still show the other carriers
+                _logger.exception("Rate request %s of %s failed", key, carrier.name)
+                prefetched[key] = {'error_message': str(e)}
+
+        return {carrier.id: carrier.rate_shipment(order)
+                for carrier in carriers.with_context(rate_shipment_prefetched=prefetched)}
+
+    def _ups_rate_fingerprint(self, order, packages, service_type, shipment_info, cod_info):
+        """ Return a digest of everything that drives the price of a UPS quote,
+            used as key of the rate cache. Two orders with the same fingerprint
+            get the same answer from ProcessRate.
+        """
+        superself = self.sudo()
+
+        def address(partner):
+            return [partner.zip or '', partner.country_id.code or '', partner.state_id.code or '']
+
+        ship_to = order.partner_shipping_id
+        values = [
+            self.env.cr.dbname,
+            superself.ups_username, superself.ups_shipper_number, superself.ups_access_number,
+            bool(self.prod_environment),
+            address(order.company_id.partner_id),
+            address(order.warehouse_id.partner_id),
+            address(ship_to),
+            not ship_to.commercial_partner_id.is_company,
+            [[p.count, p.weight, p.weight_unit, p.packaging_type or '', p.dimension_unit or '',
+              p.dimension['length'], p.dimension['width'], p.dimension['height']] for p in packages],
+            self.ups_default_packaging_id.shipper_package_code or '',
+            service_type or '',
+            bool(self.ups_saturday_delivery),
+            cod_info and [cod_info['currency'], cod_info['monetary_value'], cod_info['funds_code']] or None,
+            shipment_info.get('total_qty') if service_type == '96' else None,
+        ]
+        return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+
+    def _ups_fetch_rate(self, fingerprint, send):
+        """ Ask UPS the quote of a shipment with send() and cache it, unless
+            the same quote is already being asked, in which case its result is
+            shared instead: by the threads of this process (single flight), and
+            by the other workers when the quotes are cached in the database.
+        """
+        result = _rate_flights.do((self.env.cr.dbname, fingerprint),
+                                  functools.partial(self._ups_fetch_rate_shared, fingerprint, send),
+                                  self._get_rate_timeout())
+        return dict(result)
+
+    def _ups_fetch_rate_shared(self, fingerprint, send):
+        """ Send a rate request while holding a PostgreSQL advisory lock on
+            its fingerprint, and cache its quote before releasing it. Workers
+            asking the same quote meanwhile wait for the lock, then read the
+            quote from the cache.
+
+            The lock uses its own cursor, on which the quote is cached, so that
+            it is released as soon as the quote is committed. Workers wait for
+            it at most RATE_TIMEOUT seconds, as a checkout does.
+        """
+        if self.ups_rate_cache_ttl <= 0:
+            result = send()
+            if not result.get('error_message'):
+                self._ups_set_cached_rate(fingerprint, result)
+            return result
+
+        # the lock key is (class, int4), the class keeping it apart from the locks of other modules
+        key = (RATE_LOCK_CLASS, int(fingerprint[:8], 16) - 0x80000000)
+        with self.pool.cursor() as cr:
+            carrier = self.with_env(self.env(cr=cr))
+            cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", key)
+            if cr.fetchone()[0]:
+                # another worker may have cached it since the caller looked
+                result = carrier._ups_get_cached_rate(fingerprint)
+                if result:
+                    return result
+                result = send()
+                if not result.get('error_message'):
+                    # committed with the lock released on leaving the block
+                    carrier._ups_set_cached_rate(fingerprint, result, cr=cr)
+                return result
+
+            timeout = min(self._get_rate_timeout(), RATE_TIMEOUT)
+            cr.execute("SET LOCAL lock_timeout = %s", ('%dms' % (timeout * 1000),))
+            try:
+                cr.execute("SELECT pg_advisory_xact_lock(%s, %s)", key, log_exceptions=False)
+            except psycopg2.OperationalError:
+                # the other worker is too slow, ask UPS directly
+                cr.rollback()
+                return send()
+            # a new transaction, to see the quote committed by the other worker
+            cr.commit()
+            result = carrier._ups_get_cached_rate(fingerprint)
+        if result:
+            _rate_quote_cache.count('shared')
+            return result
+        # the other worker got an error, which is not cached
+        return send()
+
+    def _ups_get_cached_rate(self, fingerprint):
+        """ Return the raw UPS quote (price and currency code) cached for this
+            fingerprint, looking in this process first and then in the database.
+        """
+        if self.ups_rate_cache_ttl <= 0:
+            return None
+        result = _rate_quote_cache.get(fingerprint)
+        if result is None:
+            result = self.env['ups.rate.cache'].sudo()._get_quote(fingerprint, self.ups_rate_cache_ttl)
+            if result:
+                _rate_quote_cache.count('db_hits')
+                _rate_quote_cache.set(fingerprint, result, ttl=self.ups_rate_cache_ttl)
+        return result and dict(result)
+
+    def _ups_set_cached_rate(self, fingerprint, result, cr=None):
+        """ Cache the quote of a fingerprint, in this process and in the
+            database. The database row is written on ``cr``, a cursor about to
+            be committed, or else in a short transaction of its own.
+        """
+        if self.ups_rate_cache_ttl <= 0 and self.ups_rate_stale_ttl <= 0:
+            return
+        result = {'price': result['price'], 'currency_code': result['currency_code']}
+        _rate_quote_cache.set(fingerprint, result, ttl=self.ups_rate_cache_ttl)
+        # also kept in the database while it can be served stale, see _ups_get_stale_rate. Never
+        # written in the current transaction, so the other workers see it at once, and the checkout
+        # never conflicts with the transactions caching the same shipment
+        if cr is not None:
+            try:
+                with cr.savepoint():
+                    self.env(cr=cr)['ups.rate.cache'].sudo()._set_quote(fingerprint, self, result)
+            except TransactionRollbackError:
+                # another worker cached the same shipment since this transaction started
+                pass
+            return
+        with self.pool.cursor() as cr:
+            try:
+                self.env(cr=cr)['ups.rate.cache'].sudo()._set_quote(fingerprint, self, result)
+            except TransactionRollbackError:
+                cr.rollback()
+
+    def _ups_get_stale_rate(self, fingerprint):
+        """ Return the last UPS quote of this fingerprint, if younger than the
+            stale quote duration, to show while UPS is unavailable.
+        """
+        if self.ups_rate_stale_ttl <= 0:
+            return None
+        return self.env['ups.rate.cache'].sudo()._get_quote(fingerprint, self.ups_rate_stale_ttl)
+
+    def _ups_refresh_rate(self, fingerprint, srm, service_type, rate_values):
+        """ Ask UPS the quote of a shipment again in the background, once its
+            circuit lets calls through again, and cache it. A shipment is only
+            refreshed once at a time per process.
+        """
+        with _refreshing_rates_lock:
+            if fingerprint in _refreshing_rates:
+                return
+            _refreshing_rates.add(fingerprint)
+        send = srm.prepare_shipping_price(service_type=service_type, **rate_values)
+        delay = srm.get_retry_delay('Rate')
+        dbname, carrier_id = self.env.cr.dbname, self.id
+
+        def refresh():
+            try:
+                result = send()
+                if not result.get('error_message'):
+                    with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                        env = api.Environment(cr, SUPERUSER_ID, {})
+                        env['delivery.carrier'].browse(carrier_id)._ups_set_cached_rate(fingerprint, result)
+            except Exception:
+                _logger.exception("Could not refresh the UPS quote %s", fingerprint)
+            finally:
+                with _refreshing_rates_lock:
+                    _refreshing_rates.discard(fingerprint)
+
+        # no pool thread waits for the circuit to let calls through again
+        get_scheduler('refresh').schedule(delay, lambda: get_executor('refresh', RATE_WORKERS).submit(refresh))
+
+    @api.model
+    def _ups_rate_cache_stats(self):
+        """ Hit and miss counters of the in-process rate cache. Database hits
+            are counted both as in-process misses and as ``db_hits``. Rate
+            requests sent for identical shipments at the same time are counted
+            in ``flights`` (in this process) and ``shared`` (by another worker).
+        """
+        return dict(_rate_quote_cache.stats, size=len(_rate_quote_cache), flights=dict(_rate_flights.stats))
+
+    def _ups_prepare_transit_time(self, srm, order, rate_values):
+        """ Return the cache key of the transit times of the order lane and,
+            when they are not cached yet, a callable fetching them from UPS, see
+            UPSRequest.prepare_time_in_transit. Return (False, None) when the
+            carrier does not show delivery dates.
+        """
+        if not self.ups_transit_time:
+            return False, None
+        ship_from = order.warehouse_id.partner_id
+        ship_to = order.partner_shipping_id
+        pickup_date = fields.Date.context_today(self)
+        transit_key = (self._ups_transit_lane(ship_from, ship_to), pickup_date)
+        if self._ups_get_cached_transit_times(transit_key) is not None:
+            return transit_key, None
+        packages = rate_values['packages']
+        send = srm.prepare_time_in_transit(
+            ship_from, ship_to, pickup_date, sum(p.weight * p.count for p in packages),
+            self.ups_package_weight_unit, package_count=sum(p.count for p in packages),
+            invoice_total=order.amount_untaxed, currency_code=order.currency_id.name)
+        return transit_key, send
+
+    def _ups_transit_lane(self, ship_from, ship_to):
+        return '%s %s > %s %s' % (ship_from.country_id.code or '', ship_from.zip or '',
+                                  ship_to.country_id.code or '', ship_to.zip or '')
+
+    def _ups_wait_transit_time(self, future):
+        try:
+            return future.result(timeout=self._get_rate_timeout())
+        except TimeoutError:
+            future.cancel()
+            return None
+
+    def _ups_get_transit_time(self, transit_key, service_type, result=None):
+        """ Return the delivery date and business days in transit of the given
+            UPS service, to add to its rate_shipment result. The transit times of
+            the lane are taken from the result of the TNT request, if any, or
+            from the cache. A lane UPS could not answer for gets no date.
+        """
+        if result and not result.get('error_message'):
+            transit_times = result['transit_times']
+            self._ups_set_cached_transit_times(transit_key, transit_times)
+        else:
+            transit_times = self._ups_get_cached_transit_times(transit_key) or {}
+        transit = transit_times.get(TNT_SERVICE_TYPE.get(service_type))
+        if not transit:
+            return {}
+        return {'delivery_date': fields.Date.to_date(transit['date']),
+                'transit_days': transit['business_days']}
+
+    def _ups_get_cached_transit_times(self, transit_key):
+        """ Return the transit times cached for this (lane, pickup date), looking
+            in this process first and then in the database.
+        """
+        key = (self.env.cr.dbname,) + transit_key
+        transit_times = _transit_time_cache.get(key)
+        if transit_times is None:
+            transit_times = self.env['ups.transit.cache'].sudo()._get_transit_times(*transit_key)
+            if transit_times is not None:
+                _transit_time_cache.set(key, transit_times)
+        return transit_times
+
+    def _ups_set_cached_transit_times(self, transit_key, transit_times):
+        _transit_time_cache.set((self.env.cr.dbname,) + transit_key, transit_times)
+        # written in its own transaction, like the rate quotes, see _ups_set_cached_rate
+        with self.pool.cursor() as cr:
+            try:
+                self.env(cr=cr)['ups.transit.cache'].sudo()._set_transit_times(
+                    transit_key[0], transit_key[1], transit_times)
+            except TransactionRollbackError:
+                # another worker cached the same lane since this transaction started
+                cr.rollback()
+
+    def _ups_check_required_values(self, records):
+        """ Run UPSRequest.check_required_value on many sale orders or pickings
+            at once, fetching all their addresses in a few queries first.
+
+            :return: a dict mapping each record id to its error message, or False
+        """
+        srm = self._ups_get_request()
+        if records._name == 'sale.order':
+            addresses = [(order.company_id.partner_id, order.warehouse_id.partner_id, order.partner_shipping_id,
+                          {'order': order}) for order in records]
+            records.mapped('order_line')
+        else:
+            addresses = [(picking.company_id.partner_id, picking.picking_type_id.warehouse_id.partner_id,
+                          picking.partner_id, {'picking': picking}) for picking in records]
+            records.mapped('move_line_ids.result_package_id.shipping_weight')
+            records.mapped('sale_id.order_line')
+        partners = self.env['res.partner'].concat(*[partner for address in addresses for partner in address[:3]])
+        partners.mapped('country_id.code')
+        partners.mapped('state_id.code')
+        return {record.id: srm.check_required_value(shipper, ship_from, ship_to, **kwargs)
+                for record, (shipper, ship_from, ship_to, kwargs) in zip(records, addresses)}
+
+    def _ups_plan_packages(self, products, quantities):
+        """ Split the given products into UPS packages, using the packagings
+            of the carrier that give the fewest packages. Weight and volume of
+            every product are taken into account.
+
+            :param products: list of the products of each line
+            :param quantities: list of the quantities of each line, in product UoM
+            :return: a list of Package
+        """
+        packagings = self.ups_default_packaging_id | self.ups_packaging_ids
+        weights = array('d', [product.weight for product in products])
+        # product volumes are in the volume UoM of the settings (m³ or ft³), the capacities in m³
+        volume_uom = self.env['product.template']._get_volume_uom_id_from_ir_config_parameter()
+        volume_factor = volume_uom._compute_quantity(1.0, self.env.ref('uom.product_uom_cubic_meter'), round=False)
+        volumes = array('d', [product.volume * volume_factor for product in products])
+        quantities = array('d', quantities)
+        dimension_factor = DIMENSION_TO_METER[self.ups_package_dimension_unit or 'IN'] ** 3
+        capacities = [(packaging.max_weight, packaging.length * packaging.width * packaging.height * dimension_factor)
+                      for packaging in packagings]
+        weight_factor = self._ups_get_weight_factor(self.ups_package_weight_unit)
+        index, package_weights = plan_packages(weights, volumes, quantities, capacities)
+        if index is not None:
+            # full packages often weigh the same, keep them as a single Package
+            return [Package(self, weight, quant_pack=packagings[index], count=len(list(group)),
+                            weight_factor=weight_factor)
+                    for weight, group in itertools.groupby(package_weights)]
+
+        # some product is too big for all the packagings, split on the weight only
+        max_weight = self.ups_default_packaging_id.max_weight
+        total_weight = sum(w * q for w, q in zip(weights, quantities))
+        packages = []
+        if max_weight and total_weight > max_weight:
+            total_package = int(total_weight / max_weight)
+            last_package_weight = total_weight % max_weight
+
+            packages.append(Package(self, max_weight, count=total_package, weight_factor=weight_factor))
+            if last_package_weight:
+                packages.append(Package(self, last_package_weight, weight_factor=weight_factor))
+        else:
+            packages.append(Package(self, total_weight, weight_factor=weight_factor))
+        return packages
+
+    @ormcache('self.id', 'service_type', 'self.ups_package_dimension_unit', 'self.ups_package_weight_unit')
+    def _ups_get_rate_table(self, service_type):
+        """ Return the compiled RateTable of the service, or None """
+        table = self.env['ups.rate.table'].sudo().search([
+            ('carrier_id', '=', self.id), ('service_type', '=', service_type)], limit=1)
+        return table._compile() if table else None
+
+    def _ups_estimate_rate(self, rate_values, service_type):
+        """ Return the price of a shipment from the rate tables, as a raw UPS
+            quote, or None when the tables do not cover it. Only domestic US
+            shipments without value added service can be estimated.
+        """
+        ship_from, ship_to = rate_values['ship_from'], rate_values['ship_to']
+        if rate_values['cod_info'] or rate_values['saturday_delivery'] or \
+                ship_from.country_id.code != 'US' or ship_to.country_id.code != 'US':
+            return None
+        table = self._ups_get_rate_table(service_type)
+        if table is None:
+            return None
+        price = table.quote(ship_from.zip, ship_to.zip,
+                            [(p.weight, p.dimension, p.count) for p in rate_values['packages']],
+                            residential=not ship_to.commercial_partner_id.is_company)
+        if price is None:
+            return None
+        return {'price': price, 'currency_code': table.currency_code, 'estimated': True}
+
+    def _ups_get_estimated_rate(self, rate_values, service_type):
+        """ Return the quote of the rate tables when they are used instead of
+            UPS, see ups_rate_table_mode. The 'ups_rate_live' context key forces
+            asking UPS.
+        """
+        if self.ups_rate_table_mode != 'estimate' or self.env.context.get('ups_rate_live'):
+            return None
+        return self._ups_estimate_rate(rate_values, service_type)
+
+    def _ups_record_drift(self, order, rate_values, service_type, result):
+        """ Compare a quote of UPS with the estimate of the rate tables, if
+            they cover the shipment, see ups.rate.drift.
+        """
+        estimate = self._ups_estimate_rate(rate_values, service_type)
+        if not estimate or estimate['currency_code'] != result['currency_code']:
+            return
+        self.env['ups.rate.drift'].sudo()._record(self, service_type, order, self._ups_get_rate_table(service_type),
+                                                  estimate['price'], float(result['price']))
+
+    @ormcache('code')
+    def _ups_get_currency_id(self, code):
+        # the result is cached: an inactive currency must not be cached as missing
+        return self.env['res.currency'].with_context(active_test=False).search([('name', '=', code)], limit=1).id
+
     def _ups_get_default_custom_package_code(self):
         return '02'
 
+    def _ups_get_weight_factor(self, unit='KGS'):
+        """ Return the factor converting a weight from the product weight unit
+            to the given UPS unit.
+        """
+        return self._ups_convert_weight(1.0, unit)
+
     def _ups_convert_weight(self, weight, unit='KGS'):
         weight_uom_id = self.env['product.template']._get_weight_uom_id_from_ir_config_parameter()
         if unit == 'KGS':
@@ -1,6 +1,53 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
-from odoo import api, fields, models
+import logging
+import threading
+
+import odoo
+from odoo import api, fields, models, SUPERUSER_ID, _
+from odoo.tools.misc import formatLang
+
+from .ups_executor import get_executor
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of orders rated at the same time in the background by a worker
+PREFETCH_WORKERS = 2
+# Number of quotations re-rated, then written and committed, at a time
+RERATE_BATCH_SIZE = 200
+# Fields of the orders and order lines changing their UPS quotes
+UPS_ORDER_FIELDS = {'order_line', 'partner_shipping_id', 'carrier_id', 'ups_service_type'}
+UPS_LINE_FIELDS = {'product_id', 'product_uom_qty', 'product_uom', 'display_type'}
+
+# (database, order id) waiting to be rated in the background
+_prefetch_pending = set()
+_prefetch_pending_lock = threading.Lock()
+
+
+def _schedule_rate_prefetch(dbname, order_ids):
+    """ Rate the orders in the background, unless they are already waiting
+        to be; see SaleOrder._ups_prefetch_rates.
+    """
+    executor = get_executor('prefetch', PREFETCH_WORKERS)
+    for order_id in order_ids:
+        key = (dbname, order_id)
+        with _prefetch_pending_lock:
+            if key in _prefetch_pending:
+                continue
+            _prefetch_pending.add(key)
+        executor.submit(_run_rate_prefetch, dbname, order_id)
+
+
+def _run_rate_prefetch(dbname, order_id):
+    with _prefetch_pending_lock:
+        # changes made from now on need a new prefetch
+        _prefetch_pending.discard((dbname, order_id))
+    try:
+        with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env['sale.order'].browse(order_id).exists()._ups_prefetch_rates()
+    except Exception:
+        _logger.exception("Could not prefetch the UPS rates of order %s", order_id)
 
 
 class SaleOrder(models.Model):
@@ -13,6 +60,155 @@ class SaleOrder(models.Model):
     ups_service_type = fields.Selection(_get_ups_service_types, string="UPS Service Type")
     ups_bill_my_account = fields.Boolean(related='carrier_id.ups_bill_my_account', readonly=True)
 
+    def write(self, vals):
+        res = super(SaleOrder, self).write(vals)
+        if UPS_ORDER_FIELDS.intersection(vals):
+            self._ups_schedule_rate_prefetch()
+        return res
+
     @api.onchange('carrier_id')
     def _onchange_carrier_id(self):
         self.ups_service_type = self.carrier_id.ups_default_service_type
+
+    def _ups_get_prefetch_carriers(self):
+        self.ensure_one()
+        carriers = self.env['delivery.carrier'].sudo().search([
+            ('delivery_type', '=', 'ups'), ('ups_prefetch_rates', '=', True), ('ups_rate_cache_ttl', '>', 0)])
+        return carriers.available_carriers(self.partner_shipping_id)
+
+    def _ups_schedule_rate_prefetch(self):
+        """ Rate the orders in the background once the current transaction is
+            committed, with the UPS carriers prefetching their rates.
+        """
+        if self.env.context.get('ups_no_rate_prefetch'):
+            return
+        # cached, writes of the quotations do not query the carriers
+        if not self.env['delivery.carrier']._ups_has_prefetch_carriers():
+            return
+        orders = self.filtered(lambda order: order.state in ('draft', 'sent'))
+        if not orders:
+            return
+        dbname, order_ids = self.env.cr.dbname, orders.ids
+        self.env.cr.after('commit', lambda: _schedule_rate_prefetch(dbname, order_ids))
+
+    def _ups_prefetch_rates(self):
+        """ Ask UPS the rates of the orders, which caches them: the checkout
+            page then shows the prices without waiting for UPS.
+        """
+        for order in self.filtered(lambda order: order.state in ('draft', 'sent') and order.order_line):
+            for carrier in order._ups_get_prefetch_carriers():
+                result = carrier.ups_rate_shipment(order)
+                if not result['success']:
+                    _logger.debug("UPS rate prefetch of %s with %s failed: %s",
+                                  order.name, carrier.name, result['error_message'])
+
+    def action_confirm(self):
+        self._ups_check_estimated_rates()
+        return super(SaleOrder, self).action_confirm()
+
+    def _ups_check_estimated_rates(self):
+        """ Ask UPS the rate of the orders whose carrier estimates its prices
+            from rate tables, and warn on the orders whose delivery price
+            differs. The price the customer agreed to is kept.
+        """
+        orders = self.filtered(lambda order: order.carrier_id.delivery_type == 'ups' and
+                               order.carrier_id.ups_rate_table_mode == 'estimate' and
+                               order.state in ('draft', 'sent'))
+        for order in orders:
+            delivery_lines = order.order_line.filtered('is_delivery')
+            if not delivery_lines:
+                continue
+            result = order.carrier_id.with_context(ups_rate_live=True).rate_shipment(order)
+            if not result['success']:
+                order.message_post(body=_("The UPS delivery price could not be checked: %s") %
+                                   result['error_message'])
+            elif order.currency_id.compare_amounts(sum(delivery_lines.mapped('price_unit')), result['price']):
+                order.message_post(body=_("The delivery price was estimated from the UPS rate tables, "
+                                          "UPS now quotes %s.") % formatLang(self.env, result['price'],
+                                                                            currency_obj=order.currency_id))
+
+    def _ups_rerate(self, batch_size=RERATE_BATCH_SIZE):
+        """ Rate the UPS quotations of self again and update their delivery
+            line, see ProviderUPS._ups_rate_orders. Quotations are handled by
+            batches, each committed once written, and a shipment shared by
+            quotations of different batches is still only rated once.
+
+            :return: a dict mapping the quotations that failed to their error
+        """
+        orders = self.filtered(lambda order: order.state in ('draft', 'sent') and
+                               order.carrier_id.delivery_type == 'ups')
+        # the quotes are fresh, no need to prefetch them again
+        orders = orders.with_context(ups_no_rate_prefetch=True)
+        errors = {}
+        done = 0
+        for carrier in orders.mapped('carrier_id'):
+            carrier_orders = orders.filtered(lambda order: order.carrier_id == carrier)
+            prefetched = {}
+            for index in range(0, len(carrier_orders), batch_size):
+                batch = carrier_orders[index:index + batch_size]
+                results = carrier._ups_rate_orders(batch, prefetched)
+                for order in batch:
+                    result = results[order.id]
+                    if not result['success']:
+                        errors[order] = result['error_message']
+                        # posted with the batch, which is committed below
+                        order.message_post(body=_("UPS re-rating failed: %s") % result['error_message'])
+                        continue
+                    order.set_delivery_line(carrier, result['price'])
+                    order.write({'recompute_delivery_price': False,
+                                 'delivery_message': result['warning_message'],
+                                 'delivery_rating_success': True})
+                done += len(batch)
+                _logger.info("UPS re-rating: %s/%s quotations done, %s UPS requests, %s errors",
+                             done, len(orders), len(prefetched), len(errors))
+                if not getattr(threading.currentThread(), 'testing', False):
+                    self.env.cr.commit()
+        return errors
+
+    def action_ups_rerate(self):
+        """ Re-rate the quotations, and notify the user of the ones that failed.
+            Nothing is raised, as the quotations re-rated are already committed.
+        """
+        errors = self._ups_rerate()
+        if errors:
+            params = {
+                'title': _("UPS re-rating failed for %s quotations") % len(errors),
+                'message': "\n".join("%s: %s" % (order.name, error) for order, error in errors.items()),
+                'type': 'warning',
+                'sticky': True,
+            }
+        else:
+            params = {
+                'title': _("UPS re-rating done"),
+                'message': _("The delivery price of the quotations is up to date."),
+                'type': 'success',
+                'sticky': False,
+            }
+        return {'type': 'ir.actions.client', 'tag': 'display_notification', 'params': params}
+
+    @api.model
+    def _cron_ups_rerate_quotations(self):
+        """ Called by cron, re-rates all the UPS quotations. """
+        self.search([('state', 'in', ('draft', 'sent')), ('carrier_id.delivery_type', '=', 'ups')])._ups_rerate()
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super(SaleOrderLine, self).create(vals_list)
+        lines.filtered(lambda line: not line.is_delivery).mapped('order_id')._ups_schedule_rate_prefetch()
+        return lines
+
+    def write(self, vals):
+        res = super(SaleOrderLine, self).write(vals)
+        if UPS_LINE_FIELDS.intersection(vals):
+            self.filtered(lambda line: not line.is_delivery).mapped('order_id')._ups_schedule_rate_prefetch()
+        return res
+
+    def unlink(self):
+        orders = self.filtered(lambda line: not line.is_delivery).mapped('order_id')
+        res = super(SaleOrderLine, self).unlink()
+        orders.exists()._ups_schedule_rate_prefetch()
+        return res
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import logging
+import tempfile
+import threading
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+
+from .ups_executor import get_executor
+from .ups_label import LabelWriter
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of shipments sent concurrently to UPS by a worker
+SHIP_WORKERS = 4
+# Size of the labels of a wave kept in memory before spilling them to a file
+SPOOL_SIZE = 1024 * 1024
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    def _ups_send_shipping_bulk(self):
+        """ Validate the UPS pickings of self and create their shipments.
+
+            The ProcessShipment requests are all prepared first, then sent
+            concurrently on a bounded thread pool. Each picking is then
+            validated with its shipment in its own savepoint and committed right
+            away, as a shipment created at UPS cannot be rolled back: a failing
+            picking does not prevent the others from being shipped, and its
+            shipment is voided.
+
+            :return: a tuple (errors, labels) where errors maps the pickings that
+                     failed to their error message, and labels maps each label
+                     file type to the LabelWriter holding the document of the
+                     shipped pickings, in a temporary file the caller closes
+        """
+        pickings = self.filtered(lambda p: p.carrier_id.delivery_type == 'ups' and p.state not in ('done', 'cancel'))
+        # immediate transfers ship everything that is reserved, see
+        # ProviderUPS._ups_prepare_shipping
+        immediate = pickings.filtered(lambda p: not any(p.move_line_ids.mapped('qty_done')))
+
+        errors = {}
+        for carrier in pickings.mapped('carrier_id'):
+            carrier_pickings = pickings.filtered(lambda p: p.carrier_id == carrier)
+            for picking_id, error in carrier._ups_check_required_values(carrier_pickings).items():
+                if error:
+                    errors[self.browse(picking_id)] = error
+
+        executor = get_executor('ship', SHIP_WORKERS)
+        futures = {}
+        for picking in pickings.filtered(lambda p: p not in errors):
+            try:
+                futures[picking] = executor.submit(picking.carrier_id._ups_prepare_shipping(picking))
+            except UserError as e:
+                errors[picking] = e.name
+
+        results = {}
+        for picking, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                _logger.exception("UPS shipment of picking %s failed", picking.name)
+                result = {'error_message': str(e)}
+            if result.get('error_message'):
+                errors[picking] = result['error_message']
+            else:
+                results[picking] = result
+
+        labels = {}
+        # the labels are converted a few pickings ahead of the one validated
+        converted = self.env['delivery.carrier']._ups_convert_labels(results.values())
+        for picking, result in zip(results, converted):
+            try:
+                with self.env.cr.savepoint():
+                    if picking in immediate:
+                        for move_line in picking.move_line_ids:
+                            move_line.qty_done = move_line.product_uom_qty
+                    picking._ups_validate_shipped(result)
+            except Exception as e:
+                _logger.exception("UPS shipment %s created but picking %s could not be validated",
+                                  result['tracking_ref'], picking.name)
+                errors[picking] = picking._ups_void_unvalidated_shipment(result['tracking_ref'], e)
+                continue
+            finally:
+                # only the document of the whole wave keeps the labels
+                label_binary_data = result.pop('label_binary_data')
+                del result['label_images']
+            writer = labels.get(result['label_file_type'])
+            if writer is None:
+                writer = labels[result['label_file_type']] = LabelWriter(
+                    tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE), result['label_file_type'])
+            for label in label_binary_data.values():
+                writer.write(label)
+            if not getattr(threading.currentThread(), 'testing', False):
+                self.env.cr.commit()
+        for writer in labels.values():
+            writer.close()
+
+        for picking, error in errors.items():
+            picking.message_post(body=_("UPS shipment failed: %s") % error)
+        return errors, labels
+
+    def _ups_validate_shipped(self, result):
+        """ Validate the picking with the shipment UPS created for it, see
+            ProviderUPS.ups_send_shipping, going through the checks of the
+            Validate button. Missing quantities are left in a backorder, any
+            other wizard the validation asks for raises.
+        """
+        self.ensure_one()
+        res = self.with_context(ups_prefetched_shipping={self.id: result}, skip_immediate=True,
+                                skip_backorder=True, skip_sms=True).button_validate()
+        if isinstance(res, dict):
+            raise UserError(_("The transfer must be validated manually (%s).") % (
+                res.get('name') or res.get('res_model')))
+
+    def _ups_void_unvalidated_shipment(self, tracking_ref, error):
+        """ Void the shipment created at UPS for self when the picking could
+            not be validated, and return the error message of the picking.
+        """
+        carrier = self.carrier_id
+        try:
+            result = carrier._ups_get_request().prepare_cancel_shipment(carrier._ups_get_void_number(tracking_ref))()
+        except Exception as e:
+            _logger.exception("UPS void of shipment %s failed", tracking_ref)
+            result = {'error_message': str(e)}
+        if result.get('error_message'):
+            return _("Shipment %s was created but the transfer could not be validated, and the shipment could not "
+                     "be voided (%s):\n%s") % (tracking_ref, result['error_message'], error)
+        return _("Shipment %s was voided as the transfer could not be validated:\n%s") % (tracking_ref, error)
+
+    def _ups_cancel_shipment_bulk(self):
+        """ Void the UPS shipments of self, see ProviderUPS._ups_void_shipments.
+            Voided pickings are committed right away, as UPS cannot undo a void.
+
+            :return: a dict mapping the pickings that failed to their error message
+        """
+        pickings = self.filtered(lambda p: p.carrier_id.delivery_type == 'ups' and p.carrier_tracking_ref)
+        errors = {}
+        for carrier in pickings.mapped('carrier_id'):
+            report = carrier._ups_void_shipments(pickings.filtered(lambda p: p.carrier_id == carrier))
+            errors.update((self.browse(picking_id), error) for picking_id, error in report.items() if error)
+            if not getattr(threading.currentThread(), 'testing', False):
+                self.env.cr.commit()
+        return errors
+
+    def action_ups_cancel_shipment_bulk(self):
+        errors = self._ups_cancel_shipment_bulk()
+        if errors:
+            raise UserError("\n".join("%s: %s" % (picking.name, error) for picking, error in errors.items()))
+        return True
+
+    def action_ups_send_shipping_bulk(self):
+        errors, labels = self._ups_send_shipping_bulk()
+        if not labels:
+            raise UserError("\n".join("%s: %s" % (picking.name, error) for picking, error in errors.items()) or
+                            _("There is no UPS transfer to ship."))
+
+        attachments = self.env['ir.attachment']
+        prefix = fields.Datetime.now().strftime('%Y%m%d%H%M%S')
+        for label_file_type, writer in labels.items():
+            with writer.fileobj as fileobj:
+                if label_file_type == 'GIF':
+                    name, mimetype = '%s-LabelsUPS.pdf' % prefix, 'application/pdf'
+                else:
+                    # printer languages are sent to the printer as a single job
+                    name, mimetype = '%s-LabelsUPS.%s' % (prefix, label_file_type), 'text/plain'
+                fileobj.seek(0)
+                # stored as is in the filestore, without a base64 copy of the document
+                attachments |= attachments.sudo().create({
+                    'name': name,
+                    'raw': fileobj.read(),
+                    'mimetype': mimetype,
+                })
+
+        if len(attachments) == 1:
+            return {
+                'type': 'ir.actions.act_url',
+                'url': '/web/content/%s?download=true' % attachments.id,
+                'target': 'self',
+            }
+        return {
+            'name': _('UPS Labels'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'ir.attachment',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', attachments.ids)],
+        }
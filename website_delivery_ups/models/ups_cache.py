@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+
+class LRUCache():
+    """ Thread-safe, size bounded cache whose entries expire after a TTL.
+
+        The least recently used entry is evicted once ``max_size`` is reached.
+        Hits and misses are counted in ``stats``.
+    """
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight():
+    """ Coalesce the concurrent calls of a function sharing the same key: the
+        first caller runs it, the callers arriving meanwhile wait for its
+        result (or exception) instead of running it again.
+
+        Shared and leading calls are counted in ``stats``.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'shared': 0}
+
+    def do(self, key, func, timeout=None):
+        """ Return func(), or the result of the call of func running for the
+            same key. A caller waiting more than ``timeout`` seconds for it
+            runs func itself.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self.stats['leaders' if leader else 'shared'] += 1
+        if not leader:
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                return func()
+
+        try:
+            result = func()
+        except Exception as e:
+            self._done(key)
+            future.set_exception(e)
+            raise
+        self._done(key)
+        future.set_result(result)
+        return result
+
+    def _done(self, key):
+        # later calls run func again, with the data of their time
+        with self._lock:
+            del self._calls[key]
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers):
+    """ Return the thread pool ``name`` of the current process, creating it on
+        first use. Pools are never shared with a parent process: a forked worker
+        gets its own.
+    """
+    key = (name, os.getpid())
+    executor = _executors.get(key)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(key)
+            if executor is None:
+                executor = _executors[key] = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='ups_%s' % name)
+    return executor
+
+
+class RateLimiter():
+    """ Space out the calls of many threads to at most ``rate`` per second """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def get_rate_limiter(name, rate):
+    """ Return the rate limiter ``name`` of the current process, see get_executor """
+    key = ('limiter', name, os.getpid())
+    limiter = _executors.get(key)
+    if limiter is None:
+        with _executors_lock:
+            limiter = _executors.get(key)
+            if limiter is None:
+                limiter = _executors[key] = RateLimiter(rate)
+    return limiter
+
+
+class Scheduler():
+    """ Call functions once their delay is over, from a single background
+        thread. Functions must be quick, e.g. submit a job to an executor.
+    """
+
+    def __init__(self, name):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='ups_%s' % name, daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay, func):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), func))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                __, __, func = heapq.heappop(self._heap)
+            try:
+                func()
+            except Exception:
+                _logger.exception("Scheduled call %s failed", func)
+
+
+def get_scheduler(name):
+    """ Return the scheduler ``name`` of the current process, see get_executor """
+    key = ('scheduler', name, os.getpid())
+    scheduler = _executors.get(key)
+    if scheduler is None:
+        with _executors_lock:
+            scheduler = _executors.get(key)
+            if scheduler is None:
+                scheduler = _executors[key] = Scheduler(name)
+    return scheduler
+
+
+class CircuitBreaker():
+    """ Fail fast while a remote service is down.
+
+        Once ``threshold`` calls in a row failed, the circuit opens: calls are
+        refused for ``reset_timeout`` seconds. A single trial call is then let
+        through, which closes the circuit if it succeeds or opens it again
+        otherwise.
+    """
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def retry_delay(self):
+        """ Return the number of seconds before a trial call is let through """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self):
+        """ Return whether a call may be sent; report its outcome to success,
+            failure or abort
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() < self.opened_at + self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                _logger.info("%s answers again, closing its circuit", self.name)
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def abort(self):
+        """ Report a call whose outcome says nothing about the remote service """
+        with self._lock:
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    _logger.warning("%s failed %s times in a row, failing fast for %s seconds",
+                                    self.name, self.failures, self.reset_timeout)
+                self.opened_at = time.monotonic()
+
+
+def get_circuit_breaker(name, threshold, reset_timeout):
+    """ Return the circuit breaker ``name`` of the current process, see get_executor """
+    key = ('breaker', name, os.getpid())
+    breaker = _executors.get(key)
+    if breaker is None:
+        with _executors_lock:
+            breaker = _executors.get(key)
+            if breaker is None:
+                breaker = _executors[key] = CircuitBreaker(name, threshold, reset_timeout)
+    return breaker
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import base64
+import collections
+import io
+import zlib
+
+from .ups_executor import get_executor
+
+# Maximum number of threads converting labels
+LABEL_WORKERS = 4
+# Under this number of labels, converting them in the current thread is faster
+LABEL_POOL_THRESHOLD = 4
+
+# A GIF label, decoded and ready to be written as a PDF page
+LabelPage = collections.namedtuple('LabelPage', 'width height colorspace data')
+
+
+def convert_label(image64, label_file_type='GIF'):
+    """ Decode a label returned by UPS. GIF labels are decoded into a
+        LabelPage, the printer formats (ZPL, EPL, SPL) are returned as is.
+    """
+    img_decoded = base64.b64decode(image64)
+    if label_file_type != 'GIF':
+        return img_decoded
+    from PIL import Image
+    image = Image.open(io.BytesIO(img_decoded))
+    palette = image.getpalette() if image.mode == 'P' else None
+    if image.mode in ('1', 'L') or (palette and palette[0::3] == palette[1::3] == palette[2::3]):
+        # UPS labels are black and white, keep a single byte per pixel
+        image, colorspace = image.convert('L'), 'DeviceGray'
+    else:
+        image, colorspace = image.convert('RGB'), 'DeviceRGB'
+    return LabelPage(image.width, image.height, colorspace, zlib.compress(image.tobytes()))
+
+
+def convert_labels(labels):
+    """ Convert many labels, see convert_label. Large batches are converted on
+        a thread pool, a few labels ahead of the one consumed: PIL and zlib
+        release the GIL while decoding and compressing.
+
+        :param labels: iterable of (base64 encoded label, label file type)
+        :return: an iterator over the converted labels, in the same order
+    """
+    labels = iter(labels)
+    pending = collections.deque()
+    for label in labels:
+        pending.append(label)
+        if len(pending) >= LABEL_POOL_THRESHOLD:
+            break
+    else:
+        for image64, label_file_type in pending:
+            yield convert_label(image64, label_file_type)
+        return
+
+    executor = get_executor('label', LABEL_WORKERS)
+    futures = collections.deque(executor.submit(convert_label, *label) for label in pending)
+    for label in labels:
+        if len(futures) >= LABEL_WORKERS * 2:
+            yield futures.popleft().result()
+        futures.append(executor.submit(convert_label, *label))
+    while futures:
+        yield futures.popleft().result()
+
+
+class LabelWriter():
+    """ Write converted labels into fileobj as a single document, as they come:
+        a multi-page PDF for GIF labels, the concatenated printer commands
+        otherwise. Pages are written right away, only their offsets are kept.
+    """
+
+    def __init__(self, fileobj, label_file_type='GIF'):
+        self.fileobj = fileobj
+        self.label_file_type = label_file_type
+        self.pos = 0
+        self.offsets = {}
+        self.pages = []
+        if label_file_type == 'GIF':
+            self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.pos += len(data)
+
+    def _write_object(self, obj_id, content, stream=None):
+        self.offsets[obj_id] = self.pos
+        self._write(b'%d 0 obj\n' % obj_id + content)
+        if stream is not None:
+            self._write(b'\nstream\n' + stream + b'\nendstream')
+        self._write(b'\nendobj\n')
+
+    def write(self, label):
+        if self.label_file_type != 'GIF':
+            self._write(label)
+            return
+        # objects 1 and 2 are the catalog and the page tree, written last
+        image_id = 3 + 3 * len(self.pages)
+        self._write_object(image_id, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /%s '
+                                     b'/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>' % (
+                                         label.width, label.height, label.colorspace.encode(), len(label.data)),
+                           label.data)
+        # one pixel per point, as PIL does
+        content = b'q %d 0 0 %d 0 0 cm /Im0 Do Q' % (label.width, label.height)
+        self._write_object(image_id + 1, b'<< /Length %d >>' % len(content), content)
+        self._write_object(image_id + 2, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                                         b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>' % (
+                                             label.width, label.height, image_id, image_id + 1))
+        self.pages.append(image_id + 2)
+
+    def close(self):
+        if self.label_file_type != 'GIF':
+            return
+        self._write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        self._write_object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page_id for page_id in self.pages), len(self.pages)))
+        xref = self.pos
+        size = max(self.offsets) + 1
+        self._write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for obj_id in range(1, size):
+            self._write(b'%010d 00000 n \n' % self.offsets[obj_id])
+        self._write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref))
+
+
+def write_labels(labels, label_file_type, fileobj):
+    """ Write converted labels into fileobj as a single document, see LabelWriter """
+    with LabelWriter(fileobj, label_file_type) as writer:
+        for label in labels:
+            writer.write(label)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import logging
+import os
+import queue
+import re
+import threading
+
+from lxml import etree
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of envelopes waiting to be written, newer ones are dropped
+LOG_QUEUE_SIZE = 1000
+# Maximum number of envelopes written in one transaction
+LOG_BATCH_SIZE = 100
+# Operations whose envelopes are sampled, the others are always logged
+SAMPLED_OPERATIONS = ('ProcessRate', 'ProcessTimeInTransit')
+# Text nodes this long and looking like base64 (labels) are truncated
+BLOB_MIN_LENGTH = 256
+BLOB_KEEP_LENGTH = 64
+
+_CREDENTIALS_RE = re.compile(r'(<(?:[\w-]+:)?(?:Username|Password|AccessLicenseNumber)>)[^<]*(</)')
+_BLOB_RE = re.compile(r'>([A-Za-z0-9+/=\r\n]{%d,})<' % BLOB_MIN_LENGTH)
+_FAULT_PATH = '{http://schemas.xmlsoap.org/soap/envelope/}Body/{http://schemas.xmlsoap.org/soap/envelope/}Fault'
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def redact(envelope):
+    """ Serialize a SOAP envelope for the logs, without the UPS credentials
+        and with the base64 label images truncated.
+    """
+    xml = etree.tostring(envelope, encoding='unicode')
+    xml = _CREDENTIALS_RE.sub(r'\1***\2', xml)
+    return _BLOB_RE.sub(lambda m: '>%s...[%d characters]<' % (m.group(1)[:BLOB_KEEP_LENGTH], len(m.group(1))), xml)
+
+
+def is_fault(envelope):
+    return envelope.find(_FAULT_PATH) is not None
+
+
+class LogWriter():
+    """ Write SOAP envelopes, serialized by redact, to ir.logging from a
+        background thread, with a cursor of its own: storing them is not done
+        while the request waits, and works from any thread.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='ups_log_writer', daemon=True)
+        self.thread.start()
+
+    def put(self, dbname, message, func):
+        try:
+            self.queue.put_nowait((dbname, message, func))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _pop_dropped(self):
+        """ Return the number of envelopes dropped since the last call """
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def _run(self):
+        while True:
+            entries = [self.queue.get()]
+            while len(entries) < LOG_BATCH_SIZE:
+                try:
+                    entries.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(entries)
+            except Exception:
+                _logger.exception("Could not write %s UPS envelopes to the logs", len(entries))
+            dropped = self._pop_dropped()
+            if dropped:
+                _logger.warning("%s UPS envelopes were not logged, the queue of the log writer was full", dropped)
+
+    def _write(self, entries):
+        vals_by_db = {}
+        for dbname, message, func in entries:
+            vals_by_db.setdefault(dbname, []).append({
+                'name': 'delivery.carrier',
+                'type': 'server',
+                'dbname': dbname,
+                'level': 'DEBUG',
+                'message': message,
+                'path': 'ups',
+                'func': func,
+                'line': 1,
+            })
+        for dbname, vals_list in vals_by_db.items():
+            with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                api.Environment(cr, SUPERUSER_ID, {})['ir.logging'].create(vals_list)
+
+
+def get_log_writer():
+    """ Return the log writer of the current process, starting it on first use """
+    writer = _writers.get(os.getpid())
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(os.getpid())
+            if writer is None:
+                writer = _writers[os.getpid()] = LogWriter()
+    return writer
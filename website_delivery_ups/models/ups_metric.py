@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import json
+from datetime import timedelta
+
+from odoo import api, fields, models
+from odoo.tools.sql import create_unique_index, index_exists
+
+from .ups_metrics_recorder import BUCKETS, new_histogram, percentile
+
+PHASES = [
+    ('quote', 'Quote (total)'),
+    ('wsdl', 'WSDL and client'),
+    ('build', 'Request building'),
+    ('serialize', 'Serialization'),
+    ('network', 'Network'),
+    ('parse', 'Response parsing'),
+    ('convert', 'Currency conversion'),
+]
+
+# Columns identifying a row, NULL being a value of its own
+KEY_COLUMNS = ['date', 'phase', "(COALESCE(operation, ''))", '(COALESCE(carrier_id, 0))',
+               "(COALESCE(service_type, ''))", "(COALESCE(error_code, ''))"]
+
+# Percentiles over the last bucket have no upper bound to report
+OPEN_PERCENTILE_HELP = "Upper bound of the histogram bucket holding the percentile, " \
+                       "empty when it is over the last bucket (%d ms)." % BUCKETS[-1]
+
+
+def _percentile_summary(histogram, q):
+    """ Percentile of the histogram, "> last bound" when in the open bucket """
+    value = percentile(histogram, q)
+    return '> %d' % BUCKETS[-1] if value is None else value
+
+
+class UPSMetric(models.Model):
+    """ Duration of the phases of the UPS calls, aggregated per hour and per
+        operation, carrier, service type and UPS error code. Each worker
+        merges its own measures every few seconds, see ups_metrics_recorder.
+    """
+    _name = 'ups.metric'
+    _description = 'UPS Call Metrics'
+    _order = 'date desc, phase, operation'
+    _log_access = False
+
+    date = fields.Datetime(required=True, readonly=True, index=True)
+    phase = fields.Selection(PHASES, required=True, readonly=True)
+    operation = fields.Char(readonly=True)
+    carrier_id = fields.Many2one('delivery.carrier', ondelete='cascade', readonly=True)
+    service_type = fields.Char(readonly=True)
+    error_code = fields.Char(readonly=True)
+    count = fields.Integer(readonly=True)
+    duration_total = fields.Float(string='Total (ms)', readonly=True)
+    duration_avg = fields.Float(string='Average (ms)', readonly=True, group_operator='avg')
+    p50 = fields.Float(string='p50 (ms)', readonly=True, group_operator='max', help=OPEN_PERCENTILE_HELP)
+    p95 = fields.Float(string='p95 (ms)', readonly=True, group_operator='max', help=OPEN_PERCENTILE_HELP)
+    p99 = fields.Float(string='p99 (ms)', readonly=True, group_operator='max', help=OPEN_PERCENTILE_HELP)
+    count_over = fields.Integer(string='Over %d s' % (BUCKETS[-1] // 1000), readonly=True,
+                                help="Number of calls slower than the last bucket of the histogram.")
+    histogram = fields.Char(readonly=True)
+
+    def init(self):
+        if not index_exists(self.env.cr, 'ups_metric_key_uniq'):
+            self._merge_duplicates()
+            create_unique_index(self.env.cr, 'ups_metric_key_uniq', self._table, KEY_COLUMNS)
+
+    def _merge_duplicates(self):
+        """ Merge the rows sharing the same key, left by concurrent flushes of
+            the workers before the key was unique.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            SELECT array_agg(id ORDER BY id)
+              FROM ups_metric
+          GROUP BY %s
+            HAVING count(*) > 1
+        """ % ', '.join(KEY_COLUMNS))
+        for ids in [row[0] for row in cr.fetchall()]:
+            cr.execute("SELECT count, duration_total, histogram FROM ups_metric WHERE id IN %s", (tuple(ids),))
+            count, total, histogram = 0, 0.0, new_histogram()
+            for row_count, row_total, row_histogram in cr.fetchall():
+                count += row_count
+                total += row_total
+                histogram = [a + b for a, b in zip(histogram, json.loads(row_histogram))]
+            self._update_statistics(ids[0], count, total, histogram)
+            cr.execute("DELETE FROM ups_metric WHERE id IN %s", (tuple(ids[1:]),))
+
+    def _update_statistics(self, metric_id, count, total, histogram):
+        self.env.cr.execute("""
+            UPDATE ups_metric
+               SET count = %s, duration_total = %s, duration_avg = %s, p50 = %s, p95 = %s, p99 = %s,
+                   count_over = %s, histogram = %s
+             WHERE id = %s
+        """, (count, total, total / count if count else 0.0, percentile(histogram, 50), percentile(histogram, 95),
+              percentile(histogram, 99), histogram[-1], json.dumps(histogram), metric_id))
+
+    @api.model
+    def _merge_metrics(self, entries):
+        """ Add the given measures to the rows of the current hour. Workers
+            flush concurrently: each row is upserted, then its statistics are
+            computed from the merged histogram.
+
+            :param entries: list of ((phase, operation, carrier id, service
+                            type, error code), (count, total ms, histogram))
+        """
+        cr = self.env.cr
+        date = fields.Datetime.now().replace(minute=0, second=0, microsecond=0)
+        carrier_ids = {labels[2] for labels, values in entries if labels[2]}
+        existing = set(self.env['delivery.carrier'].browse(carrier_ids).exists().ids)
+        # always lock the rows in the same order, so that workers never deadlock
+        entries = sorted(entries, key=lambda entry: [str(label or '') for label in entry[0]])
+        for (phase, operation, carrier_id, service_type, error_code), (count, total, histogram) in entries:
+            carrier_id = carrier_id in existing and carrier_id or None
+            cr.execute("""
+                INSERT INTO ups_metric AS m (date, phase, operation, carrier_id, service_type, error_code,
+                                             count, duration_total, histogram)
+                     VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)
+                ON CONFLICT (%s) DO UPDATE
+                        SET count = m.count + EXCLUDED.count,
+                            duration_total = m.duration_total + EXCLUDED.duration_total,
+                            histogram = (
+                                SELECT json_agg(a.value::bigint + b.value::bigint ORDER BY i)::text
+                                  FROM json_array_elements_text(m.histogram::json) WITH ORDINALITY a(value, i)
+                                  JOIN json_array_elements_text(EXCLUDED.histogram::json) WITH ORDINALITY b(value, i)
+                                 USING (i))
+                  RETURNING id, count, duration_total, histogram
+            """ % ', '.join(KEY_COLUMNS), (date, phase, operation, carrier_id, service_type, error_code, count,
+                                            total, json.dumps(histogram)))
+            metric_id, count, total, histogram = cr.fetchone()
+            self._update_statistics(metric_id, count, total, json.loads(histogram))
+
+    @api.model
+    def _get_summary(self, minutes=60):
+        """ Return the metrics of the last minutes, merged per phase, operation,
+            carrier, service type and error code, as a list of dicts.
+            Percentiles over the last bucket are given as "> <bound>".
+        """
+        since = fields.Datetime.now() - timedelta(minutes=minutes)
+        # rows are hourly, take the one of the current hour whole
+        since = since.replace(minute=0, second=0, microsecond=0)
+        self.env.cr.execute("""
+            SELECT phase, operation, carrier_id, service_type, error_code, count, duration_total, histogram
+              FROM ups_metric
+             WHERE date >= %s
+        """, (since,))
+        merged = {}
+        for phase, operation, carrier_id, service_type, error_code, count, total, histogram in self.env.cr.fetchall():
+            entry = merged.setdefault((phase, operation, carrier_id, service_type, error_code),
+                                      [0, 0.0, new_histogram()])
+            entry[0] += count
+            entry[1] += total
+            entry[2] = [a + b for a, b in zip(entry[2], json.loads(histogram))]
+        return [{
+            'phase': phase,
+            'operation': operation,
+            'carrier_id': carrier_id or False,
+            'service_type': service_type,
+            'error_code': error_code,
+            'count': count,
+            'avg_ms': total / count if count else 0.0,
+            'p50_ms': _percentile_summary(histogram, 50),
+            'p95_ms': _percentile_summary(histogram, 95),
+            'p99_ms': _percentile_summary(histogram, 99),
+            'count_over': histogram[-1],
+            'buckets_ms': list(BUCKETS),
+            'histogram': histogram,
+        } for (phase, operation, carrier_id, service_type, error_code), (count, total, histogram) in merged.items()]
+
+    @api.model
+    def _gc_old_metrics(self, days=30):
+        """ Called by cron, drops the metrics older than the given days. """
+        self.env.cr.execute("DELETE FROM ups_metric WHERE date < %s",
+                            (fields.Datetime.now() - timedelta(days=days),))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds; the last one is open
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+# Seconds between two writes of the metrics of a process to the database
+FLUSH_INTERVAL = 30
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def new_histogram():
+    return [0] * (len(BUCKETS) + 1)
+
+
+def percentile(histogram, q):
+    """ Estimate the q-th percentile (0-100) of a histogram, in milliseconds, as
+        the upper bound of the bucket holding it. Return None when it falls in
+        the open bucket above BUCKETS[-1], which has no upper bound.
+    """
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    rank = total * q / 100.0
+    seen = 0
+    for index, count in enumerate(histogram[:len(BUCKETS)]):
+        seen += count
+        if seen >= rank:
+            return float(BUCKETS[index])
+    return None
+
+
+class MetricsRecorder():
+    """ Per-process aggregation of the duration of the phases of the UPS
+        calls. Durations are summed up in histograms in memory, then merged
+        into the ups.metric table of their database every FLUSH_INTERVAL
+        seconds by a background thread.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='ups_metrics_recorder', daemon=True)
+        self.thread.start()
+
+    def record(self, dbname, phase, duration, operation='', carrier_id=False, service_type='', error_code=''):
+        key = (dbname, phase, operation, carrier_id or False, service_type or '', error_code or '')
+        milliseconds = duration * 1000.0
+        index = bisect.bisect_left(BUCKETS, milliseconds)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._data[key] = [0, 0.0, new_histogram()]
+            entry[0] += 1
+            entry[1] += milliseconds
+            entry[2][index] += 1
+
+    def take(self):
+        """ Return the metrics recorded since the last call, and reset them """
+        with self._lock:
+            data, self._data = self._data, {}
+        return data
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                _logger.exception("Could not write the UPS metrics")
+
+    def flush(self):
+        by_db = {}
+        for (dbname, *labels), values in self.take().items():
+            by_db.setdefault(dbname, []).append((labels, values))
+        for dbname, entries in by_db.items():
+            with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                api.Environment(cr, SUPERUSER_ID, {})['ups.metric']._merge_metrics(entries)
+
+
+def get_recorder():
+    """ Return the metrics recorder of the current process, starting it on first use """
+    recorder = _recorders.get(os.getpid())
+    if recorder is None:
+        with _recorders_lock:
+            recorder = _recorders.get(os.getpid())
+            if recorder is None:
+                recorder = _recorders[os.getpid()] = MetricsRecorder()
+    return recorder
+
+
+def record(dbname, phase, duration, **labels):
+    """ Record the duration in seconds of a phase; labels are the operation,
+        carrier_id, service_type and error_code. Nothing is recorded without
+        a database.
+    """
+    if dbname:
+        get_recorder().record(dbname, phase, duration, **labels)
+
+
+@contextmanager
+def measure(dbname, phase, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(dbname, phase, time.perf_counter() - start, **labels)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import math
+
+# Tolerance on the capacities, so that float rounding never opens a new package
+EPSILON = 1e-9
+
+
+def _fill_box(order, weights, volumes, quantities, max_weight, max_volume):
+    """ Fill boxes of the given capacity with the items taken in ``order``
+        (next fit: a new box is opened when the current one is full).
+
+        :return: the list of (weight, volume) of the boxes, or None if an item
+                 does not fit in an empty box
+    """
+    boxes = []
+    box_weight = box_volume = 0.0
+    for i in order:
+        weight, volume, qty = weights[i], volumes[i], quantities[i]
+        if (max_weight and weight > max_weight + EPSILON) or (max_volume and volume > max_volume + EPSILON):
+            return None
+        while qty > 0:
+            fit = qty
+            if max_weight and weight:
+                fit = min(fit, math.floor((max_weight - box_weight) / weight + EPSILON))
+            if max_volume and volume:
+                fit = min(fit, math.floor((max_volume - box_volume) / volume + EPSILON))
+            if fit <= 0:
+                boxes.append((box_weight, box_volume))
+                box_weight = box_volume = 0.0
+                continue
+            box_weight += fit * weight
+            box_volume += fit * volume
+            qty -= fit
+    if box_weight or box_volume or not boxes:
+        boxes.append((box_weight, box_volume))
+    return boxes
+
+
+def plan_packages(weights, volumes, quantities, packagings):
+    """ Split a list of items into as few packages as possible.
+
+        Items are given as parallel sequences (e.g. arrays) of unit weight, unit
+        volume and quantity. Each packaging is a (max weight, volume) capacity,
+        0 meaning unlimited. Items are packed heaviest first, for each packaging,
+        and the packaging giving the fewest packages wins; on a tie, the
+        smallest one.
+
+        :return: a tuple (packaging index, list of package weights), the index
+                 being None if some item does not fit in any packaging
+    """
+    order = sorted(range(len(weights)), key=lambda i: (weights[i], volumes[i]), reverse=True)
+    total_weight = sum(w * q for w, q in zip(weights, quantities))
+    total_volume = sum(v * q for v, q in zip(volumes, quantities))
+
+    def lower_bound(packaging):
+        max_weight, max_volume = packaging
+        return max(1, max_weight and math.ceil(total_weight / max_weight - EPSILON) or 1,
+                   max_volume and math.ceil(total_volume / max_volume - EPSILON) or 1)
+
+    best = None
+    # try the most promising packagings first, and skip those that cannot beat the best one
+    for index in sorted(range(len(packagings)), key=lambda i: lower_bound(packagings[i])):
+        max_weight, max_volume = packagings[index]
+        if best is not None and lower_bound(packagings[index]) > best[0][0]:
+            break
+        boxes = _fill_box(order, weights, volumes, quantities, max_weight, max_volume)
+        if boxes is None:
+            continue
+        key = (len(boxes), max_volume or float('inf'), max_weight or float('inf'))
+        if best is None or key < best[0]:
+            best = (key, index, boxes)
+    if best is None:
+        return None, []
+    return best[1], [weight for weight, volume in best[2]]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from odoo import api, fields, models
+
+
+class UPSRateCache(models.Model):
+    """ Database tier of the UPS rate quote cache, shared by all the workers.
+
+        Entries store the raw UPS answer (price and currency as returned by
+        ProcessRate), before any currency conversion.
+    """
+    _name = 'ups.rate.cache'
+    _description = 'UPS Rate Quote Cache'
+    _log_access = False
+
+    fingerprint = fields.Char(required=True, index=True, readonly=True)
+    carrier_id = fields.Many2one('delivery.carrier', ondelete='cascade', readonly=True)
+    price = fields.Char(readonly=True)
+    currency_code = fields.Char(readonly=True)
+    date = fields.Datetime(required=True, readonly=True, default=fields.Datetime.now)
+
+    _sql_constraints = [
+        ('fingerprint_uniq', 'unique(fingerprint)', 'A shipment fingerprint can only be cached once.'),
+    ]
+
+    @api.model
+    def _get_quote(self, fingerprint, ttl):
+        self.env.cr.execute("""
+            SELECT price, currency_code
+              FROM ups_rate_cache
+             WHERE fingerprint = %s
+               AND date > (now() at time zone 'UTC') - %s * interval '1 second'
+        """, (fingerprint, ttl))
+        row = self.env.cr.fetchone()
+        return row and {'price': row[0], 'currency_code': row[1]} or None
+
+    @api.model
+    def _set_quote(self, fingerprint, carrier, result):
+        """ Cache the quote of a shipment. To be called in a short transaction
+            of its own, see ProviderUPS._ups_set_cached_rate: under REPEATABLE
+            READ, updating a row committed by another worker after the
+            transaction started raises a serialization error.
+        """
+        # upsert, other workers may cache the same shipment concurrently
+        self.env.cr.execute("""
+            INSERT INTO ups_rate_cache (fingerprint, carrier_id, price, currency_code, date)
+                 VALUES (%s, %s, %s, %s, now() at time zone 'UTC')
+            ON CONFLICT (fingerprint) DO UPDATE
+                    SET price = EXCLUDED.price,
+                        currency_code = EXCLUDED.currency_code,
+                        date = EXCLUDED.date
+        """, (fingerprint, carrier.id, str(result['price']), result['currency_code']), log_exceptions=False)
+
+    @api.model
+    def _gc_expired_quotes(self):
+        """ Called by cron, drops the quotes older than the longest cache or
+            stale quote duration.
+        """
+        carriers = self.env['delivery.carrier'].sudo().search([('delivery_type', '=', 'ups')])
+        ttl = max(carriers.mapped('ups_rate_cache_ttl') + carriers.mapped('ups_rate_stale_ttl') or [0])
+        self.env.cr.execute("""
+            DELETE FROM ups_rate_cache
+                  WHERE date < (now() at time zone 'UTC') - %s * interval '1 second'
+        """, (ttl,))
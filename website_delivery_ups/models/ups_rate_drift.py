@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+
+class UPSRateDrift(models.Model):
+    """ Price estimated from the rate tables of a carrier next to the one UPS
+        quoted for the same shipment, to check the tables are up to date.
+        Recorded for every quote asked to UPS while the carrier has a rate
+        table of the service, see ProviderUPS._ups_record_drift.
+    """
+    _name = 'ups.rate.drift'
+    _description = 'UPS Rate Table Drift'
+    _order = 'date desc'
+    _log_access = False
+
+    date = fields.Datetime(required=True, readonly=True, index=True, default=fields.Datetime.now)
+    carrier_id = fields.Many2one('delivery.carrier', required=True, ondelete='cascade', readonly=True)
+    service_type = fields.Char(readonly=True)
+    order_id = fields.Many2one('sale.order', ondelete='set null', readonly=True)
+    origin_zip = fields.Char(readonly=True)
+    destination_zip = fields.Char(readonly=True)
+    zone = fields.Integer(readonly=True, group_operator=False)
+    currency_code = fields.Char(readonly=True)
+    estimate = fields.Float(readonly=True)
+    live = fields.Float(string='UPS Quote', readonly=True)
+    difference = fields.Float(readonly=True, help="UPS quote minus the estimate.")
+    difference_percent = fields.Float(string='Difference (%)', readonly=True, group_operator='avg')
+    abs_difference_percent = fields.Float(string='Absolute Difference (%)', readonly=True, group_operator='avg')
+
+    @api.model
+    def _record(self, carrier, service_type, order, table, estimate, live):
+        difference = live - estimate
+        percent = live and difference / live * 100.0 or 0.0
+        return self.create({
+            'carrier_id': carrier.id,
+            'service_type': service_type,
+            'order_id': order.id,
+            'origin_zip': order.warehouse_id.partner_id.zip,
+            'destination_zip': order.partner_shipping_id.zip,
+            'zone': table.zone(order.warehouse_id.partner_id.zip, order.partner_shipping_id.zip) or 0,
+            'currency_code': table.currency_code,
+            'estimate': estimate,
+            'live': live,
+            'difference': difference,
+            'difference_percent': percent,
+            'abs_difference_percent': abs(percent),
+        })
+
+    @api.model
+    def _gc_old_drifts(self, days=90):
+        """ Called by cron, drops the comparisons older than the given days. """
+        self.env.cr.execute("DELETE FROM ups_rate_drift WHERE date < %s",
+                            (fields.Datetime.now() - timedelta(days=days),))
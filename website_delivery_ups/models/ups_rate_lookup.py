@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import csv
+import io
+import math
+import re
+from array import array
+from bisect import bisect_left
+
+# Number of 3 digit ZIP code prefixes, the granularity of the UPS zone charts
+ZIP_PREFIXES = 1000
+# Default dimensional weight divisors, per (dimension unit, weight unit)
+DIM_DIVISORS = {('IN', 'LBS'): 139.0, ('CM', 'KGS'): 5000.0}
+# Tolerance on the billable weights, so that float rounding never bills a unit more
+EPSILON = 1e-9
+
+
+def zip_prefix(zip_code):
+    """ Return the 3 digit prefix of a US ZIP code as an int, or None """
+    digits = re.sub(r'\D', '', zip_code or '')
+    return int(digits[:3]) if len(digits) >= 5 else None
+
+
+def _read_csv(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(data))]
+    rows = [row for row in rows if any(row)]
+    if len(rows) < 2:
+        raise ValueError("the file has no data")
+    return [cell.lower() for cell in rows[0]], rows[1:]
+
+
+def _parse_prefixes(cell):
+    """ Return the range of ZIP prefixes of a zone chart cell, e.g. '004-005' """
+    bounds = cell.split('-')
+    if len(bounds) > 2 or not all(bound.isdigit() for bound in bounds):
+        raise ValueError("invalid ZIP prefix %r" % cell)
+    start, end = int(bounds[0][:3]), int(bounds[-1][:3])
+    if start > end:
+        raise ValueError("invalid ZIP prefix range %r" % cell)
+    return range(start, end + 1)
+
+
+def _parse_number(cell):
+    """ Return the number of a cell, ignoring currency signs, or None if it is
+        empty or a dash (not served).
+    """
+    cell = cell.replace(',', '').lstrip('$')
+    if cell in ('', '-', '--'):
+        return None
+    try:
+        return float(cell)
+    except ValueError:
+        raise ValueError("invalid number %r" % cell)
+
+
+def parse_zone_chart(data, service_type):
+    """ Read a UPS zone chart in CSV: an 'origin' and a 'destination' column of
+        ZIP prefixes or prefix ranges (e.g. '004-005'), and the zone of the
+        service, in a 'zone' column or one named after the UPS service code.
+
+        :return: a tuple (origin prefixes, zones): zones is an array of
+                 ZIP_PREFIXES zones per origin, 0 for the destinations not served
+    """
+    header, rows = _read_csv(data)
+    columns = {}
+    for name, candidates in (('origin', ('origin', 'origin zip')),
+                             ('destination', ('destination', 'dest. zip', 'dest zip')),
+                             ('zone', (service_type, 'zone'))):
+        index = next((i for i, cell in enumerate(header) if cell in candidates), None)
+        if index is None:
+            raise ValueError("missing column %r" % name)
+        columns[name] = index
+
+    origins = {}
+    zones = array('H')
+    for line, row in enumerate(rows, 2):
+        try:
+            zone = _parse_number(row[columns['zone']])
+            if not zone:
+                continue
+            for origin in _parse_prefixes(row[columns['origin']]):
+                if origin not in origins:
+                    origins[origin] = len(origins)
+                    zones.extend(array('H', [0]) * ZIP_PREFIXES)
+                offset = origins[origin] * ZIP_PREFIXES
+                for destination in _parse_prefixes(row[columns['destination']]):
+                    zones[offset + destination] = int(zone)
+        except (IndexError, ValueError, OverflowError) as e:
+            raise ValueError("line %s: %s" % (line, e or "missing value"))
+    return origins, zones
+
+
+def parse_rate_sheet(data):
+    """ Read a UPS rate sheet in CSV: a 'weight' column giving the billable
+        weight of each line, then one column per zone giving the price of a
+        package of that weight.
+
+        :return: a tuple (weights, zone columns, prices): weights are sorted,
+                 prices is an array of one line of prices per weight, NaN
+                 where the zone is not served
+    """
+    header, rows = _read_csv(data)
+    if header[0] not in ('weight', 'lbs', 'kgs'):
+        raise ValueError("the first column must be the 'weight'")
+    columns = {}
+    for index, cell in enumerate(header[1:]):
+        match = re.search(r'\d+', cell)
+        if not match:
+            raise ValueError("invalid zone %r" % cell)
+        zone = int(match.group())
+        if zone in columns:
+            # the prices of a line are stored by zone, a repeated zone would shift the ones after it
+            raise ValueError("zone %s is given twice" % zone)
+        columns[zone] = index
+
+    lines = []
+    for line, row in enumerate(rows, 2):
+        try:
+            weight = _parse_number(row[0])
+            if weight is None:
+                raise ValueError("missing weight")
+            prices = [_parse_number(cell) for cell in row[1:len(header)]]
+            if len(prices) < len(header) - 1:
+                raise ValueError("missing prices")
+        except ValueError as e:
+            raise ValueError("line %s: %s" % (line, e))
+        lines.append((weight, [math.nan if price is None else price for price in prices]))
+    lines.sort()
+    weights = array('d', [weight for weight, __ in lines])
+    if any(a == b for a, b in zip(weights, weights[1:])):
+        raise ValueError("a weight is given twice")
+    return weights, columns, array('d', [price for __, prices in lines for price in prices])
+
+
+def billable_weight(weight, dimension, dim_divisor):
+    """ Return the weight UPS bills for a package: the greatest of its actual
+        and dimensional weights, rounded up to the next unit.
+    """
+    if dim_divisor and dimension:
+        volume = (dimension.get('length') or 0) * (dimension.get('width') or 0) * (dimension.get('height') or 0)
+        weight = max(weight, volume / dim_divisor)
+    return max(1, math.ceil(weight - EPSILON))
+
+
+class RateTable():
+    """ Prices of a UPS service, looked up from a zone chart and a rate sheet
+        (see parse_zone_chart and parse_rate_sheet) kept in flat arrays: a
+        quote is a few index computations, without any call to UPS.
+    """
+
+    def __init__(self, zone_chart, rate_sheet, service_type, currency_code, dim_divisor=0.0, fuel_surcharge=0.0,
+                 residential_surcharge=0.0):
+        self.origins, self.zones = parse_zone_chart(zone_chart, service_type)
+        self.weights, self.columns, self.prices = parse_rate_sheet(rate_sheet)
+        self.service_type = service_type
+        self.currency_code = currency_code
+        self.dim_divisor = dim_divisor
+        # percentage added to the prices, and amount added per package to residential deliveries
+        self.fuel_surcharge = fuel_surcharge
+        self.residential_surcharge = residential_surcharge
+
+    def zone(self, origin_zip, destination_zip):
+        """ Return the zone between two US ZIP codes, or None if not served """
+        origin, destination = zip_prefix(origin_zip), zip_prefix(destination_zip)
+        if origin not in self.origins or destination is None:
+            return None
+        return self.zones[self.origins[origin] * ZIP_PREFIXES + destination] or None
+
+    def package_prices(self, zone, weights):
+        """ Return the prices of packages of the given billable weights in a
+            zone, or None if one of them is beyond the rate sheet.
+        """
+        column = self.columns.get(zone)
+        if column is None:
+            return None
+        width = len(self.columns)
+        indexes = [bisect_left(self.weights, weight - EPSILON) for weight in weights]
+        if any(index >= len(self.weights) for index in indexes):
+            return None
+        prices = [self.prices[index * width + column] for index in indexes]
+        if any(math.isnan(price) for price in prices):
+            return None
+        return prices
+
+    def quote(self, origin_zip, destination_zip, packages, residential=False):
+        """ Return the price of a shipment, surcharges included, or None if
+            the tables do not cover it.
+
+            :param packages: list of (weight, dimension, count) of the packages,
+                             in the units of the rate sheet
+        """
+        zone = self.zone(origin_zip, destination_zip)
+        if zone is None:
+            return None
+        prices = self.package_prices(zone, [billable_weight(weight, dimension, self.dim_divisor)
+                                            for weight, dimension, count in packages])
+        if prices is None:
+            return None
+        count = sum(package[2] for package in packages)
+        price = sum(price * package[2] for price, package in zip(prices, packages))
+        price *= 1.0 + self.fuel_surcharge / 100.0
+        if residential:
+            price += self.residential_surcharge * count
+        return round(price, 2)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import base64
+
+from odoo import api, fields, models, _
+from odoo.exceptions import ValidationError
+
+from .ups_rate_lookup import DIM_DIVISORS, RateTable
+
+
+class UPSRateTable(models.Model):
+    """ UPS zone chart and rate sheet of a service, imported as CSV files, to
+        price domestic shipments without calling UPS. The files are compiled
+        into a RateTable once per worker, see ProviderUPS._ups_get_rate_table.
+    """
+    _name = 'ups.rate.table'
+    _description = 'UPS Rate Table'
+    _order = 'carrier_id, service_type'
+
+    def _get_ups_service_types(self):
+        return self.env['delivery.carrier']._get_ups_service_types()
+
+    carrier_id = fields.Many2one('delivery.carrier', required=True, ondelete='cascade',
+                                 domain=[('delivery_type', '=', 'ups')])
+    service_type = fields.Selection(_get_ups_service_types, string='UPS Service Type', required=True)
+    currency_id = fields.Many2one('res.currency', required=True, default=lambda self: self.env.company.currency_id)
+    zone_chart = fields.Binary(required=True, attachment=True,
+                               help="CSV file with 'origin' and 'destination' ZIP prefix columns (e.g. 004-005) "
+                                    "and a 'zone' column, or a column named after the UPS service code.")
+    zone_chart_name = fields.Char()
+    rate_sheet = fields.Binary(required=True, attachment=True,
+                               help="CSV file with a 'weight' column and one column of prices per zone "
+                                    "(e.g. 'Zone 2'), in the weight unit of the carrier.")
+    rate_sheet_name = fields.Char()
+    dim_divisor = fields.Float(string='Dimensional Weight Divisor',
+                               help="Package volume divided by this number gives its dimensional weight, in the "
+                                    "units of the carrier. Defaults to 139 for inches and pounds, 5000 for "
+                                    "centimeters and kilograms.")
+    fuel_surcharge = fields.Float(string='Fuel Surcharge (%)')
+    residential_surcharge = fields.Float(help="Amount added per package delivered to a residential address.")
+
+    _sql_constraints = [
+        ('carrier_service_uniq', 'unique(carrier_id, service_type)',
+         'A carrier can only have one rate table per service.'),
+    ]
+
+    @api.constrains('zone_chart', 'rate_sheet', 'service_type')
+    def _check_tables(self):
+        for table in self:
+            try:
+                table._compile()
+            except (ValueError, UnicodeDecodeError) as e:
+                raise ValidationError(_("The rate table %s cannot be read: %s") % (table.display_name, e))
+
+    def name_get(self):
+        services = dict(self._fields['service_type']._description_selection(self.env))
+        return [(table.id, '%s - %s' % (table.carrier_id.name, services.get(table.service_type)))
+                for table in self]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        tables = super(UPSRateTable, self).create(vals_list)
+        self.clear_caches()
+        return tables
+
+    def write(self, vals):
+        res = super(UPSRateTable, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(UPSRateTable, self).unlink()
+        self.clear_caches()
+        return res
+
+    def _compile(self):
+        self.ensure_one()
+        carrier = self.carrier_id
+        dim_divisor = self.dim_divisor or DIM_DIVISORS.get(
+            (carrier.ups_package_dimension_unit, carrier.ups_package_weight_unit), 0.0)
+        return RateTable(base64.b64decode(self.zone_chart), base64.b64decode(self.rate_sheet), self.service_type,
+                         self.currency_id.name, dim_divisor=dim_divisor, fuel_surcharge=self.fuel_surcharge,
+                         residential_surcharge=self.residential_surcharge)
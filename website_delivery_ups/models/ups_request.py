@@ -1,17 +1,26 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
-import base64
-import io
-from PIL import Image
+import functools
 import logging
 import os
+import random
 import re
+import threading
+import time
 
-from zeep import Client, Plugin
-from zeep.exceptions import Fault
+import requests
 
 from odoo import _, _lt
 
+from .ups_cache import LRUCache
+from .ups_executor import get_circuit_breaker
+from .ups_label import convert_label
+from .ups_log import SAMPLED_OPERATIONS, get_log_writer, is_fault, redact
+from .ups_metrics_recorder import measure, record
+from .ups_serializer import PackagesPlugin, package_key
+from .ups_transport import get_transport
+from .ups_wsdl import Plugin, load_document
+
 _logger = logging.getLogger(__name__)
 # uncomment to enable logging of SOAP requests and responses
 # logging.getLogger('zeep.transports').setLevel(logging.DEBUG)
@@ -99,10 +108,44 @@ UPS_ERROR_MAP = {
     '9120200': _lt("Please provide at least one item to ship")
 }
 
+# Errors on which UPS asks to send the request again later
+RETRYABLE_ERROR_CODES = ('190001', '250052')
+# Errors meaning that UPS is down, counted by the circuit breaker of the endpoint
+UNAVAILABLE_ERROR_CODES = ('250052', '250053')
+# Failures in a row opening the circuit of an endpoint, and seconds it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+UNAVAILABLE_MESSAGE = _lt("UPS is currently unavailable, please try again in a few minutes.")
+
+# Parsed WSDL documents and their type factories, shared by every UPSRequest of
+# the process and keyed by (wsdl path, endpoint). They hold no credentials: the
+# security header is set on the per-call Client.
+_wsdl_cache = {}
+_wsdl_cache_lock = threading.Lock()
+
+# Results of UPSRequest._check_address, keyed on the partner and its write_date
+_address_check_cache = LRUCache(max_size=4096, ttl=3600)
+
+# Seconds to wait before the first retry of an idempotent call, doubled at each attempt
+RETRY_BACKOFF = 0.5
+
 
 class Package():
-    def __init__(self, carrier, weight, quant_pack=False, name=''):
-        self.weight = carrier._ups_convert_weight(weight, carrier.ups_package_weight_unit)
+    """ A UPS package. ``count`` identical packages are stored as a single
+        instance, and expanded when the request is built.
+
+        ``weight_factor`` converts the weight to the UPS unit of the carrier,
+        see ProviderUPS._ups_get_weight_factor; give it when creating many
+        packages, to avoid converting each weight through the ORM.
+    """
+    __slots__ = ('weight', 'weight_unit', 'name', 'dimension_unit', 'dimension', 'packaging_type', 'count')
+
+    def __init__(self, carrier, weight, quant_pack=False, name='', count=1, weight_factor=None):
+        if weight_factor is None:
+            self.weight = carrier._ups_convert_weight(weight, carrier.ups_package_weight_unit)
+        else:
+            self.weight = weight * weight_factor
+        self.count = count
         self.weight_unit = carrier.ups_package_weight_unit
         self.name = name
         self.dimension_unit = carrier.ups_package_dimension_unit
@@ -116,17 +159,69 @@ class Package():
 
 
 class LogPlugin(Plugin):
-    """ Small plugin for zeep that catches out/ingoing XML requests and logs them"""
+    """ Small plugin for zeep that catches out/ingoing XML requests and logs them.
 
-    def __init__(self, debug_logger):
+        Only ``sample_rate`` percent of the SAMPLED_OPERATIONS calls are logged,
+        plus the ones answered by a fault. Credentials and label images are
+        removed from the envelopes. They are given to ``debug_logger`` when the
+        call is sent by the thread that built it, and written in the background
+        to the logs of ``dbname`` otherwise, or when ``log_async`` is set:
+        delivery.carrier.log_xml cannot be called from the threads of
+        rate_shipment_multi, which have no environment.
+    """
+
+    def __init__(self, debug_logger, sample_rate=100.0, dbname=None, log_async=False):
         self.debug_logger = debug_logger
+        self.sample_rate = sample_rate
+        self.dbname = dbname
+        self.log_async = log_async
+        self.thread = threading.current_thread()
+        self._sampled = True
+        self._request = None
+
+    def _log(self, envelope, func):
+        # serialized now, zeep may still be working on the envelope
+        message = redact(envelope)
+        if not self.log_async and threading.current_thread() is self.thread:
+            self.debug_logger(message, func)
+        elif self.dbname:
+            get_log_writer().put(self.dbname, message, func)
 
     def egress(self, envelope, http_headers, operation, binding_options):
-        self.debug_logger(envelope, 'ups_request')
+        self._sampled = operation.name not in SAMPLED_OPERATIONS or random.random() * 100 < self.sample_rate
+        if self._sampled:
+            self._log(envelope, 'ups_request')
+        else:
+            # kept aside, to be logged if the answer is a fault
+            self._request = envelope
         return envelope, http_headers
 
     def ingress(self, envelope, http_headers, operation):
-        self.debug_logger(envelope, 'ups_response')
+        if not self._sampled and is_fault(envelope):
+            self._log(self._request, 'ups_request')
+            self._sampled = True
+        if self._sampled:
+            self._log(envelope, 'ups_response')
+        self._request = None
+        return envelope, http_headers
+
+
+class TimingPlugin(Plugin):
+    """ Note when a request leaves and when its answer arrives, to tell the
+        serialization and parsing done by zeep apart from the network time.
+    """
+
+    def __init__(self):
+        self.sent = None
+        self.received = None
+
+    def egress(self, envelope, http_headers, operation, binding_options):
+        self.sent = time.perf_counter()
+        self.received = None
+        return envelope, http_headers
+
+    def ingress(self, envelope, http_headers, operation):
+        self.received = time.perf_counter()
         return envelope, http_headers
 
 
@@ -139,12 +234,30 @@ class FixRequestNamespacePlug(Plugin):
 
 
 class UPSRequest():
-    def __init__(self, debug_logger, username, password, shipper_number, access_number, prod_environment):
+    def __init__(self, debug_logger, username, password, shipper_number, access_number, prod_environment,
+                 connect_timeout=5, read_timeout=30, pool_size=10, max_retries=2, log_sample_rate=100.0,
+                 log_async=False, carrier_id=False, dbname=None, endpoint=None, fast_serialization=False):
+        # no logging when debug_logger is None, see LogPlugin for the other options
         self.debug_logger = debug_logger
-        # Product and Testing url
+        self.log_sample_rate = log_sample_rate
+        self.log_async = log_async
+        # labels of the metrics, which are only recorded when a database is given
+        self.carrier_id = carrier_id
+        self.dbname = dbname
+        # Product and Testing url, unless another one is given (proxy, benchmark server)
         self.endurl = "https://onlinetools.ups.com/webservices/"
         if not prod_environment:
             self.endurl = "https://wwwcie.ups.com/webservices/"
+        if endpoint:
+            self.endurl = endpoint if endpoint.endswith('/') else endpoint + '/'
+
+        # HTTP connection settings
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        # render the packages with lxml instead of zeep, see _prepare_packages
+        self.fast_serialization = fast_serialization
 
         # Basic detail require to authenticate
         self.username = username
@@ -153,6 +266,9 @@ class UPSRequest():
         self.access_number = access_number
 
         self.rate_wsdl = '../api/RateWS.wsdl'
+        self.ship_wsdl = '../api/Ship.wsdl'
+        self.tnt_wsdl = '../api/TNTWS.wsdl'
+        self.void_wsdl = '../api/Void.wsdl'
         self.ns = {'err': "http://www.ups.com/XMLSchema/XOLTWS/Error/v1.1"}
 
     def _add_security_header(self, client, api):
@@ -163,46 +279,165 @@ class UPSRequest():
         security['location'] = '%s%s' % (self.endurl, api)
         client.set_default_soapheaders([security])
 
-    def _set_client(self, wsdl, api, root):
+    def _get_wsdl_document(self, wsdl):
+        """ Return the parsed WSDL document and its type factories, loading
+            them only the first time they are requested in this process, see
+            ups_wsdl.load_document.
+        """
         wsdl_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), wsdl)
-        client = Client('file:///%s' % wsdl_path.lstrip('/'),
-                        plugins=[FixRequestNamespacePlug(root), LogPlugin(self.debug_logger)])
-        self.factory_ns2 = client.type_factory('ns2')
-        self.factory_ns3 = client.type_factory('ns3')
-        self._add_security_header(client, api)
+        key = (wsdl_path, self.endurl)
+        cached = _wsdl_cache.get(key)
+        if cached is None:
+            with _wsdl_cache_lock:
+                cached = _wsdl_cache.get(key)
+                if cached is None:
+                    from zeep import Client
+                    client = Client(load_document(wsdl_path))
+                    cached = _wsdl_cache[key] = {
+                        'document': client.wsdl,
+                        'factory_ns2': client.type_factory('ns2'),
+                        'factory_ns3': client.type_factory('ns3'),
+                    }
+        return cached
+
+    def _set_client(self, wsdl, api, root):
+        from zeep import Client
+        with self._measure('wsdl', api):
+            cached = self._get_wsdl_document(wsdl)
+            transport = get_transport(self.endurl, self.pool_size, self.connect_timeout, self.read_timeout)
+            timing = TimingPlugin()
+            self.packages_plugin = PackagesPlugin()
+            plugins = [FixRequestNamespacePlug(root), self.packages_plugin, timing]
+            if self.debug_logger:
+                plugins.append(LogPlugin(self.debug_logger, self.log_sample_rate, self.dbname, self.log_async))
+            client = Client(cached['document'], transport=transport, plugins=plugins)
+            client.ups_timing = timing
+            self.factory_ns2 = cached['factory_ns2']
+            self.factory_ns3 = cached['factory_ns3']
+            self._add_security_header(client, api)
         return client
 
+    def _set_service(self, client, api):
+        # the bundled WSDL files point to the testing server, use the configured one
+        return client.create_service(next(iter(client.wsdl.bindings)), '%s%s' % (self.endurl, api))
+
+    def _measure(self, phase, operation, service_type=''):
+        return measure(self.dbname, phase, operation=operation, carrier_id=self.carrier_id,
+                       service_type=service_type)
+
+    def _measure_call(self, timing, operation, service_type, send, *args):
+        """ Call send(*args) and record the time spent serializing the request,
+            waiting for UPS and parsing its answer, see TimingPlugin.
+        """
+        start = time.perf_counter()
+        result = send(*args)
+        end = time.perf_counter()
+        labels = {
+            'operation': operation,
+            'carrier_id': self.carrier_id,
+            'service_type': service_type,
+            'error_code': isinstance(result, dict) and result.get('error_code') or '',
+        }
+        if timing.sent and timing.received:
+            record(self.dbname, 'serialize', timing.sent - start, **labels)
+            record(self.dbname, 'network', timing.received - timing.sent, **labels)
+            record(self.dbname, 'parse', end - timing.received, **labels)
+        else:
+            # no answer from UPS
+            record(self.dbname, 'network', end - start, **labels)
+        return result
+
+    def _get_breaker(self, operation):
+        return get_circuit_breaker('%s%s' % (self.endurl, operation), BREAKER_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+    def get_retry_delay(self, operation):
+        """ Return the number of seconds before the circuit of the endpoint of
+            the operation ('Rate', 'Ship', ...) lets a call through again.
+        """
+        return self._get_breaker(operation).retry_delay()
+
+    def _guarded_call(self, timing, operation, service_type, send, *args):
+        """ Same as _measure_call, failing fast while the circuit of the
+            endpoint is open. Results of calls that could not reach UPS, or
+            failed fast, are flagged as 'unavailable'.
+
+            Only network errors and the UNAVAILABLE_ERROR_CODES answers open
+            the circuit: any other error comes from the request itself, and
+            says nothing about the health of UPS.
+        """
+        breaker = self._get_breaker(operation)
+        if not breaker.allow():
+            return {'error_code': '250053', 'error_message': UNAVAILABLE_MESSAGE, 'unavailable': True}
+        try:
+            result = self._measure_call(timing, operation, service_type, send, *args)
+        except IOError:
+            breaker.failure()
+            raise
+        except Exception:
+            breaker.abort()
+            raise
+        if isinstance(result, dict) and (result.get('unavailable') or
+                                         result.get('error_code') in UNAVAILABLE_ERROR_CODES):
+            result['unavailable'] = True
+            breaker.failure()
+        else:
+            breaker.success()
+        return result
+
+    def _call_idempotent(self, operation, **kwargs):
+        """ Call an operation that can safely be sent twice, retrying it with an
+            exponential backoff when the connection fails or times out.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return operation(**kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                _logger.info("UPS request failed (%s), retrying (%s/%s)", e, attempt + 1, self.max_retries)
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
     def _clean_phone_number(self, phone):
         return re.sub('[^0-9]', '', phone)
 
+    def _check_address(self, partner, check_phone=True):
+        """ Return the missing fields of the address of the partner, and whether
+            its phone number is too short. The result only depends on the
+            partner, it is cached until the partner is modified.
+        """
+        key = (partner.env.cr.dbname, partner.id, partner.write_date, check_phone)
+        cacheable = isinstance(partner.id, int)
+        result = cacheable and _address_check_cache.get(key)
+        if not result:
+            required_field = {'city': 'City', 'zip': 'ZIP code', 'country_id': 'Country'}
+            if check_phone:
+                required_field['phone'] = 'Phone'
+            res = [required_field[field] for field in required_field if not partner[field]]
+            if partner.country_id.code in ('US', 'CA', 'IE') and not partner.state_id.code:
+                res.append('State')
+            if not partner.street and not partner.street2:
+                res.append('Street')
+            short_phone = bool(check_phone and partner.phone and len(self._clean_phone_number(partner.phone)) < 10)
+            result = (tuple(res), short_phone)
+            if cacheable:
+                _address_check_cache.set(key, result)
+        return result
+
     def check_required_value(self, shipper, ship_from, ship_to, order=False, picking=False):
-        required_field = {'city': 'City', 'zip': 'ZIP code', 'country_id': 'Country', 'phone': 'Phone'}
         # Check required field for shipper
-        res = [required_field[field] for field in required_field if not shipper[field]]
-        if shipper.country_id.code in ('US', 'CA', 'IE') and not shipper.state_id.code:
-            res.append('State')
-        if not shipper.street and not shipper.street2:
-            res.append('Street')
+        res, short_phone = self._check_address(shipper)
         if res:
             return _("The address of your company is missing or wrong.\n(Missing field(s) : %s)") % ",".join(res)
-        if len(self._clean_phone_number(shipper.phone)) < 10:
+        if short_phone:
             return _(UPS_ERROR_MAP.get('120115'))
         # Check required field for warehouse address
-        res = [required_field[field] for field in required_field if not ship_from[field]]
-        if ship_from.country_id.code in ('US', 'CA', 'IE') and not ship_from.state_id.code:
-            res.append('State')
-        if not ship_from.street and not ship_from.street2:
-            res.append('Street')
+        res, short_phone = self._check_address(ship_from)
         if res:
             return _("The address of your warehouse is missing or wrong.\n(Missing field(s) : %s)") % ",".join(res)
-        if len(self._clean_phone_number(ship_from.phone)) < 10:
+        if short_phone:
             return _(UPS_ERROR_MAP.get('120313'))
         # Check required field for recipient address
-        res = [required_field[field] for field in required_field if field != 'phone' and not ship_to[field]]
-        if ship_to.country_id.code in ('US', 'CA', 'IE') and not ship_to.state_id.code:
-            res.append('State')
-        if not ship_to.street and not ship_to.street2:
-            res.append('Street')
+        res = list(self._check_address(ship_to, check_phone=False)[0])
         if picking and not order:
             order = picking.sale_id
         phone = ship_to.mobile or ship_to.phone
@@ -228,100 +463,137 @@ class UPSRequest():
         return False
 
     def get_error_message(self, error_code, description):
-        result = {}
+        result = {'error_code': error_code}
         result['error_message'] = UPS_ERROR_MAP.get(error_code)
         if not result['error_message']:
             result['error_message'] = description
         return result
 
+    def _get_unreachable_message(self, error):
+        result = self.get_error_message('0', 'UPS Server Not Found:\n%s' % error)
+        result['unavailable'] = True
+        return result
+
     def save_label(self, image64, label_file_type='GIF'):
-        img_decoded = base64.decodebytes(image64.encode('utf-8'))
-        if label_file_type == 'GIF':
-            # Label format is GIF, so need to rotate and convert as PDF
-            image_string = io.BytesIO(img_decoded)
-            im = Image.open(image_string)
-            label_result = io.BytesIO()
-            im.save(label_result, 'pdf')
-            return label_result.getvalue()
-        else:
-            return img_decoded
+        return convert_label(image64, label_file_type)
 
     def set_package_detail(self, packages, packaging_type, ship_from, ship_to, cod_info, request_type):
         Packages = []
+        for p in packages:
+            package = self._get_package(p, packaging_type, ship_from, ship_to, cod_info, request_type)
+            Packages.extend([package] * p.count)
+        return Packages
+
+    def _get_package(self, p, packaging_type, ship_from, ship_to, cod_info, request_type):
         if request_type == "rating":
             MeasurementType = self.factory_ns2.CodeDescriptionType
         elif request_type == "shipping":
             MeasurementType = self.factory_ns2.ShipUnitOfMeasurementType
-        for i, p in enumerate(packages):
-            package = self.factory_ns2.PackageType()
-            if hasattr(package, 'Packaging'):
-                package.Packaging = self.factory_ns2.PackagingType()
-                package.Packaging.Code = p.packaging_type or packaging_type or ''
-            elif hasattr(package, 'PackagingType'):
-                package.PackagingType = self.factory_ns2.CodeDescriptionType()
-                package.PackagingType.Code = p.packaging_type or packaging_type or ''
-
-            if p.dimension_unit and any(p.dimension.values()):
-                package.Dimensions = self.factory_ns2.DimensionsType()
-                package.Dimensions.UnitOfMeasurement = MeasurementType()
-                package.Dimensions.UnitOfMeasurement.Code = p.dimension_unit or ''
-                package.Dimensions.Length = p.dimension['length'] or ''
-                package.Dimensions.Width = p.dimension['width'] or ''
-                package.Dimensions.Height = p.dimension['height'] or ''
-
-            if cod_info:
-                package.PackageServiceOptions = self.factory_ns2.PackageServiceOptionsType()
-                package.PackageServiceOptions.COD = self.factory_ns2.CODType()
-                package.PackageServiceOptions.COD.CODFundsCode = str(cod_info['funds_code'])
+        package = self.factory_ns2.PackageType()
+        if hasattr(package, 'Packaging'):
+            package.Packaging = self.factory_ns2.PackagingType()
+            package.Packaging.Code = p.packaging_type or packaging_type or ''
+        elif hasattr(package, 'PackagingType'):
+            package.PackagingType = self.factory_ns2.CodeDescriptionType()
+            package.PackagingType.Code = p.packaging_type or packaging_type or ''
+
+        if p.dimension_unit and any(p.dimension.values()):
+            package.Dimensions = self.factory_ns2.DimensionsType()
+            package.Dimensions.UnitOfMeasurement = MeasurementType()
+            package.Dimensions.UnitOfMeasurement.Code = p.dimension_unit or ''
+            package.Dimensions.Length = p.dimension['length'] or ''
+            package.Dimensions.Width = p.dimension['width'] or ''
+            package.Dimensions.Height = p.dimension['height'] or ''
+
+        if cod_info:
+            package.PackageServiceOptions = self.factory_ns2.PackageServiceOptionsType()
+            package.PackageServiceOptions.COD = self.factory_ns2.CODType()
+            package.PackageServiceOptions.COD.CODFundsCode = str(cod_info['funds_code'])
+            if request_type == "rating":
                 package.PackageServiceOptions.COD.CODAmount = self.factory_ns2.CODAmountType()
-                package.PackageServiceOptions.COD.CODAmount.MonetaryValue = cod_info['monetary_value']
-                package.PackageServiceOptions.COD.CODAmount.CurrencyCode = cod_info['currency']
-
-            package.PackageWeight = self.factory_ns2.PackageWeightType()
-            package.PackageWeight.UnitOfMeasurement = MeasurementType()
-            package.PackageWeight.UnitOfMeasurement.Code = p.weight_unit or ''
-            package.PackageWeight.Weight = p.weight or ''
-
-            # Package and shipment reference text is only allowed for shipments within
-            # the USA and within Puerto Rico. This is a UPS limitation.
-            if (p.name and ship_from.country_id.code in ('US') and ship_to.country_id.code in ('US')):
-                reference_number = self.factory_ns2.ReferenceNumberType()
-                reference_number.Code = 'PM'
-                reference_number.Value = p.name
-                reference_number.BarCodeIndicator = p.name
-                package.ReferenceNumber = reference_number
-
-            Packages.append(package)
-        return Packages
+            else:
+                package.PackageServiceOptions.COD.CODAmount = self.factory_ns2.CurrencyMonetaryType()
+            package.PackageServiceOptions.COD.CODAmount.MonetaryValue = cod_info['monetary_value']
+            package.PackageServiceOptions.COD.CODAmount.CurrencyCode = cod_info['currency']
 
-    def get_shipping_price(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type, service_type,
-                           saturday_delivery, cod_info):
-        """
-            Get Shipping Price
-            :param shipment_info:
-            :param packages:
-            :param shipper:
-            :param ship_from:
-            :param ship_to:
-            :param packaging_type:
-            :param service_type:
-            :param saturday_delivery:
-            :param cod_info:
-            :return:
+        package.PackageWeight = self.factory_ns2.PackageWeightType()
+        package.PackageWeight.UnitOfMeasurement = MeasurementType()
+        package.PackageWeight.UnitOfMeasurement.Code = p.weight_unit or ''
+        package.PackageWeight.Weight = p.weight or ''
+
+        # Package and shipment reference text is only allowed for shipments within
+        # the USA and within Puerto Rico. This is a UPS limitation.
+        if (p.name and ship_from.country_id.code in ('US') and ship_to.country_id.code in ('US')):
+            reference_number = self.factory_ns2.ReferenceNumberType()
+            reference_number.Code = 'PM'
+            reference_number.Value = p.name
+            reference_number.BarCodeIndicator = p.name
+            package.ReferenceNumber = reference_number
+
+        return package
+
+    def _get_package_leaves(self, p, packaging_tag, packaging_type, ship_from, ship_to, cod_info, request_type):
+        """ Return the text of the leaf elements of the package built by
+            _get_package, as a tuple of ((localname, ...), text).
         """
-        client = self._set_client(self.rate_wsdl, 'Rate', 'RateRequest')
-        request = self.factory_ns3.RequestType()
-        request.RequestOption = 'Rate'
+        leaves = [((packaging_tag, 'Code'), p.packaging_type or packaging_type or '')]
+        if p.dimension_unit and any(p.dimension.values()):
+            leaves += [
+                (('Dimensions', 'UnitOfMeasurement', 'Code'), p.dimension_unit or ''),
+                (('Dimensions', 'Length'), p.dimension['length'] or ''),
+                (('Dimensions', 'Width'), p.dimension['width'] or ''),
+                (('Dimensions', 'Height'), p.dimension['height'] or ''),
+            ]
+        if cod_info:
+            leaves += [
+                (('PackageServiceOptions', 'COD', 'CODFundsCode'), str(cod_info['funds_code'])),
+                (('PackageServiceOptions', 'COD', 'CODAmount', 'MonetaryValue'), cod_info['monetary_value']),
+                (('PackageServiceOptions', 'COD', 'CODAmount', 'CurrencyCode'), cod_info['currency']),
+            ]
+        leaves += [
+            (('PackageWeight', 'UnitOfMeasurement', 'Code'), p.weight_unit or ''),
+            (('PackageWeight', 'Weight'), p.weight or ''),
+        ]
+        if (p.name and ship_from.country_id.code in ('US') and ship_to.country_id.code in ('US')):
+            leaves += [
+                (('ReferenceNumber', 'Code'), 'PM'),
+                (('ReferenceNumber', 'Value'), p.name),
+                (('ReferenceNumber', 'BarCodeIndicator'), p.name),
+            ]
+        # as zeep renders the xsd:string values
+        return tuple((path, str(text if text is not None else '')) for path, text in leaves)
 
-        classification = self.factory_ns2.CodeDescriptionType()
-        classification.Code = '00'  # Get rates for the shipper account
-        classification.Description = 'Get rates for the shipper account'
+    def _prepare_packages(self, packages, packaging_type, ship_from, ship_to, cod_info, request_type):
+        """ Return the zeep packages of a Rate or Ship request.
 
+            With fast_serialization, zeep only builds and serializes one
+            package per set of elements. PackagesPlugin then renders all the
+            packages from these templates, byte for byte like zeep would.
+        """
+        if not self.fast_serialization:
+            return self.set_package_detail(packages, packaging_type, ship_from, ship_to, cod_info, request_type)
+        packaging_tag = 'Packaging' if hasattr(self.factory_ns2.PackageType(), 'Packaging') else 'PackagingType'
+        templates = []
+        template_index = {}
+        layout = []
+        for p in packages:
+            leaves = self._get_package_leaves(p, packaging_tag, packaging_type, ship_from, ship_to, cod_info,
+                                              request_type)
+            key = package_key(leaves)
+            if key not in template_index:
+                template_index[key] = len(templates)
+                templates.append(self._get_package(p, packaging_type, ship_from, ship_to, cod_info, request_type))
+            layout.append((template_index[key], leaves, p.count))
+        self.packages_plugin.layout = layout
+        return templates
+
+    def _prepare_rate_shipment(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type,
+                               service_type, saturday_delivery, cod_info):
         request_type = "rating"
         shipment = self.factory_ns2.ShipmentType()
 
-        for package in self.set_package_detail(packages, packaging_type, ship_from, ship_to, cod_info,
-                                               request_type):
+        for package in self._prepare_packages(packages, packaging_type, ship_from, ship_to, cod_info,
+                                              request_type):
             shipment.Package.append(package)
 
         shipment.Shipper = self.factory_ns2.ShipperType()
@@ -360,9 +632,10 @@ class UPSRequest():
         if not ship_to.commercial_partner_id.is_company:
             shipment.ShipTo.Address.ResidentialAddressIndicator = None
 
-        shipment.Service = self.factory_ns2.CodeDescriptionType()
-        shipment.Service.Code = service_type or ''
-        shipment.Service.Description = 'Service Code'
+        if service_type:
+            shipment.Service = self.factory_ns2.CodeDescriptionType()
+            shipment.Service.Code = service_type
+            shipment.Service.Description = 'Service Code'
         if service_type == "96":
             shipment.NumOfPieces = int(shipment_info.get('total_qty'))
 
@@ -374,26 +647,354 @@ class UPSRequest():
 
         shipment.ShipmentRatingOptions = self.factory_ns2.ShipmentRatingOptionsType()
         shipment.ShipmentRatingOptions.NegotiatedRatesIndicator = 1
+        return shipment
+
+    def _prepare_process_rate(self, request_option, shipment_values):
+        """ Build the ProcessRate request and return a callable sending it.
 
+            Every record field is read here, so the returned callable only does
+            the network round trip and can be run outside of the ORM, e.g. in a
+            worker thread. It returns the list of rated shipments, or a dict with
+            the error message if UPS refused the request.
+        """
+        client = self._set_client(self.rate_wsdl, 'Rate', 'RateRequest')
+        service = self._set_service(client, 'Rate')
+        request = self.factory_ns3.RequestType()
+        request.RequestOption = request_option
+
+        classification = self.factory_ns2.CodeDescriptionType()
+        classification.Code = '00'  # Get rates for the shipper account
+        classification.Description = 'Get rates for the shipper account'
+
+        service_type = shipment_values.get('service_type') or ''
+        with self._measure('build', 'Rate', service_type):
+            shipment = self._prepare_rate_shipment(**shipment_values)
+        return functools.partial(self._guarded_call, client.ups_timing, 'Rate', service_type,
+                                 self._send_process_rate, service, request, classification, shipment)
+
+    def _send_process_rate(self, service, request, classification, shipment):
+        from zeep.exceptions import Fault
         try:
             # Get rate using for provided detail
-            response = client.service.ProcessRate(Request=request, CustomerClassification=classification,
-                                                  Shipment=shipment)
+            response = self._call_idempotent(service.ProcessRate, Request=request,
+                                             CustomerClassification=classification, Shipment=shipment)
 
             # Check if ProcessRate is not success then return reason for that
+            if response.Response.ResponseStatus.Code != "1":
+                return self.get_error_message(response.Response.ResponseStatus.Code,
+                                              response.Response.ResponseStatus.Description)
+            return response.RatedShipment
+
+        except Fault as e:
+            code = e.detail.xpath("//err:PrimaryErrorCode/err:Code", namespaces=self.ns)[0].text
+            description = e.detail.xpath("//err:PrimaryErrorCode/err:Description", namespaces=self.ns)[0].text
+            return self.get_error_message(code, description)
+        except IOError as e:
+            return self._get_unreachable_message(e)
+
+    def _parse_shipping_price(self, rated_shipments):
+        if isinstance(rated_shipments, dict):
+            return rated_shipments
+        return self._get_rated_shipment_price(rated_shipments[0])
+
+    def _parse_shipping_prices(self, rated_shipments):
+        if isinstance(rated_shipments, dict):
+            return rated_shipments
+        return {'prices': {rated_shipment.Service.Code: self._get_rated_shipment_price(rated_shipment)
+                           for rated_shipment in rated_shipments}}
+
+    def _get_rated_shipment_price(self, rated_shipment):
+        result = {}
+        result['currency_code'] = rated_shipment.TotalCharges.CurrencyCode
+
+        # Some users are qualified to receive negotiated rates
+        negotiated_rate = 'NegotiatedRateCharges' in rated_shipment and rated_shipment.NegotiatedRateCharges and \
+            rated_shipment.NegotiatedRateCharges.TotalCharge.MonetaryValue or None
+
+        result['price'] = negotiated_rate or rated_shipment.TotalCharges.MonetaryValue
+        return result
+
+    def prepare_shipping_price(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type,
+                               service_type, saturday_delivery, cod_info):
+        """ Same as get_shipping_price, but return a callable doing the network
+            call, see _prepare_process_rate.
+        """
+        send = self._prepare_process_rate('Rate', {
+            'shipment_info': shipment_info, 'packages': packages, 'shipper': shipper, 'ship_from': ship_from,
+            'ship_to': ship_to, 'packaging_type': packaging_type, 'service_type': service_type,
+            'saturday_delivery': saturday_delivery, 'cod_info': cod_info,
+        })
+        return lambda: self._parse_shipping_price(send())
+
+    def get_shipping_price(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type, service_type,
+                           saturday_delivery, cod_info):
+        """
+            Get Shipping Price
+            :param shipment_info:
+            :param packages:
+            :param shipper:
+            :param ship_from:
+            :param ship_to:
+            :param packaging_type:
+            :param service_type:
+            :param saturday_delivery:
+            :param cod_info:
+            :return:
+        """
+        return self.prepare_shipping_price(shipment_info, packages, shipper, ship_from, ship_to, packaging_type,
+                                           service_type, saturday_delivery, cod_info)()
+
+    def get_shipping_prices(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type,
+                            saturday_delivery, cod_info):
+        """
+            Get the shipping price of every available service in one call
+            ('Shop' request option)
+            :return: {'prices': {service_code: {'price': ..., 'currency_code': ...}}}
+                     or {'error_message': ...}
+        """
+        send = self._prepare_process_rate('Shop', {
+            'shipment_info': shipment_info, 'packages': packages, 'shipper': shipper, 'ship_from': ship_from,
+            'ship_to': ship_to, 'packaging_type': packaging_type, 'service_type': False,
+            'saturday_delivery': saturday_delivery, 'cod_info': cod_info,
+        })
+        return self._parse_shipping_prices(send())
+
+    def _set_tnt_address(self, address, partner):
+        address.City = partner.city or ''
+        address.PostalCode = partner.zip or ''
+        address.CountryCode = partner.country_id.code or ''
+        if partner.country_id.code in ('US', 'CA', 'IE'):
+            address.StateProvinceCode = partner.state_id.code or ''
+
+    def prepare_time_in_transit(self, ship_from, ship_to, pickup_date, weight, weight_unit, package_count=1,
+                                invoice_total=None, currency_code=None):
+        """ Build the ProcessTimeInTransit request and return a callable sending
+            it, see _prepare_process_rate. The callable returns the transit time
+            of every service available between the two addresses, keyed by
+            transit service code (see TNT_SERVICE_TYPE):
+            {'transit_times': {code: {'date': 'YYYY-MM-DD', 'business_days': int}}}
+            or {'error_message': ...}
+        """
+        client = self._set_client(self.tnt_wsdl, 'TimeInTransit', 'TimeInTransitRequest')
+        service = self._set_service(client, 'TimeInTransit')
+        start = time.perf_counter()
+        request = self.factory_ns3.RequestType()
+        request.RequestOption = 'TNT'
+
+        ship_from_type = self.factory_ns2.RequestShipFromType()
+        ship_from_type.Address = self.factory_ns2.RequestShipFromAddressType()
+        self._set_tnt_address(ship_from_type.Address, ship_from)
+
+        ship_to_type = self.factory_ns2.RequestShipToType()
+        ship_to_type.Address = self.factory_ns2.RequestShipToAddressType()
+        self._set_tnt_address(ship_to_type.Address, ship_to)
+        if not ship_to.commercial_partner_id.is_company:
+            ship_to_type.Address.ResidentialAddressIndicator = ''
+
+        pickup = self.factory_ns2.PickupType()
+        pickup.Date = pickup_date.strftime('%Y%m%d')
+
+        shipment_weight = self.factory_ns2.ShipmentWeightType()
+        shipment_weight.UnitOfMeasurement = self.factory_ns2.CodeDescriptionType()
+        shipment_weight.UnitOfMeasurement.Code = weight_unit
+        shipment_weight.Weight = '%.1f' % max(weight, 0.1)
+
+        values = {
+            'Request': request,
+            'ShipFrom': ship_from_type,
+            'ShipTo': ship_to_type,
+            'Pickup': pickup,
+            'ShipmentWeight': shipment_weight,
+            'TotalPackagesInShipment': str(package_count),
+            'MaximumListSize': '1',
+        }
+        # International shipments of goods require the declared value
+        if ship_from.country_id != ship_to.country_id and invoice_total is not None:
+            values['InvoiceLineTotal'] = self.factory_ns2.InvoiceLineTotalType()
+            values['InvoiceLineTotal'].CurrencyCode = currency_code
+            values['InvoiceLineTotal'].MonetaryValue = '%d' % invoice_total
+        record(self.dbname, 'build', time.perf_counter() - start, operation='TimeInTransit',
+               carrier_id=self.carrier_id)
+        return functools.partial(self._guarded_call, client.ups_timing, 'TimeInTransit', '',
+                                 self._send_process_time_in_transit, service, values)
+
+    def _send_process_time_in_transit(self, service, values):
+        from zeep.exceptions import Fault
+        try:
+            response = self._call_idempotent(service.ProcessTimeInTransit, **values)
+
+            if response.Response.ResponseStatus.Code != "1":
+                return self.get_error_message(response.Response.ResponseStatus.Code,
+                                              response.Response.ResponseStatus.Description)
+            # ambiguous addresses are answered with a list of candidates instead
+            if not response.TransitResponse:
+                return self.get_error_message('0', 'UPS could not locate the shipment addresses.')
+
+            transit_times = {}
+            for summary in response.TransitResponse.ServiceSummary:
+                arrival = summary.EstimatedArrival
+                transit_times[summary.Service.Code] = {
+                    'date': '%s-%s-%s' % (arrival.Arrival.Date[:4], arrival.Arrival.Date[4:6],
+                                          arrival.Arrival.Date[6:8]),
+                    'business_days': int(arrival.BusinessDaysInTransit),
+                }
+            return {'transit_times': transit_times}
+
+        except Fault as e:
+            code = e.detail.xpath("//err:PrimaryErrorCode/err:Code", namespaces=self.ns)[0].text
+            description = e.detail.xpath("//err:PrimaryErrorCode/err:Description", namespaces=self.ns)[0].text
+            return self.get_error_message(code, description)
+        except IOError as e:
+            return self._get_unreachable_message(e)
+
+    def prepare_shipping(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type, service_type,
+                         saturday_delivery, duty_payment, cod_info=None, label_file_type='GIF',
+                         ups_carrier_account=False):
+        """ Build the ProcessShipment request and return a callable sending it,
+            see _prepare_process_rate. The callable returns the result of
+            send_shipping.
+        """
+        client = self._set_client(self.ship_wsdl, 'Ship', 'ShipmentRequest')
+        service = self._set_service(client, 'Ship')
+        start = time.perf_counter()
+        request = self.factory_ns3.RequestType()
+        request.RequestOption = 'nonvalidate'
+
+        request_type = "shipping"
+        label = self.factory_ns2.LabelSpecificationType()
+        label.LabelImageFormat = self.factory_ns2.LabelImageFormatType()
+        label.LabelImageFormat.Code = label_file_type
+        label.LabelImageFormat.Description = label_file_type
+        if label_file_type != 'GIF':
+            label.LabelStockSize = self.factory_ns2.LabelStockSizeType()
+            label.LabelStockSize.Height = '6'
+            label.LabelStockSize.Width = '4'
+
+        shipment = self.factory_ns2.ShipmentType()
+        shipment.Description = shipment_info.get('description')
+
+        for package in self._prepare_packages(packages, packaging_type, ship_from, ship_to, cod_info,
+                                              request_type):
+            shipment.Package.append(package)
+
+        shipment.Shipper = self.factory_ns2.ShipperType()
+        shipment.Shipper.Address = self.factory_ns2.ShipAddressType()
+        shipment.Shipper.AttentionName = (shipper.name or '')[:35]
+        shipment.Shipper.Name = (shipper.parent_id.name or shipper.name or '')[:35]
+        shipment.Shipper.Address.AddressLine = [l for l in [shipper.street or '', shipper.street2 or ''] if l]
+        shipment.Shipper.Address.City = shipper.city or ''
+        shipment.Shipper.Address.PostalCode = shipper.zip or ''
+        shipment.Shipper.Address.CountryCode = shipper.country_id.code or ''
+        if shipper.country_id.code in ('US', 'CA', 'IE'):
+            shipment.Shipper.Address.StateProvinceCode = shipper.state_id.code or ''
+        shipment.Shipper.ShipperNumber = self.shipper_number or ''
+        shipment.Shipper.Phone = self.factory_ns2.ShipPhoneType()
+        shipment.Shipper.Phone.Number = self._clean_phone_number(shipper.phone)
+
+        shipment.ShipFrom = self.factory_ns2.ShipFromType()
+        shipment.ShipFrom.Address = self.factory_ns2.ShipAddressType()
+        shipment.ShipFrom.AttentionName = (ship_from.name or '')[:35]
+        shipment.ShipFrom.Name = (ship_from.parent_id.name or ship_from.name or '')[:35]
+        shipment.ShipFrom.Address.AddressLine = [l for l in [ship_from.street or '', ship_from.street2 or ''] if l]
+        shipment.ShipFrom.Address.City = ship_from.city or ''
+        shipment.ShipFrom.Address.PostalCode = ship_from.zip or ''
+        shipment.ShipFrom.Address.CountryCode = ship_from.country_id.code or ''
+        if ship_from.country_id.code in ('US', 'CA', 'IE'):
+            shipment.ShipFrom.Address.StateProvinceCode = ship_from.state_id.code or ''
+        shipment.ShipFrom.Phone = self.factory_ns2.ShipPhoneType()
+        shipment.ShipFrom.Phone.Number = self._clean_phone_number(ship_from.phone)
+
+        shipment.ShipTo = self.factory_ns2.ShipToType()
+        shipment.ShipTo.Address = self.factory_ns2.ShipToAddressType()
+        shipment.ShipTo.AttentionName = (ship_to.name or '')[:35]
+        shipment.ShipTo.Name = (ship_to.parent_id.name or ship_to.name or '')[:35]
+        shipment.ShipTo.Address.AddressLine = [l for l in [ship_to.street or '', ship_to.street2 or ''] if l]
+        shipment.ShipTo.Address.City = ship_to.city or ''
+        shipment.ShipTo.Address.PostalCode = ship_to.zip or ''
+        shipment.ShipTo.Address.CountryCode = ship_to.country_id.code or ''
+        if ship_to.country_id.code in ('US', 'CA', 'IE'):
+            shipment.ShipTo.Address.StateProvinceCode = ship_to.state_id.code or ''
+        shipment.ShipTo.Phone = self.factory_ns2.ShipPhoneType()
+        shipment.ShipTo.Phone.Number = self._clean_phone_number(shipment_info['phone'])
+        if not ship_to.commercial_partner_id.is_company:
+            shipment.ShipTo.Address.ResidentialAddressIndicator = None
+
+        shipment.Service = self.factory_ns2.ServiceType()
+        shipment.Service.Code = service_type or ''
+        shipment.Service.Description = 'Service Code'
+        if service_type == "96":
+            shipment.NumOfPiecesInShipment = int(shipment_info.get('total_qty'))
+        shipment.ShipmentRatingOptions = self.factory_ns2.RateInfoType()
+        shipment.ShipmentRatingOptions.NegotiatedRatesIndicator = 1
+
+        # Shipments from US to CA or PR require extra info
+        if ship_from.country_id.code == 'US' and ship_to.country_id.code in ['CA', 'PR']:
+            shipment.InvoiceLineTotal = self.factory_ns2.CurrencyMonetaryType()
+            shipment.InvoiceLineTotal.CurrencyCode = shipment_info.get('itl_currency_code')
+            shipment.InvoiceLineTotal.MonetaryValue = shipment_info.get('ilt_monetary_value')
+
+        # set the default method for payment using shipper account
+        payment_info = self.factory_ns2.PaymentInfoType()
+        shipcharge = self.factory_ns2.ShipmentChargeType()
+        shipcharge.Type = '01'
+
+        # Bill Receiver 'Bill My Account'
+        if ups_carrier_account:
+            shipcharge.BillReceiver = self.factory_ns2.BillReceiverType()
+            shipcharge.BillReceiver.Address = self.factory_ns2.BillReceiverAddressType()
+            shipcharge.BillReceiver.AccountNumber = ups_carrier_account
+            shipcharge.BillReceiver.Address.PostalCode = ship_to.zip
+        else:
+            shipcharge.BillShipper = self.factory_ns2.BillShipperType()
+            shipcharge.BillShipper.AccountNumber = self.shipper_number or ''
+
+        payment_info.ShipmentCharge = [shipcharge]
+
+        if duty_payment == 'SENDER':
+            duty_charge = self.factory_ns2.ShipmentChargeType()
+            duty_charge.Type = '02'
+            duty_charge.BillShipper = self.factory_ns2.BillShipperType()
+            duty_charge.BillShipper.AccountNumber = self.shipper_number or ''
+            payment_info.ShipmentCharge.append(duty_charge)
+
+        shipment.PaymentInformation = payment_info
+
+        if saturday_delivery:
+            shipment.ShipmentServiceOptions = self.factory_ns2.ShipmentServiceOptionsType()
+            shipment.ShipmentServiceOptions.SaturdayDeliveryIndicator = saturday_delivery
+        else:
+            shipment.ShipmentServiceOptions = ''
+
+        record(self.dbname, 'build', time.perf_counter() - start, operation='Ship', carrier_id=self.carrier_id,
+               service_type=service_type or '')
+        return functools.partial(self._guarded_call, client.ups_timing, 'Ship', service_type or '',
+                                 self._send_process_shipment, service, request, shipment, label, label_file_type)
+
+    def _send_process_shipment(self, service, request, shipment, label, label_file_type):
+        from zeep.exceptions import Fault
+        try:
+            # Creating a shipment is not idempotent, never send it twice
+            response = service.ProcessShipment(Request=request, Shipment=shipment, LabelSpecification=label)
+
+            # Check if shipment is not success then return reason for that
             if response.Response.ResponseStatus.Code != "1":
                 return self.get_error_message(response.Response.ResponseStatus.Code,
                                               response.Response.ResponseStatus.Description)
 
             result = {}
-            result['currency_code'] = response.RatedShipment[0].TotalCharges.CurrencyCode
+            # labels are converted later, all at once, see ups_label.convert_labels
+            result['label_images'] = [(package.TrackingNumber, package.ShippingLabel.GraphicImage)
+                                      for package in response.ShipmentResults.PackageResults]
+            result['label_file_type'] = label_file_type
+            result['tracking_ref'] = response.ShipmentResults.ShipmentIdentificationNumber
+            result['currency_code'] = response.ShipmentResults.ShipmentCharges.TotalCharges.CurrencyCode
 
             # Some users are qualified to receive negotiated rates
-            negotiated_rate = 'NegotiatedRateCharges' in response.RatedShipment[0] and response.RatedShipment[
-                0].NegotiatedRateCharges and response.RatedShipment[
-                                  0].NegotiatedRateCharges.TotalCharge.MonetaryValue or None
+            negotiated_rate = 'NegotiatedRateCharges' in response.ShipmentResults and \
+                response.ShipmentResults.NegotiatedRateCharges and \
+                response.ShipmentResults.NegotiatedRateCharges.TotalCharge.MonetaryValue or None
 
-            result['price'] = negotiated_rate or response.RatedShipment[0].TotalCharges.MonetaryValue
+            result['price'] = negotiated_rate or response.ShipmentResults.ShipmentCharges.TotalCharges.MonetaryValue
             return result
 
         except Fault as e:
@@ -401,4 +1002,75 @@ class UPSRequest():
             description = e.detail.xpath("//err:PrimaryErrorCode/err:Description", namespaces=self.ns)[0].text
             return self.get_error_message(code, description)
         except IOError as e:
-            return self.get_error_message('0', 'UPS Server Not Found:\n%s' % e)
\ No newline at end of file
+            return self._get_unreachable_message(e)
+
+    def send_shipping(self, shipment_info, packages, shipper, ship_from, ship_to, packaging_type, service_type,
+                      saturday_delivery, duty_payment, cod_info=None, label_file_type='GIF',
+                      ups_carrier_account=False):
+        """
+            Create the shipment and get its labels
+            :return: {'tracking_ref': ..., 'label_images': [(tracking_number, base64 label)],
+                      'label_file_type': ..., 'price': ..., 'currency_code': ...} or {'error_message': ...}
+        """
+        return self.prepare_shipping(shipment_info, packages, shipper, ship_from, ship_to, packaging_type,
+                                     service_type, saturday_delivery, duty_payment, cod_info=cod_info,
+                                     label_file_type=label_file_type, ups_carrier_account=ups_carrier_account)()
+
+    def prepare_cancel_shipment(self, tracking_number, throttle=None):
+        """ Build the ProcessVoid request of the shipment and return a callable
+            sending it, see _prepare_process_rate. The callable returns {} once
+            the shipment is voided, or {'error_message': ...}.
+
+            UPS errors asking to try again later (RETRYABLE_ERROR_CODES) are
+            retried with a backoff. ``throttle``, if given, is called before
+            each attempt.
+        """
+        client = self._set_client(self.void_wsdl, 'Void', 'VoidShipmentRequest')
+        service = self._set_service(client, 'Void')
+        request = self.factory_ns3.RequestType()
+        request.TransactionReference = self.factory_ns3.TransactionReferenceType()
+        request.TransactionReference.CustomerContext = "Cancel shipment"
+        void_shipment = {'ShipmentIdentificationNumber': tracking_number or ''}
+        return functools.partial(self._send_process_void, service, request, void_shipment, throttle,
+                                 client.ups_timing)
+
+    def _send_process_void(self, service, request, void_shipment, throttle=None, timing=None):
+        for attempt in range(self.max_retries + 1):
+            if throttle:
+                throttle()
+            if timing:
+                result = self._guarded_call(timing, 'Void', '', self._send_process_void_once, service, request,
+                                            void_shipment)
+            else:
+                result = self._send_process_void_once(service, request, void_shipment)
+            if result.get('error_code') not in RETRYABLE_ERROR_CODES or attempt >= self.max_retries:
+                return result
+            _logger.info("UPS could not void shipment %s (%s), retrying (%s/%s)",
+                         void_shipment['ShipmentIdentificationNumber'], result['error_code'],
+                         attempt + 1, self.max_retries)
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    def _send_process_void_once(self, service, request, void_shipment):
+        from zeep.exceptions import Fault
+        try:
+            # voiding twice only gets an error the second time
+            response = self._call_idempotent(service.ProcessVoid, Request=request, VoidShipment=void_shipment)
+
+            if response.Response.ResponseStatus.Code != "1":
+                return self.get_error_message(response.Response.ResponseStatus.Code,
+                                              response.Response.ResponseStatus.Description)
+            return {}
+
+        except Fault as e:
+            code = e.detail.xpath("//err:PrimaryErrorCode/err:Code", namespaces=self.ns)[0].text
+            description = e.detail.xpath("//err:PrimaryErrorCode/err:Description", namespaces=self.ns)[0].text
+            return self.get_error_message(code, description)
+        except IOError as e:
+            return self._get_unreachable_message(e)
+
+    def cancel_shipment(self, tracking_number):
+        """
+            Void the shipment
+            :return: {} or {'error_message': ...}
+        """
+        return self.prepare_cancel_shipment(tracking_number)()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import copy
+
+from .ups_wsdl import Plugin
+
+
+def package_key(leaves):
+    """ Key of the packages zeep serializes with the same elements: the same
+        leaf paths, and the same empty values.
+    """
+    return tuple((path, text == '') for path, text in leaves)
+
+
+def expand_packages(envelope, layout):
+    """ Replace the Package elements of the shipment of the envelope, one per
+        template, by the packages of the layout.
+
+        :param layout: list of (template index, leaves, count): each package is
+                       a copy of the template whose leaf elements, given as
+                       ((localname, ...), text), are set to the package values,
+                       repeated ``count`` times
+    """
+    shipment = next(element for element in envelope.iter() if isinstance(element.tag, str)
+                    and element.tag.endswith('}Shipment'))
+    templates = [child for child in shipment if isinstance(child.tag, str) and child.tag.endswith('}Package')]
+    if not templates:
+        return
+    namespace = templates[0].tag[1:].split('}')[0]
+    position = shipment.index(templates[0])
+    for template in templates:
+        shipment.remove(template)
+
+    used = set()
+    packages = []
+    for index, leaves, count in layout:
+        if index in used:
+            package = copy.deepcopy(templates[index])
+        else:
+            package = templates[index]
+            used.add(index)
+        for path, text in leaves:
+            package.find('/'.join('{%s}%s' % (namespace, name) for name in path)).text = text
+        packages.append(package)
+        packages.extend(copy.deepcopy(package) for __ in range(count - 1))
+    shipment[position:position] = packages
+
+
+class PackagesPlugin(Plugin):
+    """ Render the packages of a Rate or Ship request from the few serialized
+        by zeep, see UPSRequest._prepare_packages. Copying and filling their
+        elements with lxml is much cheaper than building, validating and
+        serializing a zeep object per package.
+    """
+
+    def __init__(self):
+        self.layout = None
+
+    def egress(self, envelope, http_headers, operation, binding_options):
+        if self.layout:
+            expand_packages(envelope, self.layout)
+        return envelope, http_headers
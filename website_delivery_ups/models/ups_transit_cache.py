@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import json
+
+from odoo import api, fields, models
+
+
+class UPSTransitCache(models.Model):
+    """ UPS transit times of a lane (origin and destination postal codes) for
+        a pickup date, shared by all the workers. Entries stay valid for the
+        whole pickup day.
+    """
+    _name = 'ups.transit.cache'
+    _description = 'UPS Transit Time Cache'
+    _log_access = False
+
+    lane = fields.Char(required=True, readonly=True)
+    pickup_date = fields.Date(required=True, readonly=True)
+    transit_times = fields.Text(readonly=True)
+
+    _sql_constraints = [
+        ('lane_date_uniq', 'unique(lane, pickup_date)', 'The transit times of a lane can only be cached once a day.'),
+    ]
+
+    @api.model
+    def _get_transit_times(self, lane, pickup_date):
+        self.env.cr.execute("""
+            SELECT transit_times
+              FROM ups_transit_cache
+             WHERE lane = %s
+               AND pickup_date = %s
+        """, (lane, pickup_date))
+        row = self.env.cr.fetchone()
+        return row and json.loads(row[0]) or None
+
+    @api.model
+    def _set_transit_times(self, lane, pickup_date, transit_times):
+        """ Cache the transit times of a lane. To be called in a short
+            transaction of its own, see UPSRateCache._set_quote.
+        """
+        # upsert, other workers may fetch the same lane concurrently
+        self.env.cr.execute("""
+            INSERT INTO ups_transit_cache (lane, pickup_date, transit_times)
+                 VALUES (%s, %s, %s)
+            ON CONFLICT (lane, pickup_date) DO UPDATE
+                    SET transit_times = EXCLUDED.transit_times
+        """, (lane, pickup_date, json.dumps(transit_times)), log_exceptions=False)
+
+    @api.model
+    def _gc_expired_transit_times(self):
+        """ Called by cron, drops the transit times of past pickup dates. """
+        self.env.cr.execute("DELETE FROM ups_transit_cache WHERE pickup_date < %s",
+                            (fields.Date.context_today(self),))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(endurl, pool_size=10, connect_timeout=5, read_timeout=30):
+    """ Return the zeep transport of the current process for the given UPS
+        endpoint. Its session keeps up to ``pool_size`` connections alive, so
+        consecutive calls reuse the same TLS connection instead of doing a new
+        handshake each time.
+    """
+    key = (endurl, pool_size, connect_timeout, read_timeout, os.getpid())
+    transport = _transports.get(key)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(key)
+            if transport is None:
+                from zeep.transports import Transport
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount(endurl, adapter)
+                transport = _transports[key] = Transport(
+                    session=session, timeout=connect_timeout + read_timeout,
+                    operation_timeout=(connect_timeout, read_timeout))
+    return transport
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import contextlib
+import copyreg
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+
+from lxml import etree
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Bump when the way documents are pickled changes
+CACHE_VERSION = 1
+# Bundled WSDL and XSD files of the UPS services
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'api')
+# Modules of the classes zeep generates for the schema types, rebuilt on load
+ZEEP_DYNAMIC_MODULES = ('zeep.xsd.dynamic_types', 'zeep.objects')
+
+_digest = None
+_digest_lock = threading.Lock()
+
+
+class Plugin():
+    """ Base of the zeep plugins of the module, with the interface of
+        zeep.Plugin, so that zeep is only imported once a UPS call is made.
+    """
+
+    def ingress(self, envelope, http_headers, operation):
+        return envelope, http_headers
+
+    def egress(self, envelope, http_headers, operation, binding_options):
+        return envelope, http_headers
+
+
+def _get_digest():
+    """ Return the version of the cached documents: a hash of the bundled
+        files and of the versions of the libraries that parse them.
+    """
+    global _digest
+    if _digest is None:
+        with _digest_lock:
+            if _digest is None:
+                import zeep
+                digest = hashlib.sha1(('%s-%s-%s-%s' % (
+                    CACHE_VERSION, sys.version, zeep.__version__, etree.LXML_VERSION)).encode())
+                for name in sorted(os.listdir(API_DIR)):
+                    with open(os.path.join(API_DIR, name), 'rb') as f:
+                        digest.update(name.encode())
+                        digest.update(f.read())
+                _digest = digest.hexdigest()
+    return _digest
+
+
+def _reduce_qname(qname):
+    return etree.QName, (qname.text,)
+
+
+class DocumentPickler(pickle.Pickler):
+    """ Pickle a parsed zeep WSDL document. The classes zeep generated for
+        its types are pickled by value, its settings and transport are left
+        out and given back by DocumentUnpickler.
+    """
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[etree.QName] = _reduce_qname
+
+    def __init__(self, file):
+        from zeep.settings import Settings
+        from zeep.transports import Transport
+        super(DocumentPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._external = {Settings: 'settings', Transport: 'transport'}
+
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and obj.__module__ in ZEEP_DYNAMIC_MODULES:
+            attributes = {key: value for key, value in vars(obj).items() if key not in ('__dict__', '__weakref__')}
+            return type, (obj.__name__, obj.__bases__, attributes)
+        return NotImplemented
+
+    def persistent_id(self, obj):
+        for cls, name in self._external.items():
+            if isinstance(obj, cls):
+                return name
+        return None
+
+
+class DocumentUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, settings, transport):
+        super(DocumentUnpickler, self).__init__(file)
+        self._external = {'settings': settings, 'transport': transport}
+
+    def persistent_load(self, pid):
+        return self._external[pid]
+
+
+def get_cache_path(wsdl_path):
+    name = os.path.splitext(os.path.basename(wsdl_path))[0]
+    return os.path.join(config['data_dir'], 'ups_wsdl', '%s-%s.pickle' % (name, _get_digest()))
+
+
+def _parse_document(wsdl_path):
+    from zeep import Client
+    return Client('file:///%s' % wsdl_path.lstrip('/')).wsdl
+
+
+def load_document(wsdl_path):
+    """ Return the parsed zeep document of a bundled WSDL file.
+
+        Parsing the WSDL and XSD files takes several times longer than loading
+        them back from a pickle, so each document is saved once in the data
+        directory, and loaded from there by the next workers. Documents are
+        parsed again when the bundled files or the libraries change.
+    """
+    from zeep.settings import Settings
+    from zeep.transports import Transport
+
+    path = get_cache_path(wsdl_path)
+    try:
+        with open(path, 'rb') as f:
+            return DocumentUnpickler(f, Settings(), Transport()).load()
+    except FileNotFoundError:
+        pass
+    except Exception:
+        _logger.warning("Could not load the cached UPS document %s, parsing it again", path, exc_info=True)
+
+    document = _parse_document(wsdl_path)
+    directory = os.path.dirname(path)
+    tmp = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            DocumentPickler(tmp).dump(document)
+        # other workers may write the same file, renaming is atomic
+        os.replace(tmp.name, path)
+        # drop the versions of the document made for other files or libraries
+        prefix = os.path.basename(path).rsplit('-', 1)[0] + '-'
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith('.pickle') and name != os.path.basename(path):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(os.path.join(directory, name))
+    except Exception:
+        _logger.warning("Could not cache the UPS document %s", path, exc_info=True)
+        if tmp is not None and os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+    return document
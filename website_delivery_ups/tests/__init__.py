@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from . import test_ups_rate_lookup
+from . import test_ups_serializer
+from . import test_ups_shipping
+from . import test_ups_transport
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.website_delivery_ups.models.ups_rate_lookup import RateTable, parse_rate_sheet
+
+ZONE_CHART = """Origin,Destination,Zone
+100-119,100-149,2
+100-119,900-961,8
+"""
+
+RATE_SHEET = """Weight,Zone 2,Zone 8
+1,$10.00,$20.00
+2,$12.00,$25.00
+5,$15.00,-
+"""
+
+
+class TestUPSRateLookup(TransactionCase):
+    """ Quotes looked up from imported UPS zone charts and rate sheets """
+
+    def test_quote(self):
+        table = RateTable(ZONE_CHART, RATE_SHEET, '03', 'USD')
+        self.assertEqual(table.zone('10001', '94103'), 8)
+        self.assertEqual(table.quote('10001', '10002', [(1.5, None, 2)]), 24.0)
+        self.assertEqual(table.quote('10001', '94103', [(0.4, None, 1)]), 20.0)
+        # zone 8 is not served above 2 lbs
+        self.assertIsNone(table.quote('10001', '94103', [(3.0, None, 1)]))
+        self.assertIsNone(table.quote('10001', '60601', [(1.0, None, 1)]))
+
+    def test_repeated_zone(self):
+        with self.assertRaisesRegex(ValueError, 'zone 2 is given twice'):
+            parse_rate_sheet("Weight,Zone 2,Zone 2,Zone 8\n1,10,11,20\n")
+
+    def test_missing_price(self):
+        with self.assertRaisesRegex(ValueError, 'line 3: missing prices'):
+            parse_rate_sheet("Weight,Zone 2,Zone 8\n1,10,20\n2,12\n")
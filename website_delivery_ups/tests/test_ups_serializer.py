@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from lxml import etree
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.website_delivery_ups.benchmark.scenarios import generate_scenarios
+from odoo.addons.website_delivery_ups.models.ups_request import UPSRequest
+
+
+class TestUPSSerializer(TransactionCase):
+    """ Requests rendered by PackagesPlugin must be identical to the ones zeep
+        serializes package by package.
+    """
+
+    def setUp(self):
+        super(TestUPSSerializer, self).setUp()
+        self.scenarios = []
+        for scenario in generate_scenarios(20, seed=7, international_ratio=0.5, max_lines=40, max_packages=10,
+                                           cod_ratio=0.5):
+            self.scenarios.append({key: value for key, value in scenario.items()
+                                   if key not in ('lines', 'international')})
+
+    def _envelope(self, send, operation, *names):
+        """ Serialize the request a prepared call would send, see
+            UPSRequest._guarded_call for its arguments.
+        """
+        service, args = send.args[4], send.args[5:]
+        envelope = service._client.create_message(service, operation, **dict(zip(names, args)))
+        return etree.tostring(envelope)
+
+    def _rate_envelope(self, fast_serialization, rate_values):
+        srm = UPSRequest(None, 'user', 'password', 'shipper', 'access', False, fast_serialization=fast_serialization)
+        send = srm._prepare_process_rate('Rate', rate_values)
+        return self._envelope(send, 'ProcessRate', 'Request', 'CustomerClassification', 'Shipment')
+
+    def _ship_envelope(self, fast_serialization, rate_values):
+        srm = UPSRequest(None, 'user', 'password', 'shipper', 'access', False, fast_serialization=fast_serialization)
+        send = srm.prepare_shipping(duty_payment='SENDER', **rate_values)
+        return self._envelope(send, 'ProcessShipment', 'Request', 'Shipment', 'LabelSpecification')
+
+    def test_rate_envelopes(self):
+        for rate_values in self.scenarios:
+            envelope = self._rate_envelope(True, rate_values)
+            self.assertEqual(envelope, self._rate_envelope(False, rate_values))
+            self.assertEqual(envelope.count(b'PackageWeight>'), 2 * sum(p.count for p in rate_values['packages']))
+
+    def test_ship_envelopes(self):
+        for rate_values in self.scenarios:
+            self.assertEqual(self._ship_envelope(True, rate_values), self._ship_envelope(False, rate_values))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.website_delivery_ups.benchmark.mock_server import MockUPSServer
+
+
+class TestUPSShipping(TransactionCase):
+    """ Bulk shipping of pickings, against a local stand-in of the UPS web
+        services.
+    """
+
+    def setUp(self):
+        super(TestUPSShipping, self).setUp()
+        belgium = self.env.ref('base.be')
+        address = {'street': 'Rue de la Loi 16', 'city': 'Brussels', 'zip': '1000', 'country_id': belgium.id,
+                   'phone': '+32 2 123 45 67'}
+        self.env.company.partner_id.write(address)
+        self.customer = self.env['res.partner'].create(dict(address, name='UPS Customer', street='Rue Neuve 1'))
+        self.carrier = self.env.ref('website_delivery_ups.delivery_carrier_ups_be')
+        self.carrier.write({'ups_username': 'user', 'ups_passwd': 'password', 'ups_shipper_number': 'shipper',
+                            'ups_access_number': 'access', 'prod_environment': False})
+        self.warehouse = self.env['stock.warehouse'].search([('company_id', '=', self.env.company.id)], limit=1)
+        self.warehouse.partner_id.write(address)
+
+    def _create_picking(self, tracking='none'):
+        product = self.env['product.product'].create({
+            'name': 'Shipped Product', 'type': 'product', 'weight': 1.0, 'tracking': tracking})
+        stock = self.warehouse.lot_stock_id
+        if tracking == 'none':
+            self.env['stock.quant']._update_available_quantity(product, stock, 10.0)
+        picking = self.env['stock.picking'].create({
+            'picking_type_id': self.warehouse.out_type_id.id,
+            'location_id': stock.id,
+            'location_dest_id': self.env.ref('stock.stock_location_customers').id,
+            'partner_id': self.customer.id,
+            'carrier_id': self.carrier.id,
+            'move_ids_without_package': [(0, 0, {
+                'name': product.name,
+                'product_id': product.id,
+                'product_uom': product.uom_id.id,
+                'product_uom_qty': 2.0,
+                'location_id': stock.id,
+                'location_dest_id': self.env.ref('stock.stock_location_customers').id,
+            })],
+        })
+        picking.action_confirm()
+        picking.action_assign()
+        return picking
+
+    def _send_shipping_bulk(self, pickings, server):
+        self.env['ir.config_parameter'].sudo().set_param('website_delivery_ups.endpoint', server.url)
+        errors, labels = pickings._ups_send_shipping_bulk()
+        for writer in labels.values():
+            self.addCleanup(writer.fileobj.close)
+        return errors, labels
+
+    def test_bulk_shipping(self):
+        picking = self._create_picking()
+        with MockUPSServer() as server:
+            errors, labels = self._send_shipping_bulk(picking, server)
+        self.assertFalse(errors)
+        self.assertEqual(picking.state, 'done')
+        self.assertTrue(picking.carrier_tracking_ref)
+        self.assertEqual(picking.move_line_ids.qty_done, 2.0)
+        self.assertEqual(list(labels), ['GIF'])
+        self.assertEqual(server.counts, {'Ship': 1})
+
+    def test_unvalidated_shipment_voided(self):
+        # a lot is needed, the immediate transfer cannot be validated
+        picking = self._create_picking(tracking='lot')
+        picking.move_lines._set_quantity_done(2.0)
+        with MockUPSServer() as server:
+            errors, labels = self._send_shipping_bulk(picking, server)
+        self.assertIn(picking, errors)
+        self.assertIn('voided', errors[picking])
+        self.assertNotEqual(picking.state, 'done')
+        self.assertFalse(labels)
+        self.assertEqual(server.counts, {'Ship': 1, 'Void': 1})
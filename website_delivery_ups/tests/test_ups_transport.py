@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.website_delivery_ups.benchmark.mock_server import MockUPSServer
+from odoo.addons.website_delivery_ups.benchmark.scenarios import generate_scenarios
+from odoo.addons.website_delivery_ups.models import delivery_ups, ups_request
+from odoo.addons.website_delivery_ups.models.ups_request import UPSRequest
+from odoo.addons.website_delivery_ups.models.ups_transport import get_transport
+
+
+class TestUPSTransport(TransactionCase):
+    """ Timeouts and retries of the UPS calls, against a local stand-in of the
+        UPS web services.
+    """
+
+    def setUp(self):
+        super(TestUPSTransport, self).setUp()
+        scenario = generate_scenarios(1, seed=1, international_ratio=0.0)[0]
+        self.rate_values = {key: value for key, value in scenario.items() if key not in ('lines', 'international')}
+        # no need to wait between the attempts
+        patcher = patch.object(ups_request, 'RETRY_BACKOFF', 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self, server, **kwargs):
+        return UPSRequest(None, 'user', 'password', 'shipper', 'access', False, endpoint=server.url, **kwargs)
+
+    def test_rate(self):
+        with MockUPSServer() as server:
+            srm = self._request(server)
+            for __ in range(3):
+                result = srm.get_shipping_price(**self.rate_values)
+                self.assertFalse(result.get('error_message'))
+                self.assertEqual(result['currency_code'], 'USD')
+        self.assertEqual(server.counts, {'Rate': 3})
+        # the calls share the keep-alive session of the endpoint
+        self.assertIs(get_transport(server.url), get_transport(server.url))
+
+    def test_read_timeout_retried(self):
+        with MockUPSServer(latency=1.0) as server:
+            srm = self._request(server, read_timeout=0.2, max_retries=2)
+            result = srm.get_shipping_price(**self.rate_values)
+        self.assertTrue(result.get('unavailable'))
+        self.assertEqual(server.counts, {'Rate': 3})
+
+    def test_dropped_connection_retried(self):
+        with MockUPSServer(drop_rate=1.0) as server:
+            srm = self._request(server, max_retries=1)
+            result = srm.get_shipping_price(**self.rate_values)
+        self.assertTrue(result.get('unavailable'))
+        self.assertEqual(server.counts, {'Rate': 2})
+
+    def test_shipment_never_retried(self):
+        with MockUPSServer(drop_rate=1.0) as server:
+            srm = self._request(server, max_retries=2)
+            result = srm.send_shipping(duty_payment='SENDER', **self.rate_values)
+        self.assertTrue(result.get('error_message'))
+        self.assertEqual(server.counts, {'Ship': 1})
+
+    def test_rate_timeout_covers_retries(self):
+        carrier = self.env['delivery.carrier'].new({
+            'delivery_type': 'ups',
+            'ups_connect_timeout': 1.0,
+            'ups_read_timeout': 2.0,
+            'ups_max_retries': 2,
+        })
+        # three attempts, and the backoff between them
+        self.assertEqual(carrier._get_rate_timeout(), 3.0 * 3 + delivery_ups.RETRY_BACKOFF * 3)